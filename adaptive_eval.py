@@ -0,0 +1,123 @@
+# Sequential evaluation: keep playing episodes until the mean is known well enough.
+#
+# A fixed episode count is too many for a policy that is clearly worse than the best
+# one so far and too few when two policies are close. evaluate_adaptive() runs
+# episodes one at a time and stops when
+#   - the confidence interval half width on the mean drops below the target ("converged"),
+#   - the whole interval lies below the current best mean ("worse"), or
+#   - max_episodes is reached ("budget").
+import inspect
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from metrics import RunningMoments
+
+
+def t_quantile(p, df):
+    # Student t quantile: closed form for df 1 and 2, otherwise the Cornish-Fisher
+    # expansion around the normal quantile (within ~1% for df >= 3).
+    if df <= 0:
+        return math.inf
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3
+
+
+class RunningMean(RunningMoments):
+    def half_width(self, confidence=0.95):
+        if self.n < 2:
+            return math.inf
+        return t_quantile(0.5 + confidence / 2, self.n - 1) * math.sqrt(self.var / self.n)
+
+
+def evaluate_adaptive(run_episode, target_half_width=5.0, rel_half_width=0.0, confidence=0.95,
+                      min_episodes=3, max_episodes=50, best_mean=None, metric="reward"):
+    """
+    Run ``run_episode()`` (returning a dict of per-episode metrics) until the
+    stopping rule above fires. ``metric`` selects the key the interval is built on.
+
+    Returns the summary dict with mean, half_width, n_episodes, stop_reason and the
+    per-episode rows.
+    """
+    stats = RunningMean()
+    rows = []
+    stop_reason = "budget"
+    while stats.n < max_episodes:
+        row = run_episode()
+        rows.append(row)
+        stats.add(float(row[metric]))
+        if stats.n < min_episodes:
+            continue
+        half_width = stats.half_width(confidence)
+        if half_width <= max(target_half_width, rel_half_width * abs(stats.mean)):
+            stop_reason = "converged"
+            break
+        if best_mean is not None and stats.mean + half_width < best_mean:
+            stop_reason = "worse"
+            break
+
+    values = np.array([r[metric] for r in rows], dtype=np.float64)
+    return {
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "half_width": float(stats.half_width(confidence)),
+        "n_episodes": stats.n,
+        "stop_reason": stop_reason,
+        "rows": rows,
+    }
+
+
+def uses_action_masks(model):
+    # sb3_contrib's MaskablePPO takes the env's action masks in predict(); NumpyPolicy and
+    # PolicyClient accept them too, but only want them when loaded with masked=True
+    masked = getattr(model, "masked", None)
+    if masked is not None:
+        return masked
+    return "action_masks" in inspect.signature(model.predict).parameters
+
+
+def gym_episode_runner(model, env, deterministic=True):
+    # run_episode callable for a plain (non-vectorized) gymnasium env
+    masked = uses_action_masks(model)
+
+    def run_episode():
+        obs, _ = env.reset()
+        done, ep_reward, steps, info = False, 0.0, 0, {}
+        while not done:
+            kwargs = {"action_masks": env.get_wrapper_attr("action_masks")()} if masked else {}
+            action, _ = model.predict(obs, deterministic=deterministic, **kwargs)
+            obs, reward, terminated, truncated, info = env.step(int(action))
+            ep_reward += float(reward)
+            steps += 1
+            done = terminated or truncated
+        return {"reward": ep_reward, "steps": steps, "score": int(info.get("score", 0))}
+    return run_episode
+
+
+def vec_episode_runner(model, venv, deterministic=True):
+    # run_episode callable for a single-env VecEnv (what EvalCallback holds); like
+    # evaluate_policy it resets once, then relies on the VecEnv's auto-reset after each done
+    masked = uses_action_masks(model)
+    state = {}
+
+    def run_episode():
+        obs = state["obs"] if "obs" in state else venv.reset()
+        done, ep_reward, steps = False, 0.0, 0
+        while not done:
+            kwargs = {"action_masks": np.stack(venv.env_method("action_masks"))} if masked else {}
+            action, _ = model.predict(obs, deterministic=deterministic, **kwargs)
+            obs, rewards, dones, infos = venv.step(action)
+            ep_reward += float(rewards[0])
+            steps += 1
+            done = dones[0]
+        state["obs"] = obs
+        return {"reward": ep_reward, "steps": steps, "score": int(infos[0].get("score", 0))}
+    return run_episode
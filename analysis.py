@@ -0,0 +1,128 @@
+# Vectorized analysis of columnar episode logs (see episode_log.py), for the notebook.
+#
+# Everything works on whole NumPy columns (cumsum-based rolling windows, reduceat
+# binning), so runs with hundreds of thousands of episodes load and summarize in
+# milliseconds:
+#
+#   from analysis import load_runs, rolling_mean, reward_breakdown, compare_runs
+#   runs = load_runs("logs/episodes")
+#   curves = compare_runs(runs, metric="score", window=200)
+#   shares = reward_breakdown(runs[0])
+import glob
+import os
+
+import numpy as np
+
+from episode_log import EpisodeLog
+
+# reward components written by SnakeEnv into info["reward_breakdown"]
+REWARD_COMPONENTS = ["survival", "death_penalty", "food_eaten", "move_closer", "move_away",
+                     "turn_to_food", "straight_penalty", "path_distance"]
+
+
+def load_run(path):
+    return path if isinstance(path, EpisodeLog) else EpisodeLog(path)
+
+
+def load_runs(root="logs/episodes", pattern="*"):
+    # every episode log directly under root, oldest first
+    paths = [p for p in glob.glob(os.path.join(root, pattern)) if os.path.exists(os.path.join(p, "schema.json"))]
+    return [EpisodeLog(p) for p in sorted(paths, key=os.path.getmtime)]
+
+
+def rolling_mean(x, window):
+    # trailing mean over `window` episodes; the first window-1 values average what exists so far
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return x
+    c = np.cumsum(x)
+    out = np.empty_like(c)
+    w = min(window, len(x))
+    out[:w] = c[:w] / np.arange(1, w + 1)
+    out[w:] = (c[w:] - c[:-w]) / w
+    return out
+
+
+def rolling_std(x, window):
+    x = np.asarray(x, dtype=np.float64)
+    mean = rolling_mean(x, window)
+    mean_sq = rolling_mean(x * x, window)
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+
+
+def binned(x, n_bins):
+    # mean of x over n_bins contiguous, (nearly) equal-sized stretches of episodes
+    x = np.asarray(x, dtype=np.float64)
+    n_bins = max(1, min(n_bins, len(x)))
+    starts = np.linspace(0, len(x), n_bins + 1).astype(np.int64)[:-1]
+    counts = np.diff(np.append(starts, len(x)))
+    return np.add.reduceat(x, starts) / counts, starts
+
+
+def episode_reward(log):
+    # total reward per episode; logs from training store components, eval logs store "reward"
+    if "reward" in log:
+        return np.asarray(log["reward"], dtype=np.float64)
+    if "total" in log:
+        return np.asarray(log["total"], dtype=np.float64)
+    parts = [np.nan_to_num(np.asarray(log[c], dtype=np.float64)) for c in REWARD_COMPONENTS if c in log]
+    return np.sum(parts, axis=0) if parts else np.zeros(len(log))
+
+
+def reward_breakdown(log, components=None, n_bins=None):
+    # Per-component mean reward per episode and its share of the summed absolute reward.
+    # With n_bins, also the per-component means over n_bins stages of the run.
+    log = load_run(log)
+    components = [c for c in (components or REWARD_COMPONENTS) if c in log]
+    values = np.stack([np.nan_to_num(np.asarray(log[c], dtype=np.float64)) for c in components]) \
+        if components else np.zeros((0, len(log)))
+    means = values.mean(axis=1) if len(log) else np.zeros(len(components))
+    abs_total = np.abs(values).sum()
+    shares = np.abs(values).sum(axis=1) / abs_total if abs_total else np.zeros(len(components))
+    out = {c: {"mean": float(m), "share": float(s)} for c, m, s in zip(components, means, shares)}
+    if n_bins:
+        for c, row in zip(components, values):
+            out[c]["stages"] = binned(row, n_bins)[0]
+    return out
+
+
+def summarize(log, metric="score", window=100):
+    log = load_run(log)
+    x = episode_reward(log) if metric == "reward" else np.asarray(log[metric], dtype=np.float64)
+    if len(x) == 0:
+        return {"name": log.name, "episodes": 0}
+    roll = rolling_mean(x, window)
+    return {
+        "name": log.name,
+        "episodes": len(x),
+        "mean": float(x.mean()),
+        "last_window_mean": float(roll[-1]),
+        "best_window_mean": float(roll[min(window, len(x)) - 1:].max()),
+        "p50": float(np.percentile(x, 50)),
+        "p90": float(np.percentile(x, 90)),
+    }
+
+
+def compare_runs(runs, metric="score", window=100, n_bins=200):
+    # -> {run name: {"x": episode index, "y": rolling mean (downsampled to n_bins points), "summary": ...}}
+    out = {}
+    for run in runs:
+        log = load_run(run)
+        x = episode_reward(log) if metric == "reward" else np.asarray(log[metric], dtype=np.float64)
+        roll = rolling_mean(x, window)
+        y, starts = binned(roll, n_bins) if len(roll) else (roll, np.zeros(0, np.int64))
+        out[log.name] = {"x": starts, "y": y, "summary": summarize(log, metric, window)}
+    return out
+
+
+def plot_runs(runs, metric="score", window=100, n_bins=200, ax=None):
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        _, ax = plt.subplots(figsize=(10, 4))
+    for name, curve in compare_runs(runs, metric, window, n_bins).items():
+        ax.plot(curve["x"], curve["y"], label=name)
+    ax.set_xlabel("episode")
+    ax.set_ylabel(f"{metric} (rolling mean, {window} episodes)")
+    ax.legend()
+    return ax
@@ -0,0 +1,385 @@
+# Benchmarks for the env and the CLI.
+#
+#   python snake.py bench env --steps 100000        # SnakeEnv steps/sec with random actions
+#   python snake.py bench board --sizes 10,25,50,100 # steps/sec as the board grows
+#   python snake.py bench policy --curve_timesteps 200000   # mlp vs cnn: params, FLOPs, speed, learning
+#   python snake.py bench buffer --n_envs 16 --budget_mb 512  # rollout buffer memory per frame storage
+#   python snake.py bench history --ks 4,16         # FrameHistory vs VecFrameStack: checks, step cost
+#   python snake.py bench startup --budget 1.0      # cold-start time of CLI commands
+#
+# `startup` exits non-zero when a command is slower than the budget, so it can guard
+# against heavy imports (SB3, torch, pygame) creeping back into the module level.
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# commands whose cold start must stay under the budget
+STARTUP_COMMANDS = [
+    ["--help"],
+    ["train", "--help"],
+    ["eval", "--help"],
+    ["visualize", "--help"],
+    ["bench", "env", "--steps", "1000"],
+]
+
+
+def bench_env(steps=100_000, reward_mode="length", seed=7):
+    from snake_env import SnakeEnv
+
+    env = SnakeEnv(reward_mode=reward_mode, seed=seed, curriculum=False)
+    rng = random.Random(seed)
+    env.reset(seed=seed)
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        # mostly keep going straight so episodes are not all 3-step suicides
+        action = rng.randrange(4) if rng.random() < 0.2 else env.direction
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+            episodes += 1
+    elapsed = time.perf_counter() - start
+    env.close()
+    return {"steps": steps, "episodes": episodes, "seconds": elapsed, "steps_per_sec": steps / elapsed}
+
+
+def bench_board(sizes=(10, 25, 50, 100), steps=50_000, seed=7):
+    # Same step budget on square boards of growing size. The policy heads for the food
+    # and only turns off course to avoid walls or its own body, so snakes get long and
+    # live long on every board; per-step cost should stay flat (nothing scans the board).
+    from snake_env import SnakeEnv
+
+    results = []
+    for size in sizes:
+        env = SnakeEnv(seed=seed, curriculum=False, grid_size=(size, size), max_steps=size * size * 4)
+        rng = random.Random(seed)
+        env.reset(seed=seed)
+        episodes, lengths = 0, []
+        start = time.perf_counter()
+        for _ in range(steps):
+            action = env._get_direction_to_food()
+            if env._will_collide(action):
+                safe = [a for a in range(4) if not env._will_collide(a)]
+                action = rng.choice(safe) if safe else action
+            _, _, terminated, truncated, info = env.step(action)
+            if terminated or truncated:
+                lengths.append(info["snake_length"])
+                env.reset()
+                episodes += 1
+        elapsed = time.perf_counter() - start
+        lengths.append(len(env.snake_body))
+        env.close()
+        results.append({"size": size, "steps": steps, "episodes": episodes, "seconds": elapsed,
+                        "steps_per_sec": steps / elapsed, "mean_length": statistics.mean(lengths)})
+    return results
+
+
+def bench_policies(policies=("mlp", "cnn"), rollout_steps=2048, rollouts=3, curve_timesteps=0,
+                   curve_points=10, seed=7):
+    # Per --policy choice of train_ppo.py: parameters, forward FLOPs per observation, time
+    # per PPO rollout (rollout_steps env steps incl. inference) and per update, and
+    # single-observation predict latency. With curve_timesteps, also a sample-efficiency
+    # curve: mean training score over curve_points equal stretches of env steps.
+    import numpy as np
+    import torch
+    from callbacks import EpisodeLogCallback
+    from episode_log import EpisodeLog
+    from policies import forward_flops
+    from train_ppo import make_env, make_model
+
+    results = []
+    for name in policies:
+        model = make_model(make_env(seed=seed), seed=seed, verbose=0, policy=name, n_steps=rollout_steps)
+        obs_shape = model.observation_space.shape
+        r = {"policy": name,
+             "params": sum(p.numel() for p in model.policy.parameters()),
+             "flops": forward_flops(model.policy, obs_shape)}
+
+        # split learn() into rollout and update time by timing train()
+        updates, train = [], model.train
+
+        def timed_train():
+            start = time.perf_counter()
+            train()
+            updates.append(time.perf_counter() - start)
+
+        model.train = timed_train
+        start = time.perf_counter()
+        model.learn(rollout_steps * rollouts)
+        total = time.perf_counter() - start
+        r["rollout_s"] = (total - sum(updates)) / rollouts
+        r["update_s"] = statistics.mean(updates)
+
+        obs = model.observation_space.sample()
+        latencies = []
+        with torch.no_grad():
+            for _ in range(20):
+                model.policy.predict(obs, deterministic=True)
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(200):
+                    model.policy.predict(obs, deterministic=True)
+                latencies.append((time.perf_counter() - start) / 200 * 1e6)
+        r["predict_us"] = statistics.median(latencies)
+        model.env.close()
+
+        if curve_timesteps:
+            model = make_model(make_env(seed=seed), seed=seed, verbose=0, policy=name)
+            with tempfile.TemporaryDirectory() as tmp:
+                model.learn(curve_timesteps, callback=EpisodeLogCallback(os.path.join(tmp, "log")))
+                log = EpisodeLog(os.path.join(tmp, "log"))
+                score, timestep = np.asarray(log["score"]), np.asarray(log["timestep"])
+            # bins of env steps, not of episodes: longer episodes later in training
+            edges = np.linspace(0, curve_timesteps, curve_points + 1)[1:]
+            which = np.minimum(np.searchsorted(edges, timestep), curve_points - 1)
+            sums = np.bincount(which, weights=score, minlength=curve_points)
+            counts = np.bincount(which, minlength=curve_points)
+            r["curve"] = {"timesteps": edges.astype(int).tolist(),
+                          "score": [float(s / c) if c else None for s, c in zip(sums, counts)]}
+            model.env.close()
+        results.append(r)
+    return results
+
+
+def bench_buffers(n_envs=16, n_steps=2048, batch_size=64, budget_mb=512, seed=7):
+    # Rollout buffer of n_steps x n_envs real SnakeEnv frames per frame storage: bytes held,
+    # time to fill it and to sample one epoch of minibatches, and how many envs fit in
+    # budget_mb. "float32" is what older SB3 releases did, "native" what the installed one does.
+    import numpy as np
+    import torch
+    from gymnasium import spaces
+    from stable_baselines3.common.buffers import RolloutBuffer
+    from buffers import OBS_BUFFERS
+    from snake_env import SnakeEnv
+
+    class Float32RolloutBuffer(RolloutBuffer):
+        def reset(self):
+            super().reset()
+            self.observations = self.observations.astype(np.float32)
+
+    envs = [SnakeEnv(seed=seed + i, curriculum=False) for i in range(n_envs)]
+    rng = random.Random(seed)
+    frames = []
+    for env in envs:
+        env.reset(seed=seed)
+    for _ in range(min(n_steps, 256)):
+        obs = []
+        for env in envs:
+            o, _, terminated, truncated, _ = env.step(rng.randrange(4) if rng.random() < 0.2 else env.direction)
+            if terminated or truncated:
+                o, _ = env.reset()
+            obs.append(o.transpose(2, 0, 1))  # what VecTransposeImage hands the buffer
+        frames.append(np.stack(obs))
+    h, w, c = envs[0].observation_space.shape
+    obs_space = spaces.Box(0, 255, (c, h, w), np.uint8)
+
+    results = []
+    zeros = np.zeros(n_envs, dtype=np.float32)
+    value, log_prob = torch.zeros(n_envs), torch.zeros(n_envs)
+    for name, cls in [("float32", Float32RolloutBuffer), ("native", RolloutBuffer), *OBS_BUFFERS.items()]:
+        buf = cls(n_steps, obs_space, spaces.Discrete(4), device="cpu", n_envs=n_envs)
+        start = time.perf_counter()
+        for t in range(n_steps):
+            buf.add(frames[t % len(frames)], np.zeros(n_envs, dtype=np.int64), zeros, zeros, value, log_prob)
+        fill = time.perf_counter() - start
+        nbytes = sum(v.nbytes for v in vars(buf).values() if isinstance(v, np.ndarray))
+        start = time.perf_counter()
+        for batch in buf.get(batch_size):
+            batch.observations.float()
+        sample = time.perf_counter() - start
+        per_env = nbytes / n_envs
+        results.append({"buffer": name, "bytes": nbytes, "obs_bytes": buf.observations.nbytes,
+                        "fill_s": fill, "epoch_s": sample, "max_envs": int(budget_mb * 2**20 // per_env)})
+    return results
+
+
+def check_history(k=4, n_envs=4, steps=2_000, grid_size=(30, 20), seed=7):
+    # FrameHistory against VecFrameStack, step by step: observations and the terminal
+    # observations of finished episodes (stall_steps cuts plenty of them). Raises on the
+    # first difference, returns the number of finished episodes compared.
+    import numpy as np
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack
+    from frame_history import FrameHistory
+    from snake_env import SnakeEnv
+
+    def env_fns(wrap):
+        return [lambda i=i: wrap(SnakeEnv(seed=seed + i, curriculum=False, stall_steps=30, grid_size=grid_size))
+                for i in range(n_envs)]
+
+    ours = DummyVecEnv(env_fns(lambda env: FrameHistory(env, k)))
+    ref = VecFrameStack(DummyVecEnv(env_fns(lambda env: env)), k, channels_order="last")
+    rng = np.random.default_rng(seed)
+    if not np.array_equal(ours.reset(), ref.reset()):
+        raise AssertionError("FrameHistory: reset observation differs from VecFrameStack")
+    episodes = 0
+    for t in range(steps // n_envs):
+        actions = rng.integers(0, 4, n_envs)
+        obs, _, dones, infos = ours.step(actions)
+        ref_obs, _, ref_dones, ref_infos = ref.step(actions)
+        if not (np.array_equal(obs, ref_obs) and np.array_equal(dones, ref_dones)):
+            raise AssertionError(f"FrameHistory: step {t} differs from VecFrameStack")
+        for i in np.flatnonzero(dones):
+            if not np.array_equal(infos[i]["terminal_observation"], ref_infos[i]["terminal_observation"]):
+                raise AssertionError(f"FrameHistory: terminal observation of env {i} at step {t} differs")
+            episodes += 1
+    ours.close()
+    ref.close()
+    return episodes
+
+
+def check_history_training(k=4, grid_size=(10, 10), steps=256, policy="cnn", seed=7):
+    # A short PPO run on a stack SB3 does not transpose (10x10 with K = 4 is (10, 10, 12)):
+    # the packed buffer must give back exactly the frames it was handed.
+    import numpy as np
+    from train_ppo import make_env, make_model
+
+    model = make_model(make_env(seed=seed, grid_size=grid_size, frame_stack=k), seed=seed, verbose=0,
+                       policy=policy, obs_buffer="packed", n_steps=steps, batch_size=64)
+    model.learn(total_timesteps=steps)
+    buf = model.rollout_buffer
+    frames = buf.unpack(buf.observations)
+    if not np.array_equal(buf.pack(frames), buf.observations) or frames.shape[-3:] != model.observation_space.shape:
+        raise AssertionError(f"PackedRolloutBuffer: {model.observation_space} frames do not round-trip")
+    model.env.close()
+    return model.observation_space.shape
+
+
+def bench_history(ks=(4, 16), n_envs=8, steps=20_000, repeats=3, seed=7):
+    # Per-step cost of K frames of history for n_envs envs in a DummyVecEnv: no history,
+    # the FrameHistory ring buffer, and SB3's VecFrameStack (which rolls the whole stack).
+    # Best of `repeats` runs, each on fresh envs.
+    import numpy as np
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack
+    from frame_history import FrameHistory
+    from snake_env import SnakeEnv
+
+    def run(make_vec):
+        best = float("inf")
+        for _ in range(repeats):
+            vec = make_vec()
+            rng = np.random.default_rng(seed)
+            vec.reset()
+            start = time.perf_counter()
+            for _ in range(steps // n_envs):
+                vec.step(rng.integers(0, 4, n_envs))
+            best = min(best, time.perf_counter() - start)
+            vec.close()
+        return best / (steps // n_envs * n_envs) * 1e6
+
+    def env_fns(k=1):
+        def make(i):
+            env = SnakeEnv(seed=seed + i, curriculum=False)
+            return (lambda: FrameHistory(env, k)) if k > 1 else (lambda: env)
+        return [make(i) for i in range(n_envs)]
+
+    results = [{"k": 1, "method": "none", "us_per_step": run(lambda: DummyVecEnv(env_fns()))}]
+    for k in ks:
+        results.append({"k": k, "method": "FrameHistory", "us_per_step": run(lambda: DummyVecEnv(env_fns(k)))})
+        results.append({"k": k, "method": "VecFrameStack", "us_per_step": run(
+            lambda: VecFrameStack(DummyVecEnv(env_fns()), k, channels_order="last"))})
+    return results
+
+
+def bench_startup(commands=STARTUP_COMMANDS, repeats=3):
+    results = []
+    for command in commands:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(HERE, "snake.py"), *command],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        results.append({"command": " ".join(["snake", *command]), "seconds": statistics.median(times)})
+    return results
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="snake bench")
+    sub = p.add_subparsers(dest="which", required=True)
+    env_p = sub.add_parser("env", help="SnakeEnv step throughput")
+    env_p.add_argument("--steps", type=int, default=100_000)
+    env_p.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
+    board_p = sub.add_parser("board", help="SnakeEnv step throughput across board sizes")
+    board_p.add_argument("--sizes", type=str, default="10,25,50,100", help="square board sides in cells")
+    board_p.add_argument("--steps", type=int, default=50_000, help="steps per board size")
+    policy_p = sub.add_parser("policy", help="feature extractors: params, FLOPs, rollout/update time, learning curve")
+    policy_p.add_argument("--policies", type=str, default="mlp,cnn", help="--policy choices of train_ppo.py")
+    policy_p.add_argument("--rollouts", type=int, default=3, help="timed PPO rollouts (2048 steps each)")
+    policy_p.add_argument("--curve_timesteps", type=int, default=0,
+                          help="train each policy this long for a sample-efficiency curve (0: skip)")
+    policy_p.add_argument("--curve_points", type=int, default=10)
+    policy_p.add_argument("--json_out", type=str, default=None)
+    buffer_p = sub.add_parser("buffer", help="rollout buffer memory and sampling time per frame storage")
+    buffer_p.add_argument("--n_envs", type=int, default=16)
+    buffer_p.add_argument("--n_steps", type=int, default=2048)
+    buffer_p.add_argument("--budget_mb", type=float, default=512, help="memory budget for the max envs column")
+    history_p = sub.add_parser("history", help="frame stacking: FrameHistory ring buffer vs VecFrameStack")
+    history_p.add_argument("--ks", type=str, default="4,16", help="comma separated history lengths")
+    history_p.add_argument("--n_envs", type=int, default=8)
+    history_p.add_argument("--steps", type=int, default=20_000, help="env steps per method")
+    history_p.add_argument("--repeats", type=int, default=3)
+    startup_p = sub.add_parser("startup", help="cold-start time of CLI commands")
+    startup_p.add_argument("--repeats", type=int, default=3)
+    startup_p.add_argument("--budget", type=float, default=1.0, help="seconds allowed per command")
+    args = p.parse_args(argv)
+
+    if args.which == "env":
+        r = bench_env(args.steps, args.reward_mode)
+        print(f"{r['steps']} steps ({r['episodes']} episodes) in {r['seconds']:.2f}s: "
+              f"{r['steps_per_sec']:.0f} steps/s")
+    elif args.which == "board":
+        print(f"{'board':>9} {'steps/s':>9} {'episodes':>9} {'mean length':>12}")
+        for r in bench_board([int(s) for s in args.sizes.split(",")], args.steps):
+            print(f"{r['size']:>4}x{r['size']:<4} {r['steps_per_sec']:>9.0f} {r['episodes']:>9} "
+                  f"{r['mean_length']:>12.1f}")
+    elif args.which == "policy":
+        results = bench_policies(args.policies.split(","), rollouts=args.rollouts,
+                                 curve_timesteps=args.curve_timesteps, curve_points=args.curve_points)
+        print(f"{'policy':<7} {'params':>9} {'kFLOPs/obs':>11} {'rollout s':>10} {'update s':>9} {'predict us':>11}")
+        for r in results:
+            print(f"{r['policy']:<7} {r['params']:>9} {r['flops'] / 1e3:>11.0f} {r['rollout_s']:>10.2f} "
+                  f"{r['update_s']:>9.2f} {r['predict_us']:>11.0f}")
+        for r in results:
+            if "curve" in r:
+                points = "  ".join(f"{t // 1000}k:{'-' if s is None else f'{s:.2f}'}"
+                                   for t, s in zip(r["curve"]["timesteps"], r["curve"]["score"]))
+                print(f"{r['policy']:<7} mean training score  {points}")
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump(results, f, indent=2)
+    elif args.which == "buffer":
+        print(f"{args.n_steps} steps x {args.n_envs} envs")
+        print(f"{'buffer':<8} {'total MB':>9} {'obs MB':>8} {'fill s':>7} {'epoch s':>8} "
+              f"{'max envs in ' + str(int(args.budget_mb)) + ' MB':>18}")
+        for r in bench_buffers(args.n_envs, args.n_steps, budget_mb=args.budget_mb):
+            print(f"{r['buffer']:<8} {r['bytes'] / 2**20:>9.1f} {r['obs_bytes'] / 2**20:>8.1f} {r['fill_s']:>7.2f} "
+                  f"{r['epoch_s']:>8.2f} {r['max_envs']:>18}")
+    elif args.which == "history":
+        episodes = check_history() + check_history(grid_size=(10, 10))
+        print(f"FrameHistory matches VecFrameStack ({episodes} terminal observations compared)")
+        shape = check_history_training()
+        print(f"PPO on a 10x10 board with 4 frames: observation {shape}, packed frames round-trip")
+        print(f"{args.n_envs} envs in a DummyVecEnv")
+        print(f"{'K':>3} {'method':<14} {'us/step':>8}")
+        for r in bench_history([int(k) for k in args.ks.split(",")], args.n_envs, args.steps, args.repeats):
+            print(f"{r['k']:>3} {r['method']:<14} {r['us_per_step']:>8.1f}")
+    elif args.which == "startup":
+        slow = 0
+        for r in bench_startup(repeats=args.repeats):
+            over = r["seconds"] > args.budget
+            slow += over
+            print(f"{r['command']:<40} {r['seconds'] * 1000:7.0f} ms" + ("  OVER BUDGET" if over else ""))
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Board-size curriculum for PPO with a size-independent policy (policies.GlobalPoolCNN).
+#
+# Training starts on a small board and moves to the next, bigger one once the mean score
+# of the last --window training episodes reaches the stage threshold. SB3 ties a model
+# to one observation space, so every stage builds a fresh env and PPO object and copies
+# the policy and optimizer state over; the weights themselves never change shape.
+#
+#   python board_curriculum.py --stages 10x10:3,20x15:5,30x20 --timesteps 1000000
+#   python board_curriculum.py --stages 10x10:3,20x15:5,30x20:8 --compare
+#
+# Stages are WxH[:score]. Training stops when the last stage's score is reached (if it
+# has one) or the timestep budget runs out. --compare also trains on the last board
+# from scratch with the same budget and target, and prints steps and wall clock of both.
+import argparse
+import os
+import time
+
+from snake_env import parse_grid
+from model_registry import write_env_config
+from run_registry import record_run
+
+# SB3/torch are imported inside the functions that use them (see snake.py)
+
+
+def parse_stages(text):
+    # "10x10:3,20x15:5,30x20" -> [((10, 10), 3.0), ((20, 15), 5.0), ((30, 20), None)]
+    stages = []
+    for part in text.split(","):
+        grid, _, threshold = part.strip().partition(":")
+        stages.append((parse_grid(grid), float(threshold) if threshold else None))
+    for grid, threshold in stages[:-1]:
+        if threshold is None:
+            raise ValueError(f"stage {grid[0]}x{grid[1]} needs a score threshold (WxH:score)")
+    return stages
+
+
+def transfer(src, dst):
+    # same extractor/heads on a different board: every tensor keeps its shape
+    dst.policy.load_state_dict(src.policy.state_dict())
+    dst.policy.optimizer.load_state_dict(src.policy.optimizer.state_dict())
+    dst.num_timesteps = src.num_timesteps
+    dst._n_updates = src._n_updates
+
+
+def train_curriculum(stages, timesteps, reward_mode="length", seed=7, window=50, logdir=None, verbose=0):
+    # -> (model, per-stage history); an empty or one-stage list is plain training
+    from callbacks import ScoreThresholdCallback
+    from train_ppo import make_env, make_model
+
+    model, history = None, []
+    start = time.time()
+    for i, (grid, threshold) in enumerate(stages):
+        remaining = timesteps - (model.num_timesteps if model is not None else 0)
+        if remaining <= 0:
+            break
+        env = make_env(reward_mode=reward_mode, seed=seed + i, grid_size=grid)
+        stage_model = make_model(env, seed=seed, logdir=logdir, verbose=verbose, policy="pool")
+        if model is not None:
+            transfer(model, stage_model)
+            model.env.close()
+        model = stage_model
+        callback = ScoreThresholdCallback(threshold, window, verbose=verbose)
+        stage_start, steps_before = time.time(), model.num_timesteps
+        model.learn(total_timesteps=remaining, callback=callback, reset_num_timesteps=False,
+                    tb_log_name="board_curriculum")
+        scores = list(callback.scores)
+        score_mean = sum(scores) / len(scores) if scores else None
+        history.append({
+            "grid": f"{grid[0]}x{grid[1]}",
+            "threshold": threshold,
+            "reached": callback.reached,
+            "steps": model.num_timesteps - steps_before,
+            "seconds": time.time() - stage_start,
+            "total_steps": model.num_timesteps,
+            "total_seconds": time.time() - start,
+            "score_mean": score_mean,
+        })
+        print(f"Stage {history[-1]['grid']}: {history[-1]['steps']} steps in {history[-1]['seconds']:.0f}s, "
+              f"mean score {score_mean if scores else float('nan'):.2f}"
+              + (" (threshold reached)" if callback.reached else ""))
+        if threshold is not None and not callback.reached:
+            break  # budget ran out before this stage was passed
+    return model, history
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--stages", type=str, default="10x10:3,20x15:5,30x20",
+                   help="comma separated WxH[:score]; move on once the rolling mean score reaches it")
+    p.add_argument("--timesteps", type=int, default=1_000_000, help="budget over all stages")
+    p.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--window", type=int, default=50, help="training episodes in the rolling mean score")
+    p.add_argument("--compare", action="store_true",
+                   help="also train on the last board from scratch and compare steps / wall clock")
+    p.add_argument("--logdir", type=str, default="./logs")
+    p.add_argument("--modeldir", type=str, default="./models")
+    p.add_argument("--runs_db", type=str, default="./results/runs.sqlite")
+    args = p.parse_args(argv)
+    stages = parse_stages(args.stages)
+
+    os.makedirs(args.modeldir, exist_ok=True)
+    runs = [("curriculum", stages)]
+    if args.compare:
+        runs.append(("scratch", stages[-1:]))
+    for name, run_stages in runs:
+        model, history = train_curriculum(run_stages, args.timesteps, args.reward_mode, args.seed,
+                                          args.window, args.logdir, verbose=0)
+        # the board actually trained last: the budget can run out before the last stage
+        grid = parse_grid(history[-1]["grid"]) if history else run_stages[-1][0]
+        path = os.path.join(args.modeldir, f"ppo_snake_{args.reward_mode}_{name}_{grid[0]}x{grid[1]}")
+        model.save(path)
+        write_env_config(path, {"reward_mode": args.reward_mode, "seed": args.seed, "curriculum": True,
+                                "grid_size": list(grid)})
+        record_run(
+            "ppo", reward_mode=args.reward_mode, seed=args.seed, timesteps=model.num_timesteps,
+            wall_clock_s=history[-1]["total_seconds"] if history else None,
+            hyperparams={"policy": "GlobalPoolCNN", "stages": args.stages if name == "curriculum"
+                         else f"{grid[0]}x{grid[1]}", "window": args.window},
+            eval_summary={"board_curriculum": history}, model_path=path + ".zip", db_path=args.runs_db,
+        )
+        model.env.close()
+        last = history[-1] if history else {}
+        if len(history) < len(run_stages):
+            outcome = f"stopped at stage {last.get('grid', '-')}"
+        else:
+            outcome = "trained" if run_stages[-1][1] is None else \
+                "reached the target" if last.get("reached") else "did not reach the target"
+        print(f"{name}: {outcome} after {model.num_timesteps} steps, {last.get('total_seconds', 0):.0f}s. "
+              f"Saved {path}.zip")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Rollout buffers that keep observations small (rollout_buffer_class for PPO/A2C).
+#
+# Uint8RolloutBuffer stores observations in the observation space's dtype whatever the
+# installed SB3 does; older SB3 releases stored every frame as float32, 7.2 KB instead of
+# 1,800 bytes per 20x30x3 frame.
+#
+# PackedRolloutBuffer goes one step further for SnakeEnv grids, whose channels are all
+# 0 or 255: each cell is stored as one byte holding 3 bits (one per channel), so a frame
+# takes 600 bytes. Only the sampled minibatch is unpacked back to uint8; SB3 then casts
+# and scales it to float as usual. Packing is lossless and checked on every add().
+# Stacked frames (frame_history.FrameHistory, 3K channels) pack to K bytes per cell.
+#
+#   PPO("MlpPolicy", env, rollout_buffer_class=PackedRolloutBuffer)
+#   make_model(env, obs_buffer="packed")        # train_ppo.py / train_a2c.py
+#   MaskablePPO("MlpPolicy", env, rollout_buffer_class=maskable(PackedRolloutBuffer))
+import functools
+
+import numpy as np
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.preprocessing import is_image_space_channels_first
+
+
+class Uint8RolloutBuffer(RolloutBuffer):
+    def reset(self) -> None:
+        super().reset()
+        if self.observations.dtype != self.observation_space.dtype:
+            self.observations = np.zeros(self.observations.shape, dtype=self.observation_space.dtype)
+
+
+def stays_channels_last(observation_space):
+    # SB3 transposes a channels-last image space to (C, H, W) unless its first dimension is
+    # the smallest, which it takes for channels-first: a 10x10 board with 4 frames of
+    # history, (10, 10, 12), reaches the buffer and the policy as it is
+    return is_image_space_channels_first(observation_space)
+
+
+class PackedRolloutBuffer(Uint8RolloutBuffer):
+    def __init__(self, buffer_size, observation_space, *args, channels_last=None, **kwargs):
+        # channels_last: layout of the frames SB3 hands over, stays_channels_last() of the
+        # env's own (H, W, C) space (make_model passes it); None guesses like SB3 does
+        shape = observation_space.shape
+        if observation_space.dtype != np.uint8 or len(shape) != 3:
+            raise ValueError(f"PackedRolloutBuffer needs a uint8 RGB grid observation, got {observation_space}")
+        if channels_last is None:
+            channels_last = not is_image_space_channels_first(observation_space)
+        self._channel_axis = 2 if channels_last else 0
+        channels = shape[self._channel_axis]
+        if channels % 3:
+            raise ValueError(f"PackedRolloutBuffer needs 3K channels, got {observation_space} "
+                             f"({'channels-last' if channels_last else 'channels-first'})")
+        self._frames = channels // 3
+        grid = tuple(shape[:2]) if channels_last else tuple(shape[1:])
+        if self._frames == 1:
+            self._packed_shape = grid
+        else:
+            self._packed_shape = (*grid, self._frames) if channels_last else (self._frames, *grid)
+        # code -> value of channel c
+        self._luts = [np.where((np.arange(8) >> c) & 1, 255, 0).astype(np.uint8) for c in range(3)]
+        super().__init__(buffer_size, observation_space, *args, **kwargs)
+
+    def reset(self) -> None:
+        self.obs_shape = self._packed_shape
+        super().reset()
+
+    def pack(self, obs):
+        # (..., C, H, W) or (..., H, W, C) uint8 with 0/255 channels -> (..., H, W) codes 0..7;
+        # (..., 3K, H, W) -> (..., K, H, W) and (..., H, W, 3K) -> (..., H, W, K)
+        obs = np.asarray(obs)
+        if np.any((obs + np.uint8(1)) > 1):  # 255 wraps to 0, 0 -> 1, anything else > 1
+            raise ValueError("PackedRolloutBuffer: observation channels must be 0 or 255")
+        if self._channel_axis == 0:
+            if self._frames > 1:
+                obs = obs.reshape(*obs.shape[:-3], self._frames, 3, *obs.shape[-2:])
+            r, g, b = obs[..., 0, :, :], obs[..., 1, :, :], obs[..., 2, :, :]
+        else:
+            if self._frames > 1:
+                obs = obs.reshape(*obs.shape[:-1], self._frames, 3)
+            r, g, b = obs[..., 0], obs[..., 1], obs[..., 2]
+        return (r >> 7) | ((g >> 7) << 1) | ((b >> 7) << 2)
+
+    def unpack(self, codes):
+        axis = codes.ndim - 2 if self._channel_axis == 0 else codes.ndim
+        obs = np.stack([lut[codes] for lut in self._luts], axis=axis)
+        if self._frames > 1:
+            if self._channel_axis == 0:
+                obs = obs.reshape(*obs.shape[:-4], 3 * self._frames, *obs.shape[-2:])
+            else:
+                obs = obs.reshape(*obs.shape[:-2], 3 * self._frames)
+        return obs
+
+    def add(self, obs, *args, **kwargs) -> None:
+        super().add(self.pack(obs), *args, **kwargs)
+
+    def _get_samples(self, batch_inds, env=None):
+        # let the parent (or the maskable one) slice unpacked frames, so only they go through to_torch
+        codes = self.observations
+        self.observations = _Unpacked(codes, self.unpack)
+        try:
+            return super()._get_samples(batch_inds, env)
+        finally:
+            self.observations = codes
+
+
+class _Unpacked:
+    # stands in for the packed observation array while samples are built
+    def __init__(self, codes, unpack):
+        self._codes, self._unpack = codes, unpack
+
+    def __getitem__(self, inds):
+        return self._unpack(self._codes[inds])
+
+
+OBS_BUFFERS = {"uint8": Uint8RolloutBuffer, "packed": PackedRolloutBuffer}
+
+
+@functools.lru_cache(maxsize=None)
+def maskable(buffer_class):
+    # the same frame storage for sb3_contrib's MaskablePPO, which also stores action masks
+    from sb3_contrib.common.maskable.buffers import MaskableRolloutBuffer
+    return type(f"Maskable{buffer_class.__name__}", (buffer_class, MaskableRolloutBuffer), {})
@@ -1,7 +1,17 @@
-from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
 import json
+import multiprocessing as mp
+import os
+import queue
+from collections import deque
+import tempfile
 
-CUSTOM_KEYS = ["score", "turn_count", "time_out", "wall_turn_evade"]
+import numpy as np
+
+from adaptive_eval import evaluate_adaptive, gym_episode_runner, vec_episode_runner
+from episode_log import EpisodeLogWriter
+
+CUSTOM_KEYS = ["score", "turn_count", "time_out", "wall_turn_evade", "loop", "stall"]
 
 class TensorboardCallback(BaseCallback):
     def __init__(self, verbose=0):
@@ -73,3 +83,308 @@ class RewardBreakdownJSONCallback(BaseCallback):
     def _on_training_end(self) -> None:
         with open(self.json_path, "w") as f:
             json.dump(self.all_episodes, f, indent=2)
+
+
+class EpisodeLogCallback(BaseCallback):
+    # Streams one row per finished episode (reward components, CUSTOM_KEYS, steps) into a
+    # columnar episode log (see episode_log.py). Memory stays bounded by one chunk, and
+    # every env of a VecEnv is tracked, not just the first.
+    def __init__(self, path, meta=None, chunk_rows=1 << 16, verbose=0):
+        super().__init__(verbose)
+        self.writer = EpisodeLogWriter(path, chunk_rows, meta=meta)
+        self.episode_num = 0
+        self._rewards = None
+
+    def _on_training_start(self) -> None:
+        self._rewards = [{} for _ in range(self.training_env.num_envs)]
+        self._steps = np.zeros(self.training_env.num_envs, dtype=np.int64)
+
+    def _on_step(self) -> bool:
+        for i, (info, done) in enumerate(zip(self.locals["infos"], self.locals["dones"])):
+            totals = self._rewards[i]
+            for key, val in info.get("reward_breakdown", {}).items():
+                totals[key] = totals.get(key, 0.0) + val
+            self._steps[i] += 1
+            if done:
+                self.episode_num += 1
+                self.writer.write({
+                    "episode_num": self.episode_num,
+                    "timestep": self.num_timesteps,
+                    "steps": int(self._steps[i]),
+                    **totals,
+                    **{k: info.get(k, 0) for k in CUSTOM_KEYS},
+                })
+                self._rewards[i] = {}
+                self._steps[i] = 0
+        return True
+
+    def _on_training_end(self) -> None:
+        self.writer.close()
+
+
+class ScoreThresholdCallback(BaseCallback):
+    # Stops learn() once the mean score of the last `window` finished training episodes
+    # reaches `threshold` (threshold None: never stops). Used by board_curriculum.py.
+    def __init__(self, threshold=None, window=50, verbose=0):
+        super().__init__(verbose)
+        self.threshold = threshold
+        self.scores = deque(maxlen=window)
+        self.reached = False
+
+    def _on_step(self) -> bool:
+        for info, done in zip(self.locals["infos"], self.locals["dones"]):
+            if done:
+                self.scores.append(info.get("score", 0))
+        if len(self.scores) == self.scores.maxlen:
+            mean = float(np.mean(self.scores))
+            self.logger.record("curriculum/score_mean", mean)
+            if self.threshold is not None and mean >= self.threshold:
+                self.reached = True
+                if self.verbose:
+                    print(f"Mean score {mean:.2f} over {len(self.scores)} episodes reached {self.threshold}")
+                return False
+        return True
+
+
+def _async_eval_worker(algo_cls, model_path, env_kwargs, n_eval_episodes, deterministic,
+                       best_model_save_path, adaptive, jobs, results):
+    # Persistent eval process: load the model once, then only swap policy weights per job.
+    import torch
+    from stable_baselines3.common.monitor import Monitor
+    from snake_env import SnakeEnv
+
+    torch.set_num_threads(1)
+    model = algo_cls.load(model_path, device="cpu")
+    env_kwargs = dict(env_kwargs)
+    frame_stack = env_kwargs.pop("frame_stack", 1)
+    env = SnakeEnv(**env_kwargs)
+    if frame_stack > 1:
+        from frame_history import FrameHistory
+        env = FrameHistory(env, frame_stack)
+    env = Monitor(env)
+    best_mean_reward = -np.inf
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        model.policy.load_state_dict({k: torch.as_tensor(v) for k, v in job["weights"].items()})
+        run_episode = gym_episode_runner(model, env, deterministic)
+        if adaptive is not None:
+            rows = evaluate_adaptive(run_episode, best_mean=best_mean_reward, **adaptive)["rows"]
+        else:
+            rows = [run_episode() for _ in range(n_eval_episodes)]
+        rewards = [r["reward"] for r in rows]
+        lengths = [r["steps"] for r in rows]
+        scores = [r["score"] for r in rows]
+
+        mean_reward = float(np.mean(rewards))
+        is_best = mean_reward > best_mean_reward
+        if is_best:
+            best_mean_reward = mean_reward
+            if best_model_save_path is not None:
+                model.num_timesteps = job["timesteps"]
+                model.save(os.path.join(best_model_save_path, "best_model"))
+        results.put({
+            "timesteps": job["timesteps"],
+            "rewards": rewards,
+            "lengths": lengths,
+            "scores": scores,
+            "is_best": is_best,
+        })
+    env.close()
+
+
+class AsyncEvalCallback(BaseCallback):
+    """
+    Drop-in for EvalCallback that evaluates in a separate worker process.
+
+    Every ``eval_freq`` calls the current policy weights are copied and handed to the
+    worker; training continues immediately and results are logged (and the best model
+    saved by the worker) whenever they come back. At most one snapshot is in flight and
+    one is pending: if the worker falls behind, the newest snapshot replaces the pending one.
+    Pass ``adaptive`` (evaluate_adaptive keyword arguments) to replace the fixed episode count.
+    """
+
+    def __init__(self, env_kwargs=None, eval_freq=5000, n_eval_episodes=5, deterministic=True,
+                 best_model_save_path=None, log_path=None, adaptive=None, verbose=1):
+        super().__init__(verbose)
+        self.adaptive = adaptive
+        self.env_kwargs = env_kwargs or {}
+        self.eval_freq = eval_freq
+        self.n_eval_episodes = n_eval_episodes
+        self.deterministic = deterministic
+        self.best_model_save_path = best_model_save_path
+        self.log_path = os.path.join(log_path, "evaluations") if log_path is not None else None
+        self.best_mean_reward = -np.inf
+        self.last_mean_reward = -np.inf
+        self.evaluations_timesteps = []
+        self.evaluations_results = []
+        self.evaluations_length = []
+        self.skipped = 0
+        self._in_flight = False
+        self._pending = None
+        self._process = None
+
+    def _on_training_start(self) -> None:
+        if self.best_model_save_path is not None:
+            os.makedirs(self.best_model_save_path, exist_ok=True)
+        self._tmpdir = tempfile.TemporaryDirectory()
+        init_path = os.path.join(self._tmpdir.name, "init_model")
+        self.model.save(init_path)
+
+        ctx = mp.get_context("spawn")
+        self._jobs = ctx.Queue()
+        self._results = ctx.Queue()
+        self._process = ctx.Process(
+            target=_async_eval_worker,
+            args=(type(self.model), init_path + ".zip", self.env_kwargs, self.n_eval_episodes,
+                  self.deterministic, self.best_model_save_path, self.adaptive,
+                  self._jobs, self._results),
+            daemon=True,
+        )
+        self._process.start()
+
+    def _snapshot(self):
+        weights = {k: v.detach().cpu().numpy().copy() for k, v in self.model.policy.state_dict().items()}
+        return {"timesteps": self.num_timesteps, "weights": weights}
+
+    def _dispatch(self, job):
+        if self._in_flight:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = job
+        else:
+            self._jobs.put(job)
+            self._in_flight = True
+
+    def _check_worker(self):
+        # a dead worker (load failure, bad env_kwargs, OOM) never answers: fail instead of
+        # waiting on it, or queueing snapshots for it, forever
+        if not self._process.is_alive():
+            self._jobs.cancel_join_thread()  # queued snapshots would block interpreter exit
+            self._tmpdir.cleanup()
+            raise RuntimeError(f"Async eval worker exited with code {self._process.exitcode} "
+                               "(its traceback, if any, is on stderr above)")
+
+    def _collect(self, block=False):
+        while True:
+            try:
+                result = self._results.get(timeout=1.0) if block else self._results.get_nowait()
+                break
+            except queue.Empty:
+                self._check_worker()
+                if not block:
+                    return
+        self._in_flight = False
+        if self._pending is not None:
+            self._dispatch(self._pending)
+            self._pending = None
+
+        mean_reward = float(np.mean(result["rewards"]))
+        self.last_mean_reward = mean_reward
+        if result["is_best"]:
+            self.best_mean_reward = mean_reward
+        self.logger.record("eval/mean_reward", mean_reward)
+        self.logger.record("eval/mean_ep_length", float(np.mean(result["lengths"])))
+        self.logger.record("eval/mean_score", float(np.mean(result["scores"])))
+        self.logger.record("eval/n_episodes", len(result["rewards"]))
+        self.logger.record("eval/snapshot_timesteps", result["timesteps"])
+        self.logger.record("eval/skipped_snapshots", self.skipped)
+        if self.verbose >= 1:
+            print(f"Async eval @ {result['timesteps']} timesteps: "
+                  f"episode_reward={mean_reward:.2f} +/- {np.std(result['rewards']):.2f}"
+                  + (" (new best)" if result["is_best"] else ""))
+
+        if self.log_path is not None:
+            self.evaluations_timesteps.append(result["timesteps"])
+            self.evaluations_results.append(result["rewards"])
+            self.evaluations_length.append(result["lengths"])
+            np.savez(
+                self.log_path,
+                timesteps=self.evaluations_timesteps,
+                results=self.evaluations_results,
+                ep_lengths=self.evaluations_length,
+            )
+
+    def _on_step(self) -> bool:
+        self._collect()
+        if self.eval_freq > 0 and self.n_calls % self.eval_freq == 0:
+            self._dispatch(self._snapshot())
+        return True
+
+    def _on_training_end(self) -> None:
+        # Drain what is still queued so the last snapshot is evaluated too.
+        while self._in_flight:
+            self._collect(block=True)
+        self._jobs.put(None)
+        self._process.join()
+        self._tmpdir.cleanup()
+
+
+class AdaptiveEvalCallback(EvalCallback):
+    """
+    EvalCallback with a sequential stopping rule instead of ``n_eval_episodes``.
+
+    Each evaluation runs until the confidence interval on the mean reward is narrower
+    than the target, the candidate is confidently worse than ``best_mean_reward``, or
+    ``max_episodes`` is reached (see adaptive_eval.evaluate_adaptive).
+    """
+
+    def __init__(self, eval_env, target_half_width=5.0, rel_half_width=0.0, confidence=0.95,
+                 min_episodes=3, max_episodes=50, **kwargs):
+        super().__init__(eval_env, n_eval_episodes=max_episodes, **kwargs)
+        self.adaptive = dict(target_half_width=target_half_width, rel_half_width=rel_half_width,
+                             confidence=confidence, min_episodes=min_episodes, max_episodes=max_episodes)
+        self.evaluations_scores = []
+
+    def _on_step(self) -> bool:
+        if not (self.eval_freq > 0 and self.n_calls % self.eval_freq == 0):
+            return True
+
+        best_mean = self.best_mean_reward if np.isfinite(self.best_mean_reward) else None
+        summary = evaluate_adaptive(vec_episode_runner(self.model, self.eval_env, self.deterministic),
+                                    best_mean=best_mean, **self.adaptive)
+        rewards = [r["reward"] for r in summary["rows"]]
+        lengths = [r["steps"] for r in summary["rows"]]
+        scores = [r["score"] for r in summary["rows"]]
+        mean_reward = summary["mean"]
+        self.last_mean_reward = mean_reward
+
+        if self.log_path is not None:
+            self.evaluations_timesteps.append(self.num_timesteps)
+            self.evaluations_results.append(rewards)
+            self.evaluations_length.append(lengths)
+            self.evaluations_scores.append(scores)
+            # episode counts differ per evaluation, so store ragged lists as object arrays
+            np.savez(
+                self.log_path,
+                timesteps=self.evaluations_timesteps,
+                results=np.array(self.evaluations_results, dtype=object),
+                ep_lengths=np.array(self.evaluations_length, dtype=object),
+                scores=np.array(self.evaluations_scores, dtype=object),
+            )
+
+        if self.verbose >= 1:
+            print(f"Eval num_timesteps={self.num_timesteps}, episode_reward={mean_reward:.2f} "
+                  f"+/- {summary['half_width']:.2f} ({summary['n_episodes']} episodes, {summary['stop_reason']})")
+        self.logger.record("eval/mean_reward", mean_reward)
+        self.logger.record("eval/mean_ep_length", float(np.mean(lengths)))
+        self.logger.record("eval/mean_score", float(np.mean(scores)))
+        self.logger.record("eval/ci_half_width", summary["half_width"])
+        self.logger.record("eval/n_episodes", summary["n_episodes"])
+        self.logger.record("time/total_timesteps", self.num_timesteps, exclude="tensorboard")
+        self.logger.dump(self.num_timesteps)
+
+        continue_training = True
+        if mean_reward > self.best_mean_reward:
+            if self.verbose >= 1:
+                print("New best mean reward!")
+            if self.best_model_save_path is not None:
+                self.model.save(os.path.join(self.best_model_save_path, "best_model"))
+            self.best_mean_reward = mean_reward
+            if self.callback_on_new_best is not None:
+                continue_training = self.callback_on_new_best.on_step()
+        if self.callback is not None:
+            continue_training = continue_training and self._on_event()
+        return continue_training
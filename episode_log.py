@@ -0,0 +1,188 @@
+# Columnar, chunked storage for per-episode metrics (training and eval logs).
+#
+# Each column is a plain .npy file per chunk, so a reader memory-maps just the columns it
+# needs instead of parsing every episode dict like the JSON logs. Same layout idea as
+# trajectory.py:
+#   schema.json              {"columns": {name: dtype}, "chunks": [rows per chunk], "meta": {...}}
+#   chunk_00000/<column>.npy one array per column, `rows` long
+#
+# Columns are created from the first row that has them; a column missing from an older
+# chunk reads back as NaN (floats) or 0 (ints).
+#
+#   writer = EpisodeLogWriter("logs/episodes/ppo_length_seed7", meta={"algo": "ppo"})
+#   writer.write({"episode_num": 1, "steps": 120, "food_eaten": 50.0, ...})
+#   writer.close()
+#   log = EpisodeLog("logs/episodes/ppo_length_seed7")
+#   log["steps"]                     # int32 array over all episodes (mmap'd for one chunk)
+#
+#   python episode_log.py convert logs/reward_breakdown_log.json logs/episodes/old_run
+import argparse
+import json
+import os
+
+import numpy as np
+
+
+def _dtype_for(value):
+    if isinstance(value, (bool, np.bool_)):
+        return "uint8"
+    if isinstance(value, (int, np.integer)):
+        return "int32" if -2**31 <= value < 2**31 else "int64"
+    return "float32"
+
+
+def _fill(dtype, n):
+    dtype = np.dtype(dtype)
+    return np.full(n, np.nan if dtype.kind == "f" else 0, dtype=dtype)
+
+
+class EpisodeLogWriter:
+    # Same write()/close() interface as metrics.ChunkedJSONLWriter.
+    def __init__(self, path, chunk_rows=1 << 16, meta=None, schema=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        os.makedirs(path, exist_ok=True)
+        self.columns = dict(schema or {})
+        self.chunks = []
+        self.meta = dict(meta or {})
+        self._buffer = {}
+        self._rows = 0
+
+    def write(self, row):
+        for key, value in row.items():
+            if isinstance(value, (str, dict, list)) or value is None:
+                continue
+            if key not in self.columns:
+                self.columns[key] = _dtype_for(value)
+            elif self.columns[key].startswith("int") and not isinstance(value, (bool, int, np.integer)):
+                self.columns[key] = "float32"  # a column that started integral got a float
+            if key not in self._buffer:
+                self._buffer[key] = [None] * self._rows
+            self._buffer[key].append(value)
+        self._rows += 1
+        for values in self._buffer.values():
+            if len(values) < self._rows:
+                values.append(None)
+        if self._rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        chunk_dir = os.path.join(self.path, f"chunk_{len(self.chunks):05d}")
+        os.makedirs(chunk_dir, exist_ok=True)
+        for key, values in self._buffer.items():
+            dtype = np.dtype(self.columns[key])
+            if any(v is None for v in values):
+                fill = np.nan if dtype.kind == "f" else 0
+                values = [fill if v is None else v for v in values]
+            np.save(os.path.join(chunk_dir, f"{key}.npy"), np.asarray(values, dtype=dtype))
+        self.chunks.append(self._rows)
+        self._buffer = {}
+        self._rows = 0
+        self._write_schema()
+
+    def _write_schema(self):
+        tmp = os.path.join(self.path, "schema.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"columns": self.columns, "chunks": self.chunks, "meta": self.meta}, f, indent=2)
+        os.replace(tmp, os.path.join(self.path, "schema.json"))
+
+    def close(self):
+        self.flush()
+        if not self.chunks:
+            self._write_schema()
+
+
+class EpisodeLog:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "schema.json"), "r") as f:
+            schema = json.load(f)
+        self.schema = schema["columns"]
+        self.chunks = schema["chunks"]
+        self.meta = schema.get("meta", {})
+        self.name = self.meta.get("name") or os.path.basename(os.path.normpath(path))
+        self._cache = {}
+
+    def __len__(self):
+        return int(sum(self.chunks))
+
+    @property
+    def columns(self):
+        return list(self.schema)
+
+    def __contains__(self, name):
+        return name in self.schema
+
+    def _chunk_column(self, i, name):
+        file = os.path.join(self.path, f"chunk_{i:05d}", f"{name}.npy")
+        if os.path.exists(file):
+            return np.load(file, mmap_mode="r")
+        return _fill(self.schema[name], self.chunks[i])
+
+    def __getitem__(self, name):
+        if name not in self.schema:
+            raise KeyError(f"{name!r} not in {self.path} (columns: {', '.join(self.schema)})")
+        if name not in self._cache:
+            parts = [self._chunk_column(i, name) for i in range(len(self.chunks))]
+            if not parts:
+                column = _fill(self.schema[name], 0)
+            elif len(parts) == 1:
+                column = parts[0]
+            else:
+                column = np.concatenate(parts).astype(self.schema[name], copy=False)
+            self._cache[name] = column
+        return self._cache[name]
+
+    def to_dict(self, columns=None):
+        return {name: self[name] for name in (columns or self.columns)}
+
+
+def _iter_json_rows(path):
+    # JSON list (reward_breakdown_log.json) or JSON lines (eval.py --episodes_out)
+    with open(path, "r") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def convert(src_paths, dst, chunk_rows=1 << 16, meta=None):
+    writer = EpisodeLogWriter(dst, chunk_rows, meta={"converted_from": list(src_paths), **(meta or {})})
+    for src in src_paths:
+        for row in _iter_json_rows(src):
+            writer.write(row)
+    writer.close()
+    return EpisodeLog(dst)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest="which", required=True)
+    convert_p = sub.add_parser("convert", help="JSON / JSON-lines episode logs -> columnar store")
+    convert_p.add_argument("src", nargs="+", help="one or more files, appended in order (e.g. eval worker files)")
+    convert_p.add_argument("dst")
+    convert_p.add_argument("--chunk_rows", type=int, default=1 << 16)
+    info_p = sub.add_parser("info")
+    info_p.add_argument("path")
+    args = p.parse_args(argv)
+
+    if args.which == "convert":
+        log = convert(args.src, args.dst, args.chunk_rows)
+        print(f"Wrote {len(log)} episodes, {len(log.columns)} columns to {args.dst}")
+    else:
+        log = EpisodeLog(args.path)
+        print(f"{args.path}: {len(log)} episodes in {len(log.chunks)} chunks")
+        for name, dtype in log.schema.items():
+            print(f"  {name:<20} {dtype}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,276 @@
 # collects rich gameplay metrics
-import argparse, os, csv
-import numpy as np
-from stable_baselines3 import PPO
-from snake_env import SnakeEnv   # updated import
-from stable_baselines3.common.vec_env import DummyVecEnv, VecTransposeImage
-
+import argparse, os
 import json
+import multiprocessing as mp
+
+from snake_env import SnakeEnv, parse_grid   # updated import
+from adaptive_eval import evaluate_adaptive, uses_action_masks
+from metrics import MetricsCollector, ChunkedJSONLWriter
+from episode_log import EpisodeLogWriter
+from numpy_policy import load_policy, policy_exists
+from replay import EpisodeRecord, ReplayEngine, load_episodes, save_episodes
+from trajectory import TrajectoryRecorder
+from frame_history import FrameHistory
+
+# metric -> histogram bin width
+HISTOGRAMS = {"score": 1, "max_length": 1, "steps": 100}
+
+
+def eval_env_kwargs(reward_mode="length", seed=7, grid_size=None, detector=None):
+    # detector: SnakeEnv loop_repeats / stall_steps, None entries left out
+    kwargs = {"reward_mode": reward_mode, "seed": seed, "curriculum": False}
+    if grid_size is not None:
+        kwargs["grid_size"] = list(grid_size)
+    kwargs.update({k: v for k, v in (detector or {}).items() if v is not None})
+    return kwargs
+
+
+def make_eval_env(reward_mode="length", render=False, seed=7, record_dir=None, grid_size=None, frame_stack=1,
+                  mask_collisions=False, detector=None):
+    # plain gym env: SB3 models transpose channel-last obs in predict() themselves and
+    # NumpyPolicy does the same, so no SB3 VecEnv (and no torch) is needed here
+    env = SnakeEnv(render_mode="human" if render else None, mask_collisions=mask_collisions,
+                   **eval_env_kwargs(reward_mode, seed, grid_size, detector))
+    if record_dir:
+        env = TrajectoryRecorder(env, record_dir)
+    return FrameHistory(env, frame_stack) if frame_stack > 1 else env
 
-def run_episode(model, reward_mode="length", render=False, seed=7):
-    env = DummyVecEnv([lambda: SnakeEnv(
-        render_mode="human" if render else None,
-        reward_mode=reward_mode,
-        seed=seed,
-        curriculum=False
-    )])
-    env = VecTransposeImage(env)
-
-    obs = env.reset()
-    done = False
-    ep_reward, steps, max_length = 0.0, 0, 0
-
-    while not done:
-        action, _ = model.predict(obs, deterministic=True)
-        obs, rewards, dones, infos = env.step([int(action)])
-        ep_reward += float(rewards[0])
-        steps += 1
-        snake_length = len(env.envs[0].snake_body)
-        max_length = max(max_length, snake_length)
-        done = dones[0]
-
-    info = infos[0]
-    env.close()
 
+def episode_row(ep_reward, steps, done, info):
     return {
         "reward": ep_reward,
         "score": int(info.get("score", 0)),
-        "max_length": max_length,
+        "max_length": int(info.get("snake_length", 0)),  # the snake never shrinks
         "steps": steps,
         "terminated": int(done),
         "time_out": int(info.get("time_out", 0)),
         "turn_count": int(info.get("turn_count", 0)),
         "wall_turn_evade": int(info.get("wall_turn_evade", 0)),
-        #"avg_food_time": info.get("avg_food_time", None),
-
+        "loop": int(info.get("loop", 0)),
+        "stall": int(info.get("stall", 0)),
     }
 
 
-def main():
+def episode_runner(model, env, replays=None, env_kwargs=None):
+    # Returns run_episode(seed) for one persistent env. Everything except the reward is
+    # read from the info of the final step. With a seed the env is reseeded and reset
+    # first, so the episode can be replayed later from (env_kwargs, seed, actions);
+    # those records are appended to `replays` when given.
+    render = env.unwrapped.render_mode == "human"
+    masked = uses_action_masks(model)
+
+    def run_episode(seed=None):
+        obs, info = env.reset(seed=seed)
+        done = False
+        ep_reward, steps, actions = 0.0, 0, []
+        while not done:
+            kwargs = {"action_masks": env.get_wrapper_attr("action_masks")()} if masked else {}
+            action, _ = model.predict(obs, deterministic=True, **kwargs)
+            action = int(action)
+            obs, reward, terminated, truncated, info = env.step(action)
+            if render:
+                env.render()
+            actions.append(action)
+            ep_reward += float(reward)
+            steps += 1
+            done = terminated or truncated
+        if replays is not None:
+            replays.append(EpisodeRecord(env_kwargs, seed, actions))
+        return episode_row(ep_reward, steps, done, info)
+    return run_episode
+
+
+def replay_runner(records):
+    # run_episode() over recorded episodes instead of a model; needs neither torch nor SB3
+    episodes = iter(records)
+
+    def run_episode(seed=None):
+        engine = ReplayEngine(next(episodes))
+        ep_reward, steps, info = 0.0, 0, {}
+        for _, reward, terminated, truncated, info in engine.play():
+            ep_reward += float(reward)
+            steps += 1
+        engine.close()
+        return episode_row(ep_reward, steps, True, info)
+    return run_episode
+
+
+def evaluate(run_episode, episodes, collector, writer=None, first_episode=1, base_seed=7):
+    # episode ep is played with reset seed base_seed + ep, so any of them can be replayed
+    for ep in range(first_episode, first_episode + episodes):
+        seed = base_seed + ep
+        metrics = run_episode(seed)
+        collector.add(metrics)
+        if writer is not None:
+            writer.write({"episode": ep, "seed": seed, **metrics})
+    return collector
+
+
+def _eval_worker(model_path, reward_mode, seed, episodes, first_episode, episodes_out, record_dir, replays_out,
+                 grid_size=None, frame_stack=1, action_mask="none", detector=None):
+    if not model_path.endswith((".npz", ".policy")) and not model_path.startswith(("unix:", "tcp:")):
+        import torch
+        torch.set_num_threads(1)
+    model = load_policy(model_path, device="cpu", masked=action_mask != "none")
+    env = make_eval_env(reward_mode, seed=seed, record_dir=record_dir, grid_size=grid_size, frame_stack=frame_stack,
+                        mask_collisions=action_mask == "collision", detector=detector)
+    writer = make_episode_writer(episodes_out) if episodes_out else None
+    replays = [] if replays_out else None
+    run_episode = episode_runner(model, env, replays, eval_env_kwargs(reward_mode, seed, grid_size, detector))
+    collector = evaluate(run_episode, episodes, MetricsCollector(HISTOGRAMS), writer, first_episode, seed)
+    if writer is not None:
+        writer.close()
+    if replays_out:
+        save_episodes(replays_out, replays)
+    env.close()
+    return collector
+
+
+def make_episode_writer(path):
+    # .json/.jsonl -> JSON lines; anything else is a columnar episode log directory
+    if path.endswith((".json", ".jsonl")):
+        return ChunkedJSONLWriter(path)
+    return EpisodeLogWriter(path, meta={"source": "eval"})
+
+
+def _worker_path(path, i):
+    base, ext = os.path.splitext(path)
+    return f"{base}.{i}{ext}"
+
+
+def main(argv=None):
     p = argparse.ArgumentParser()
-    p.add_argument("--model_path", type=str, default="models/ppo_snake_length")
+    p.add_argument("--model_path", type=str, default="models/ppo_snake_length",
+                   help="SB3 model (without .zip) or a NumPy export ending in .npz (see numpy_policy.py)")
     p.add_argument("--episodes", type=int, default=10)
     p.add_argument("--render", type=int, default=0)
     p.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
-    p.add_argument("--json_out", type=str, default="logs/eval_metrics.json")
+    p.add_argument("--json_out", type=str, default="logs/eval_metrics.json",
+                   help="summary statistics (moments, quantiles, histograms)")
+    p.add_argument("--episodes_out", type=str, default=None,
+                   help="optional per-episode rows: a .jsonl file or a columnar log folder (one per worker)")
+    p.add_argument("--record_dir", type=str, default=None,
+                   help="record compact trajectories (see trajectory.py); one store per worker")
+    p.add_argument("--save_replays", type=str, default=None,
+                   help="save (seed, actions) of every episode to this .npz for replay.py (one file per worker)")
+    p.add_argument("--replay", type=str, default=None,
+                   help="evaluate episodes recorded with --save_replays instead of running a model")
+    p.add_argument("--workers", type=int, default=1)
     p.add_argument("--seed", type=int, default=7)
-    args = p.parse_args()
-
-    if not os.path.exists(args.model_path + ".zip"):
-        raise FileNotFoundError(f"Model not found: {args.model_path}.zip")
+    p.add_argument("--grid", type=parse_grid, default=None,
+                   help="board size in cells, e.g. 30x20 (default: the env's 30x20); must match the model's input")
+    p.add_argument("--frame_stack", type=int, default=1,
+                   help="frames of history the model was trained with (train_ppo.py --frame_stack)")
+    p.add_argument("--action_mask", type=str, default="none", choices=["none", "reverse", "collision"],
+                   help="a MaskablePPO model trained with train_ppo.py --action_mask; actions are masked the same way")
+    p.add_argument("--loop_repeats", type=int, default=None,
+                   help="end an episode once a state repeats this often without food (SnakeEnv loop detector)")
+    p.add_argument("--stall_steps", type=int, default=None, help="end an episode after this many steps without food")
+    p.add_argument("--ci_target", type=float, default=None,
+                   help="stop once the 95%% CI half width on mean reward is below this (--episodes becomes the max)")
+    p.add_argument("--min_episodes", type=int, default=3)
+    args = p.parse_args(argv)
+    detector = {"loop_repeats": args.loop_repeats, "stall_steps": args.stall_steps}
 
     os.makedirs(os.path.dirname(args.json_out), exist_ok=True)
-    model = PPO.load(args.model_path)
+    if args.replay:
+        records = load_episodes(args.replay)
+        writer = make_episode_writer(args.episodes_out) if args.episodes_out else None
+        run_episode = replay_runner(records)
+        collector = MetricsCollector(HISTOGRAMS)
+        for ep, record in enumerate(records, start=1):
+            metrics = run_episode()
+            collector.add(metrics)
+            if writer is not None:
+                writer.write({"episode": ep, "seed": record.seed, **metrics})
+        if writer is not None:
+            writer.close()
+        print_summary(collector, args)
+        return
 
-    rows = []
-    for ep in range(1, args.episodes + 1):
-        metrics = run_episode(model, reward_mode=args.reward_mode, render=bool(args.render), seed=args.seed)
-        metrics["episode"] = ep
-        rows.append(metrics)
+    if not policy_exists(args.model_path):
+        raise FileNotFoundError(f"Model not found: {args.model_path}")
 
-    # Summary
-    mean_reward = float(np.mean([r["reward"] for r in rows]))
-    std_reward  = float(np.std([r["reward"] for r in rows]))
-    mean_score  = float(np.mean([r["score"] for r in rows]))
-    mean_steps  = float(np.mean([r["steps"] for r in rows]))
-    mean_length = float(np.mean([r["max_length"] for r in rows]))
-    term_rate   = float(np.mean([r["terminated"] for r in rows]))
-    mean_turns = float(np.mean([r["turn_count"] for r in rows]))
-    mean_timeout = float(np.mean([r["time_out"] for r in rows]))
-    mean_wall_turn_evade = float(np.mean([r["wall_turn_evade"] for r in rows]))
-    mean_food_time = mean_score/mean_steps
+    workers = 1 if (args.render or args.ci_target is not None) else max(1, args.workers)
+
+    if workers > 1:
+        # split the episodes across workers and merge their collectors
+        counts = [args.episodes // workers + (i < args.episodes % workers) for i in range(workers)]
+        jobs, first = [], 1
+        for i, n in enumerate(counts):
+            out = _worker_path(args.episodes_out, i) if args.episodes_out else None
+            replays_out = _worker_path(args.save_replays, i) if args.save_replays else None
+            record_dir = os.path.join(args.record_dir, f"worker_{i}") if args.record_dir else None
+            jobs.append((args.model_path, args.reward_mode, args.seed, n, first, out, record_dir, replays_out,
+                         args.grid, args.frame_stack, args.action_mask, detector))
+            first += n
+        with mp.get_context("spawn").Pool(workers) as pool:
+            parts = pool.starmap(_eval_worker, jobs)
+        collector = MetricsCollector(HISTOGRAMS)
+        for part in parts:
+            collector.merge(part)
+    else:
+        model = load_policy(args.model_path, masked=args.action_mask != "none")
+        env = make_eval_env(args.reward_mode, render=bool(args.render), seed=args.seed,
+                            record_dir=args.record_dir, grid_size=args.grid, frame_stack=args.frame_stack,
+                            mask_collisions=args.action_mask == "collision", detector=detector)
+        writer = make_episode_writer(args.episodes_out) if args.episodes_out else None
+        replays = [] if args.save_replays else None
+        run_episode = episode_runner(model, env, replays,
+                                     eval_env_kwargs(args.reward_mode, args.seed, args.grid, detector))
+        if args.ci_target is not None:
+            seeds = iter(range(args.seed + 1, args.seed + args.episodes + 1))
+            summary = evaluate_adaptive(lambda: run_episode(next(seeds)), target_half_width=args.ci_target,
+                                        min_episodes=args.min_episodes, max_episodes=args.episodes)
+            print(f"Adaptive eval stopped after {summary['n_episodes']} episodes ({summary['stop_reason']}), "
+                  f"CI half width {summary['half_width']:.2f}")
+            collector = MetricsCollector(HISTOGRAMS)
+            for ep, metrics in enumerate(summary["rows"], start=1):
+                collector.add(metrics)
+                if writer is not None:
+                    writer.write({"episode": ep, "seed": args.seed + ep, **metrics})
+        else:
+            collector = evaluate(run_episode, args.episodes, MetricsCollector(HISTOGRAMS), writer,
+                                 base_seed=args.seed)
+        if writer is not None:
+            writer.close()
+        if replays is not None:
+            save_episodes(args.save_replays, replays)
+        env.close()
 
+    print_summary(collector, args, workers)
 
 
-    print(f"Episodes: {len(rows)}")
-    print(f"Mean reward: {mean_reward:.2f} ± {std_reward:.2f}")
+def print_summary(collector, args, workers=1):
+    # Summary
+    m = collector.moments
+    mean_score = m["score"].mean
+    mean_steps = m["steps"].mean
+    mean_food_time = mean_score/mean_steps
+
+    print(f"Episodes: {collector.n_episodes}")
+    print(f"Mean reward: {m['reward'].mean:.2f} ± {m['reward'].std:.2f}")
     print(f"Mean score (food eaten): {mean_score:.2f}")
-    print(f"Mean max snake length: {mean_length:.2f}")
+    print(f"Score p10/p50/p90: " + "/".join(f"{collector.sketches['score'].quantile(q):.1f}" for q in (0.1, 0.5, 0.9)))
+    print(f"Mean max snake length: {m['max_length'].mean:.2f}")
     print(f"Mean steps: {mean_steps:.2f}")
-    print(f"Termination rate: {term_rate*100:.1f}%")
-    print(f"time_out (truncate/non-death): {mean_timeout*100:.1f}%")
-    print(f"Mean turns: {mean_turns:.2f}")
-    print(f"Mean wall evade: {mean_wall_turn_evade:.2f}")
+    print(f"Termination rate: {m['terminated'].mean*100:.1f}%")
+    print(f"time_out (truncate/non-death): {m['time_out'].mean*100:.1f}%")
+    print(f"Mean turns: {m['turn_count'].mean:.2f}")
+    print(f"Mean wall evade: {m['wall_turn_evade'].mean:.2f}")
+    print(f"Truncated as loop / stall: {m['loop'].mean*100:.1f}% / {m['stall'].mean*100:.1f}%")
     print(f"Mean avg food time (score/timesteps): {mean_food_time:.2f}")
 
-
-    # Per-episode json
-    #fieldnames = ["episode","reward","score","max_length","steps","terminated","mean_timeout","turn_count", "wall_turn_evade"]
-    with open(args.json_out, "w", newline="") as f:
-        json.dump(rows, f, indent=2)
+    summary = collector.summary()
+    summary["mean_food_time"] = mean_food_time
+    with open(args.json_out, "w") as f:
+        json.dump(summary, f, indent=2)
     print(f"Saved metrics to {args.json_out}")
+    per_worker = " (one file per worker)" if workers > 1 else ""
+    if args.episodes_out:
+        print(f"Per-episode rows in {args.episodes_out}{per_worker}")
+    if args.save_replays and not args.replay:
+        print(f"Replays in {args.save_replays}{per_worker}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,52 @@
+# Frame history for SnakeEnv: the last K observations stacked along the channel axis.
+#
+# Frames live in a ring of 2K slots and every new frame is written twice, at slot j and
+# j + K. The last K frames are then always the slice ring[:, :, i : i + K], which is
+# returned as an (H, W, K * C) view: one frame written per step instead of the np.roll
+# over the whole stack that SB3's VecFrameStack does.
+#
+#   env = FrameHistory(SnakeEnv(), k=4)      # observation (20, 30, 12), oldest frame first
+#   make_env(..., frame_stack=4)             # train_ppo.py / train_a2c.py --frame_stack 4
+#
+# The stack is channels-last like SnakeEnv's own frames and VecFrameStack(channels_order=
+# "last"), and SB3 transposes it to (K * C, H, W) like any image. It only leaves it as it
+# is when H is the smallest dimension (e.g. 10x10 with K = 4): SB3 then takes it for
+# channels-first, see buffers.stays_channels_last. Like VecFrameStack, the history is
+# zero-filled at reset. The returned observation is a
+# view into the ring and changes on the next step(); copy it to keep it (SB3's VecEnvs
+# copy observations into their own buffers anyway). The last observation of an episode
+# is a copy: VecEnvs keep it as info["terminal_observation"] (SB3 bootstraps truncated
+# episodes from it) and then reset(), which clears the ring.
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+
+class FrameHistory(gym.Wrapper):
+    def __init__(self, env, k=4):
+        super().__init__(env)
+        h, w, c = env.observation_space.shape
+        self.k = k
+        self._ring = np.zeros((h, w, 2 * k, c), dtype=env.observation_space.dtype)
+        self._i = 0  # first slot of the current view
+        self.observation_space = spaces.Box(0, 255, shape=(h, w, k * c), dtype=env.observation_space.dtype)
+
+    def _push(self, obs):
+        j = self._i
+        self._ring[:, :, j] = obs
+        self._ring[:, :, j + self.k] = obs
+        self._i = (j + 1) % self.k
+        return self._ring[:, :, self._i:self._i + self.k].reshape(self.observation_space.shape)
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self._ring[:] = 0
+        self._i = 0
+        return self._push(obs), info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        obs = self._push(obs)
+        if terminated or truncated:
+            obs = obs.copy()
+        return obs, reward, terminated, truncated, info
@@ -0,0 +1,152 @@
+# Export GIF/MP4 clips of the best, worst and median episodes of an evaluation.
+#
+# The evaluation runs headless and only keeps (seed, actions) per episode (see
+# replay.py). Afterwards just the picked episodes are re-simulated and rendered with
+# the pygame-free rgb_array renderer in a pool of worker processes, so rendering cost
+# scales with the number of clips, not with the number of evaluated episodes.
+#
+#   python highlights.py --model_path models/ppo_snake_length --episodes 200 --metric score
+#   python highlights.py --replays logs/replays.npz --metric steps --format mp4
+#
+# --grid, --frame_stack, --action_mask, --loop_repeats and --stall_steps work as in eval.py.
+import argparse
+import json
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from replay import ReplayEngine, load_episodes
+from snake_env import parse_grid, render_rgb
+
+PICKS = ["best", "worst", "median"]
+
+
+def pick_episodes(values, picks, per_pick=1):
+    # -> list of (pick name, episode index); values are the metric per episode
+    order = np.argsort(values, kind="stable")
+    chosen = []
+    for pick in picks:
+        if pick == "best":
+            idx = order[::-1][:per_pick]
+        elif pick == "worst":
+            idx = order[:per_pick]
+        else:
+            mid = len(order) // 2
+            lo = max(mid - per_pick // 2, 0)
+            idx = order[lo:lo + per_pick]
+        chosen.extend((pick, int(i)) for i in idx)
+    return chosen
+
+
+def episode_frames(record, cell_size=10, max_frames=None, frame_skip=1):
+    # Re-simulate an episode and return its rgb frames (T, H, W, 3). With max_frames
+    # only the last frames are kept, which is where the episode ends.
+    engine = ReplayEngine(record)
+    grids = [engine.obs]
+    for obs, *_ in engine.play():
+        grids.append(obs)
+    engine.close()
+    grids = grids[::frame_skip]
+    if max_frames is not None:
+        grids = grids[-max_frames:]
+    return render_rgb(np.stack(grids), cell_size)
+
+
+def encode_clip(record, path, fps=25, cell_size=10, max_frames=None, frame_skip=1):
+    frames = episode_frames(record, cell_size, max_frames, frame_skip)
+    if path.endswith(".gif"):
+        from PIL import Image
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(path, save_all=True, append_images=images[1:],
+                       duration=int(1000 / fps), loop=0)
+    else:
+        try:
+            import imageio.v2 as imageio
+        except ImportError as e:
+            raise ImportError("MP4 export needs imageio and imageio-ffmpeg: "
+                              "pip install imageio imageio-ffmpeg") from e
+        imageio.mimwrite(path, list(frames), fps=fps)
+    return path
+
+
+def evaluate_model(model_path, episodes, reward_mode, seed, grid_size=None, frame_stack=1, action_mask="none",
+                   detector=None):
+    # Headless evaluation that keeps only per-episode metrics and replay records; the env
+    # options are eval.py's and have to match what the model was trained with.
+    from eval import episode_runner, eval_env_kwargs, make_eval_env
+    from numpy_policy import load_policy
+
+    model = load_policy(model_path, masked=action_mask != "none")
+    env = make_eval_env(reward_mode, seed=seed, grid_size=grid_size, frame_stack=frame_stack,
+                        mask_collisions=action_mask == "collision", detector=detector)
+    records = []
+    run_episode = episode_runner(model, env, records, eval_env_kwargs(reward_mode, seed, grid_size, detector))
+    rows = [run_episode(seed + ep) for ep in range(1, episodes + 1)]
+    env.close()
+    return rows, records
+
+
+def evaluate_replays(path):
+    from eval import replay_runner
+
+    records = load_episodes(path)
+    run_episode = replay_runner(records)
+    return [run_episode() for _ in records], records
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--model_path", type=str, default="models/ppo_snake_length")
+    p.add_argument("--replays", type=str, default=None,
+                   help="use episodes saved by eval.py --save_replays instead of running the model")
+    p.add_argument("--episodes", type=int, default=100)
+    p.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--grid", type=parse_grid, default=None, help="board size the model was trained on, e.g. 10x10")
+    p.add_argument("--frame_stack", type=int, default=1, help="frames of history the model was trained with")
+    p.add_argument("--action_mask", type=str, default="none", choices=["none", "reverse", "collision"],
+                   help="a MaskablePPO model trained with train_ppo.py --action_mask")
+    p.add_argument("--loop_repeats", type=int, default=None, help="SnakeEnv loop detector, as in eval.py")
+    p.add_argument("--stall_steps", type=int, default=None, help="SnakeEnv stall detector, as in eval.py")
+    p.add_argument("--metric", type=str, default="score", choices=["score", "reward", "steps", "max_length"])
+    p.add_argument("--picks", type=str, default=",".join(PICKS))
+    p.add_argument("--per_pick", type=int, default=1)
+    p.add_argument("--format", type=str, default="gif", choices=["gif", "mp4"])
+    p.add_argument("--fps", type=int, default=25)
+    p.add_argument("--cell_size", type=int, default=10)
+    p.add_argument("--max_frames", type=int, default=1000, help="keep the last N frames of each clip (0 = all)")
+    p.add_argument("--frame_skip", type=int, default=1)
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--out_dir", type=str, default="./highlights")
+    args = p.parse_args(argv)
+
+    if args.replays:
+        rows, records = evaluate_replays(args.replays)
+    else:
+        detector = {"loop_repeats": args.loop_repeats, "stall_steps": args.stall_steps}
+        rows, records = evaluate_model(args.model_path, args.episodes, args.reward_mode, args.seed, args.grid,
+                                       args.frame_stack, args.action_mask, detector)
+    values = np.array([row[args.metric] for row in rows], dtype=np.float64)
+    chosen = pick_episodes(values, [s.strip() for s in args.picks.split(",")], args.per_pick)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs, listing = [], []
+    for pick, i in chosen:
+        record = records[i]
+        path = os.path.join(args.out_dir, f"{pick}_ep{i + 1}_{args.metric}{values[i]:g}_seed{record.seed}.{args.format}")
+        jobs.append((record, path, args.fps, args.cell_size, args.max_frames or None, args.frame_skip))
+        listing.append({"pick": pick, "episode": i + 1, "seed": record.seed, "path": path, **rows[i]})
+
+    print(f"Evaluated {len(rows)} episodes, rendering {len(jobs)} clips with {args.workers} workers")
+    if jobs:  # a Pool of zero workers raises; still write the (empty) listing below
+        with mp.get_context("spawn").Pool(min(args.workers, len(jobs))) as pool:
+            for path in pool.starmap(encode_clip, jobs):
+                print(f"Saved {path}")
+
+    with open(os.path.join(args.out_dir, "highlights.json"), "w") as f:
+        json.dump(listing, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# Parallel hyperparameter search for PPO with ASHA (asynchronous successive halving).
+#
+# Every trial starts with a small timestep budget. When a trial finishes a rung it is
+# scored with EvalCallback; only the top 1/eta of each rung gets promoted and continues
+# training (from its saved model) up to the next rung's budget. Bad configs therefore
+# die after min_timesteps instead of running for max_timesteps.
+#
+#   python hpsearch.py --trials 27 --workers 4 --min_timesteps 20000 --max_timesteps 540000
+#
+# Trials train on their sampled reward weights but are all scored on the default ones, so
+# rung scores stay comparable. n_steps choices are limited to the first rung and the rung
+# budgets rounded up to a multiple of them: PPO stops at whole rollouts, and every trial
+# then stops exactly at each rung budget.
+#
+# Results go to results/hpsearch/<study>/: trials.jsonl (one line per finished rung)
+# and summary.json (best config so far). A trial that raises is logged as failed and
+# never promoted; the study carries on without it.
+import argparse
+import concurrent.futures as cf
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+
+# name -> (kind, *args). "w_" entries are SnakeEnv reward weights.
+SEARCH_SPACE = {
+    "ent_coef": ("log", 1e-3, 0.1),
+    "gamma": ("choice", [0.98, 0.99, 0.995, 0.999]),
+    "n_steps": ("choice", [256, 512, 1024, 2048]),
+    "clip_range": ("uniform", 0.1, 0.3),
+    "w_death_penalty": ("uniform", 10.0, 100.0),
+    "w_food_eaten": ("uniform", 10.0, 100.0),
+    "w_move_closer": ("uniform", 0.0, 2.0),
+    "w_move_away": ("uniform", 0.0, 1.0),
+}
+
+
+def sample_config(rng, space=SEARCH_SPACE):
+    config = {}
+    for name, (kind, *spec) in space.items():
+        if kind == "choice":
+            config[name] = rng.choice(spec[0])
+        elif kind == "log":
+            config[name] = math.exp(rng.uniform(math.log(spec[0]), math.log(spec[1])))
+        else:
+            config[name] = rng.uniform(spec[0], spec[1])
+    return config
+
+
+def split_config(config):
+    # -> (PPO overrides, reward weights)
+    ppo = {k: v for k, v in config.items() if not k.startswith("w_")}
+    weights = {k[2:]: v for k, v in config.items() if k.startswith("w_")}
+    return ppo, weights
+
+
+def fit_rollouts(space, min_timesteps):
+    # -> (space with the n_steps choices that fit the first rung, first rung rounded up to a
+    # multiple of all of them)
+    choices = [n for n in space["n_steps"][1] if n <= min_timesteps]
+    if not choices:
+        raise ValueError(f"min_timesteps {min_timesteps} is below every n_steps choice {space['n_steps'][1]}")
+    step = math.lcm(*choices)
+    return {**space, "n_steps": ("choice", choices)}, -(-min_timesteps // step) * step
+
+
+def rung_budgets(min_timesteps, max_timesteps, eta):
+    budgets = [min_timesteps]
+    while budgets[-1] * eta <= max_timesteps:
+        budgets.append(budgets[-1] * eta)
+    return budgets
+
+
+def run_trial(trial_dir, config, budget, reward_mode, seed, n_eval_episodes):
+    # Runs in a worker process: train one trial up to `budget` total timesteps and score it.
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.callbacks import EvalCallback
+    from train_ppo import make_env, make_model
+
+    torch.set_num_threads(1)  # one core per trial, the pool provides the parallelism
+    start = time.time()
+    ppo_kwargs, weights = split_config(config)
+    env = make_env(reward_mode=reward_mode, seed=seed, reward_weights=weights)
+    # scored on the full game with the default reward weights: a fresh eval env would
+    # otherwise replay the same first curriculum episodes (food next to the head) at every
+    # rung, and each trial's own weights would put every score on a different scale
+    eval_env = make_env(reward_mode=reward_mode, seed=seed + 100, curriculum=False)
+
+    model_path = os.path.join(trial_dir, "model.zip")
+    state_path = os.path.join(trial_dir, "state.json")
+    if os.path.exists(model_path):
+        model = PPO.load(model_path, env=env)
+        # a promoted trial continues where its last rung stopped: past the curriculum
+        # episodes it has already played, and on new episodes rather than a replay of them
+        model.set_random_seed(seed + model.num_timesteps)
+        with open(state_path) as f:
+            env.unwrapped.episode_counter = json.load(f)["episode_counter"]
+    else:
+        model = make_model(env, seed=seed, verbose=0, **ppo_kwargs)
+
+    steps = max(budget - model.num_timesteps, 1)
+    # eval_freq == steps fires exactly once, at the end of this rung
+    eval_callback = EvalCallback(
+        eval_env,
+        best_model_save_path=trial_dir,
+        eval_freq=steps,
+        n_eval_episodes=n_eval_episodes,
+        deterministic=True,
+        verbose=0,
+    )
+    model.learn(total_timesteps=steps, reset_num_timesteps=False, callback=eval_callback)
+    model.save(model_path)
+    with open(state_path, "w") as f:
+        json.dump({"episode_counter": env.unwrapped.episode_counter}, f)
+    env.close()
+    eval_env.close()
+    return {
+        "score": float(eval_callback.last_mean_reward),
+        "timesteps": int(model.num_timesteps),
+        "wall_clock": time.time() - start,
+    }
+
+
+class ASHA:
+    def __init__(self, n_trials, budgets, eta, rng, space=SEARCH_SPACE):
+        self.n_trials = n_trials
+        self.space = space
+        self.budgets = budgets
+        self.eta = eta
+        self.rng = rng
+        self.configs = {}
+        self.rungs = [{} for _ in budgets]      # rung -> {trial_id: score}
+        self.promoted = [set() for _ in budgets]
+
+    def next_job(self):
+        # Promote from the highest rung possible first, otherwise start a new trial.
+        for rung in reversed(range(len(self.budgets) - 1)):
+            results = self.rungs[rung]
+            top_k = len(results) // self.eta
+            ranked = sorted(results, key=results.get, reverse=True)[:top_k]
+            for trial_id in ranked:
+                if trial_id not in self.promoted[rung]:
+                    self.promoted[rung].add(trial_id)
+                    return trial_id, rung + 1
+        if len(self.configs) < self.n_trials:
+            trial_id = len(self.configs)
+            self.configs[trial_id] = sample_config(self.rng, self.space)
+            return trial_id, 0
+        return None
+
+    def report(self, trial_id, rung, score):
+        self.rungs[rung][trial_id] = score
+
+    def best(self):
+        for rung in reversed(range(len(self.budgets))):
+            if self.rungs[rung]:
+                results = self.rungs[rung]
+                trial_id = max(results, key=results.get)
+                return {"trial": trial_id, "rung": rung, "score": results[trial_id],
+                        "config": self.configs[trial_id]}
+        return None
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--study", type=str, default=time.strftime("study_%Y%m%d_%H%M%S"))
+    p.add_argument("--trials", type=int, default=27)
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--min_timesteps", type=int, default=20_000)
+    p.add_argument("--max_timesteps", type=int, default=540_000)
+    p.add_argument("--eta", type=int, default=3)
+    p.add_argument("--n_eval_episodes", type=int, default=5)
+    p.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--results", type=str, default="./results/hpsearch")
+    args = p.parse_args(argv)
+
+    study_dir = os.path.join(args.results, args.study)
+    os.makedirs(study_dir, exist_ok=True)
+    space, min_timesteps = fit_rollouts(SEARCH_SPACE, args.min_timesteps)
+    budgets = rung_budgets(min_timesteps, args.max_timesteps, args.eta)
+    asha = ASHA(args.trials, budgets, args.eta, random.Random(args.seed), space)
+    print(f"Study {args.study}: {args.trials} trials, rung budgets {budgets}, {args.workers} workers")
+
+    trials_log = os.path.join(study_dir, "trials.jsonl")
+    running = {}
+    # spawn: torch does not survive fork() well once it has started threads
+    with cf.ProcessPoolExecutor(args.workers, mp_context=mp.get_context("spawn")) as pool:
+        while True:
+            while len(running) < args.workers:
+                job = asha.next_job()
+                if job is None:
+                    break
+                trial_id, rung = job
+                trial_dir = os.path.join(study_dir, f"trial_{trial_id:03d}")
+                os.makedirs(trial_dir, exist_ok=True)
+                future = pool.submit(run_trial, trial_dir, asha.configs[trial_id], budgets[rung],
+                                     args.reward_mode, args.seed + trial_id, args.n_eval_episodes)
+                running[future] = (trial_id, rung)
+            if not running:
+                break
+
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for future in done:
+                trial_id, rung = running.pop(future)
+                row = {"trial": trial_id, "rung": rung, "budget": budgets[rung], "config": asha.configs[trial_id]}
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # not reported to ASHA, so never promoted
+                    with open(trials_log, "a") as f:
+                        f.write(json.dumps({**row, "failed": f"{type(e).__name__}: {e}"}) + "\n")
+                    print(f"trial {trial_id:3d} rung {rung} failed: {type(e).__name__}: {e}")
+                    continue
+                asha.report(trial_id, rung, result["score"])
+                with open(trials_log, "a") as f:
+                    f.write(json.dumps({**row, **result}) + "\n")
+                print(f"trial {trial_id:3d} rung {rung} ({result['timesteps']} steps): "
+                      f"score {result['score']:.2f} in {result['wall_clock']:.0f}s")
+
+                with open(os.path.join(study_dir, "summary.json"), "w") as f:
+                    json.dump({"budgets": budgets, "eta": args.eta, "best": asha.best()}, f, indent=2)
+
+    best = asha.best()
+    if best is None:
+        print("Every trial failed, see " + trials_log)
+        return
+    print(f"Best trial {best['trial']} (rung {best['rung']}): score {best['score']:.2f}")
+    print(json.dumps(best["config"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Constant-memory, mergeable episode metrics for large evaluation runs.
+#
+# MetricsCollector keeps, per metric, Welford running moments, a relative-error quantile
+# sketch (DDSketch style log buckets) and optionally an integer histogram. Collectors
+# from parallel workers merge exactly (moments, histograms) or within the sketch's
+# relative accuracy (quantiles), so memory does not grow with the episode count.
+import json
+import math
+
+
+class RunningMoments:
+    # Welford's running mean/variance with Chan et al.'s parallel merge
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def var(self):
+        # sample variance
+        return self.m2 / (self.n - 1) if self.n > 1 else math.inf
+
+    @property
+    def std(self):
+        # population std, matching np.std
+        return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch with relative accuracy ``alpha``: every quantile it
+    returns is within a factor (1 +/- alpha) of the true one. Bucket counts are the
+    whole state, so two sketches merge by adding counts. Once there are more than
+    ``max_buckets`` buckets per sign, the ones closest to zero are collapsed.
+    """
+
+    def __init__(self, alpha=0.01, max_buckets=2048):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def _key(self, x):
+        return math.ceil(math.log(x) / self._log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, x):
+        self.count += 1
+        if x > 0:
+            store = self.positive
+        elif x < 0:
+            store, x = self.negative, -x
+        else:
+            self.zero += 1
+            return
+        key = self._key(x)
+        store[key] = store.get(key, 0) + 1
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+
+    def _collapse(self, store):
+        keys = sorted(store)
+        excess = len(keys) - self.max_buckets
+        folded = sum(store.pop(k) for k in keys[:excess + 1])
+        store[keys[excess]] = folded
+
+    def merge(self, other):
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in theirs.items():
+                mine[key] = mine.get(key, 0) + n
+            if len(mine) > self.max_buckets:
+                self._collapse(mine)
+        self.zero += other.zero
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        # walk from the most negative value upward
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+
+class Histogram:
+    # Sparse fixed-width histogram: bin index -> count
+    def __init__(self, bin_width=1):
+        self.bin_width = bin_width
+        self.counts = {}
+
+    def add(self, x):
+        b = int(math.floor(x / self.bin_width))
+        self.counts[b] = self.counts.get(b, 0) + 1
+
+    def merge(self, other):
+        for b, n in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + n
+        return self
+
+    def to_dict(self):
+        return {str(b * self.bin_width): self.counts[b] for b in sorted(self.counts)}
+
+
+class MetricsCollector:
+    # histograms: metric name -> bin width, for the metrics that get a histogram
+    def __init__(self, histograms=None, alpha=0.01, quantiles=(0.1, 0.5, 0.9, 0.99)):
+        self.histogram_bins = dict(histograms or {})
+        self.alpha = alpha
+        self.quantiles = quantiles
+        self.moments = {}
+        self.sketches = {}
+        self.histograms = {}
+
+    def _ensure(self, key):
+        if key not in self.moments:
+            self.moments[key] = RunningMoments()
+            self.sketches[key] = QuantileSketch(self.alpha)
+            if key in self.histogram_bins:
+                self.histograms[key] = Histogram(self.histogram_bins[key])
+
+    def add(self, row):
+        for key, value in row.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            self._ensure(key)
+            self.moments[key].add(value)
+            self.sketches[key].add(value)
+            if key in self.histograms:
+                self.histograms[key].add(value)
+
+    def merge(self, other):
+        for key in other.moments:
+            self._ensure(key)
+            self.moments[key].merge(other.moments[key])
+            self.sketches[key].merge(other.sketches[key])
+            if key in other.histograms:
+                self.histograms[key].merge(other.histograms[key])
+        return self
+
+    @property
+    def n_episodes(self):
+        return max((m.n for m in self.moments.values()), default=0)
+
+    def mean(self, key):
+        return self.moments[key].mean
+
+    def summary(self):
+        out = {"episodes": self.n_episodes, "metrics": {}}
+        for key, m in self.moments.items():
+            stats = {"mean": m.mean, "std": m.std, "min": m.min, "max": m.max}
+            for q in self.quantiles:
+                stats[f"p{round(q * 100):d}"] = self.sketches[key].quantile(q)
+            if key in self.histograms:
+                stats["histogram"] = self.histograms[key].to_dict()
+            out["metrics"][key] = stats
+        return out
+
+
+class ChunkedJSONLWriter:
+    # Appends per-episode rows to a JSON-lines file in chunks of `chunk_size` rows.
+    def __init__(self, path, chunk_size=1000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._buffer = []
+        open(path, "w").close()
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(row) + "\n" for row in self._buffer))
+        self._buffer = []
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,344 @@
+# Indexed manifest of saved models (SQLite), built without loading any weights.
+#
+# For every SB3 zip, scan() reads only the zip's central directory and its small `data`
+# JSON entry: algorithm, spaces, hyperparameters, timesteps. The content hash is a
+# SHA-256 over the (entry name, CRC-32, size) triples the zip already stores, so hashing
+# a 3 MB model reads a few hundred bytes. Files whose size and mtime are unchanged since
+# the last scan are not even opened. The env config is not part of SB3's zip; it is
+# taken from a `<model>.env.json` sidecar (written by the training scripts) when present.
+#
+# Eval results are cached per content hash, so renamed or copied models share them.
+#
+#   python model_registry.py scan newModels models
+#   python model_registry.py list --algo ppo --min_timesteps 500000 --name circles
+#   python model_registry.py show best_model_circles
+#   python model_registry.py eval best_model_circles --episodes 20
+#   python model_registry.py annotate best_model_circles --notes "goes in circles" --env '{"reward_mode": "length"}'
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zipfile
+
+DEFAULT_DB = "newModels/registry.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    algo TEXT,
+    sb3_version TEXT,
+    policy_class TEXT,
+    obs_shape TEXT,
+    obs_dtype TEXT,
+    n_actions INTEGER,
+    num_timesteps INTEGER,
+    total_timesteps INTEGER,
+    seed INTEGER,
+    hyperparams TEXT,
+    env_config TEXT,
+    notes TEXT,
+    scanned_at REAL
+);
+CREATE INDEX IF NOT EXISTS models_hash ON models(content_hash);
+CREATE INDEX IF NOT EXISTS models_name ON models(name);
+CREATE INDEX IF NOT EXISTS models_algo_steps ON models(algo, num_timesteps);
+CREATE TABLE IF NOT EXISTS evals (
+    content_hash TEXT NOT NULL,
+    eval_key TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    created_at REAL,
+    PRIMARY KEY (content_hash, eval_key)
+);
+"""
+
+# plain-JSON hyperparameters worth keeping from the zip's `data` entry
+HYPERPARAMS = [
+    "learning_rate", "n_steps", "batch_size", "n_epochs", "gamma", "gae_lambda", "ent_coef",
+    "vf_coef", "max_grad_norm", "normalize_advantage", "use_rms_prop", "rms_prop_eps", "n_envs",
+]
+
+
+def connect(db_path=DEFAULT_DB):
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def content_hash(zf):
+    h = hashlib.sha256()
+    for info in sorted(zf.infolist(), key=lambda i: i.filename):
+        h.update(f"{info.filename}\0{info.CRC:08x}\0{info.file_size}\n".encode())
+    return h.hexdigest()
+
+
+def _algo(data):
+    if "clip_range" in data:
+        return "ppo"
+    if "use_rms_prop" in data:
+        return "a2c"
+    if "buffer_size" in data:
+        return "off_policy"
+    return None
+
+
+def _class_name(entry):
+    # serialized classes keep their repr in ":type:" and module in "__module__"
+    if not isinstance(entry, dict):
+        return None
+    module = entry.get("__module__")
+    doc = entry.get("__init__", "")
+    # "<function ActorCriticPolicy.__init__ at 0x...>" -> ActorCriticPolicy
+    name = doc.split()[1].split(".")[0] if doc.startswith("<function ") else None
+    return f"{module}.{name}" if module and name else module
+
+
+def env_config_path(model_path):
+    base = model_path[:-4] if model_path.endswith(".zip") else model_path
+    return base + ".env.json"
+
+
+def write_env_config(model_path, env_config):
+    # sidecar read by scan(); model_path with or without .zip
+    with open(env_config_path(model_path), "w") as f:
+        json.dump(env_config, f, indent=2)
+
+
+def read_metadata(path):
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        data = json.loads(zf.read("data")) if "data" in names else {}
+        version = zf.read("_stable_baselines3_version").decode().strip() \
+            if "_stable_baselines3_version" in names else None
+        digest = content_hash(zf)
+    obs = data.get("observation_space", {})
+    act = data.get("action_space", {})
+    env_config = None
+    if os.path.exists(env_config_path(path)):
+        with open(env_config_path(path), "r") as f:
+            env_config = json.load(f)
+    return {
+        "content_hash": digest,
+        "algo": _algo(data),
+        "sb3_version": version,
+        "policy_class": _class_name(data.get("policy_class")),
+        "obs_shape": json.dumps(list(obs["_shape"])) if "_shape" in obs else None,
+        "obs_dtype": obs.get("dtype"),
+        "n_actions": int(act["n"]) if "n" in act else None,
+        "num_timesteps": data.get("num_timesteps"),
+        "total_timesteps": data.get("_total_timesteps"),
+        "seed": data.get("seed"),
+        "hyperparams": json.dumps({k: data[k] for k in HYPERPARAMS if k in data}),
+        "env_config": json.dumps(env_config) if env_config is not None else None,
+    }
+
+
+def scan(conn, roots, force=False):
+    # -> (added or updated, unchanged, removed)
+    known = {row["path"]: row for row in conn.execute("SELECT path, size, mtime FROM models")}
+    updated, unchanged, seen = 0, 0, set()
+    for root in roots:
+        paths = [root] if root.endswith(".zip") else [
+            os.path.join(d, f) for d, _, files in os.walk(root) for f in files if f.endswith(".zip")]
+        for path in sorted(paths):
+            path = os.path.normpath(path)
+            seen.add(path)
+            st = os.stat(path)
+            row = known.get(path)
+            if not force and row is not None and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+                unchanged += 1
+                continue
+            try:
+                meta = read_metadata(path)
+            except (zipfile.BadZipFile, KeyError, ValueError) as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            # keep annotations made with `annotate` across rescans
+            old = conn.execute("SELECT notes, env_config FROM models WHERE path = ?", (path,)).fetchone()
+            if old is not None and meta["env_config"] is None:
+                meta["env_config"] = old["env_config"]
+            conn.execute(
+                "INSERT OR REPLACE INTO models VALUES (:path, :name, :content_hash, :size, :mtime, :algo, "
+                ":sb3_version, :policy_class, :obs_shape, :obs_dtype, :n_actions, :num_timesteps, "
+                ":total_timesteps, :seed, :hyperparams, :env_config, :notes, :scanned_at)",
+                {**meta, "path": path, "name": os.path.splitext(os.path.basename(path))[0],
+                 "size": st.st_size, "mtime": st.st_mtime, "notes": old["notes"] if old else None,
+                 "scanned_at": time.time()},
+            )
+            updated += 1
+    # drop rows for deleted files under the scanned roots
+    removed = 0
+    for path in known:
+        under = any(path == os.path.normpath(r) or path.startswith(os.path.normpath(r) + os.sep) for r in roots)
+        if under and path not in seen:
+            conn.execute("DELETE FROM models WHERE path = ?", (path,))
+            removed += 1
+    conn.commit()
+    return updated, unchanged, removed
+
+
+def query(conn, name=None, algo=None, obs_shape=None, min_timesteps=None, reward_mode=None, order="name"):
+    clauses, params = [], []
+    if name:
+        clauses.append("m.name LIKE ?")
+        params.append(f"%{name}%")
+    if algo:
+        clauses.append("m.algo = ?")
+        params.append(algo)
+    if obs_shape:
+        clauses.append("m.obs_shape = ?")
+        params.append(json.dumps(list(obs_shape)))
+    if min_timesteps is not None:
+        clauses.append("m.num_timesteps >= ?")
+        params.append(min_timesteps)
+    if reward_mode:
+        clauses.append("json_extract(m.env_config, '$.reward_mode') = ?")
+        params.append(reward_mode)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order_by = {"name": "m.name", "timesteps": "m.num_timesteps DESC", "score": "score DESC",
+                "recent": "m.mtime DESC"}[order]
+    # the most recent cached eval's mean score, if any
+    sql = f"""
+        SELECT m.*, (SELECT json_extract(e.metrics, '$.metrics.score.mean') FROM evals e
+                     WHERE e.content_hash = m.content_hash ORDER BY e.created_at DESC LIMIT 1) AS score
+        FROM models m {where} ORDER BY {order_by}
+    """
+    return conn.execute(sql, params).fetchall()
+
+
+def resolve(conn, key):
+    # a path, a unique name or a content hash prefix -> model row
+    rows = conn.execute(
+        "SELECT * FROM models WHERE path = ? OR name = ? OR content_hash LIKE ?",
+        (os.path.normpath(key), key, f"{key}%")).fetchall()
+    if not rows:
+        raise KeyError(f"no model matches {key!r}")
+    if len({r["content_hash"] for r in rows}) > 1:
+        raise KeyError(f"{key!r} is ambiguous: " + ", ".join(r["path"] for r in rows))
+    return rows[0]
+
+
+def cached_eval(conn, digest, eval_key):
+    row = conn.execute("SELECT metrics FROM evals WHERE content_hash = ? AND eval_key = ?",
+                       (digest, eval_key)).fetchone()
+    return json.loads(row["metrics"]) if row else None
+
+
+def store_eval(conn, digest, eval_key, metrics):
+    conn.execute("INSERT OR REPLACE INTO evals VALUES (?, ?, ?, ?)",
+                 (digest, eval_key, json.dumps(metrics), time.time()))
+    conn.commit()
+
+
+def evaluate_model(conn, row, episodes=20, seed=7, reward_mode=None, force=False):
+    # summary of eval.py metrics, computed once per (content, eval settings)
+    if reward_mode is None:
+        env_config = json.loads(row["env_config"]) if row["env_config"] else {}
+        reward_mode = env_config.get("reward_mode", "length")
+    eval_key = json.dumps({"episodes": episodes, "seed": seed, "reward_mode": reward_mode}, sort_keys=True)
+    if not force:
+        cached = cached_eval(conn, row["content_hash"], eval_key)
+        if cached is not None:
+            return cached, True
+    from eval import HISTOGRAMS, episode_runner, evaluate, make_eval_env
+    from metrics import MetricsCollector
+    from numpy_policy import load_policy
+
+    model = load_policy(row["path"][:-4] if row["path"].endswith(".zip") else row["path"], device="cpu")
+    env = make_eval_env(reward_mode, seed=seed)
+    collector = evaluate(episode_runner(model, env), episodes, MetricsCollector(HISTOGRAMS), base_seed=seed)
+    env.close()
+    metrics = collector.summary()
+    store_eval(conn, row["content_hash"], eval_key, metrics)
+    return metrics, False
+
+
+def _fmt(value, width):
+    text = "-" if value is None else str(value)
+    return text[:width].ljust(width)
+
+
+def print_rows(rows):
+    print(f"{'name':<48} {'algo':<5} {'obs':<12} {'timesteps':>10} {'score':>7}  hash")
+    for r in rows:
+        shape = ",".join(str(d) for d in json.loads(r["obs_shape"])) if r["obs_shape"] else None
+        score = f"{r['score']:.2f}" if r["score"] is not None else "-"
+        print(f"{_fmt(r['name'], 48)} {_fmt(r['algo'], 5)} {_fmt(shape, 12)} "
+              f"{r['num_timesteps'] if r['num_timesteps'] is not None else '-':>10} {score:>7}  {r['content_hash'][:12]}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=str, default=DEFAULT_DB)
+    sub = p.add_subparsers(dest="which", required=True)
+    scan_p = sub.add_parser("scan", help="index model zips under the given folders (metadata only)")
+    scan_p.add_argument("roots", nargs="*", default=["newModels", "models"])
+    scan_p.add_argument("--force", action="store_true", help="re-read files even if size/mtime are unchanged")
+    list_p = sub.add_parser("list")
+    list_p.add_argument("--name", type=str, default=None, help="substring of the file name")
+    list_p.add_argument("--algo", type=str, default=None, choices=["ppo", "a2c"])
+    list_p.add_argument("--obs_shape", type=str, default=None, help="e.g. 3,20,30")
+    list_p.add_argument("--min_timesteps", type=int, default=None)
+    list_p.add_argument("--reward_mode", type=str, default=None)
+    list_p.add_argument("--sort", type=str, default="name", choices=["name", "timesteps", "score", "recent"])
+    show_p = sub.add_parser("show")
+    show_p.add_argument("model", help="path, name or content hash prefix")
+    eval_p = sub.add_parser("eval", help="evaluate and cache the metrics (reused for identical content)")
+    eval_p.add_argument("model")
+    eval_p.add_argument("--episodes", type=int, default=20)
+    eval_p.add_argument("--seed", type=int, default=7)
+    eval_p.add_argument("--reward_mode", type=str, default=None)
+    eval_p.add_argument("--force", action="store_true")
+    note_p = sub.add_parser("annotate")
+    note_p.add_argument("model")
+    note_p.add_argument("--notes", type=str, default=None)
+    note_p.add_argument("--env", type=str, default=None, help="env config as JSON")
+    args = p.parse_args(argv)
+
+    conn = connect(args.db)
+    if args.which == "scan":
+        roots = [r for r in args.roots if os.path.exists(r)]
+        start = time.perf_counter()
+        updated, unchanged, removed = scan(conn, roots, args.force)
+        print(f"Indexed {updated} models ({unchanged} unchanged, {removed} removed) "
+              f"in {time.perf_counter() - start:.3f}s -> {args.db}")
+    elif args.which == "list":
+        shape = tuple(int(d) for d in args.obs_shape.split(",")) if args.obs_shape else None
+        print_rows(query(conn, args.name, args.algo, shape, args.min_timesteps, args.reward_mode, args.sort))
+    elif args.which == "show":
+        row = dict(resolve(conn, args.model))
+        for key in ("hyperparams", "env_config"):
+            row[key] = json.loads(row[key]) if row[key] else None
+        evals = conn.execute("SELECT eval_key, metrics, created_at FROM evals WHERE content_hash = ?",
+                             (row["content_hash"],)).fetchall()
+        row["evals"] = [{"settings": json.loads(e["eval_key"]),
+                         "score_mean": json.loads(e["metrics"])["metrics"]["score"]["mean"],
+                         "reward_mean": json.loads(e["metrics"])["metrics"]["reward"]["mean"]} for e in evals]
+        print(json.dumps(row, indent=2))
+    elif args.which == "eval":
+        metrics, cached = evaluate_model(conn, resolve(conn, args.model), args.episodes, args.seed,
+                                         args.reward_mode, args.force)
+        m = metrics["metrics"]
+        print(f"{'Cached' if cached else 'Evaluated'}: {metrics['episodes']} episodes, "
+              f"mean reward {m['reward']['mean']:.2f}, mean score {m['score']['mean']:.2f}")
+    else:
+        row = resolve(conn, args.model)
+        if args.notes is not None:
+            conn.execute("UPDATE models SET notes = ? WHERE content_hash = ?", (args.notes, row["content_hash"]))
+        if args.env is not None:
+            conn.execute("UPDATE models SET env_config = ? WHERE content_hash = ?",
+                         (json.dumps(json.loads(args.env)), row["content_hash"]))
+        conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
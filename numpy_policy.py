@@ -0,0 +1,326 @@
+# NumPy-only inference for MlpPolicy models.
+#
+# export_policy() pulls the actor half of an SB3 ActorCriticPolicy (policy_net layers +
+# action_net) out of a model zip into a small .npz. NumpyPolicy runs it with plain
+# NumPy, with the same predict() signature as SB3, so eval/visualize workers can skip
+# torch entirely:
+#
+#   python numpy_policy.py export newModels/bestModels/best_model_circles.zip
+#   python numpy_policy.py export newModels/bestModels/best_model_circles.zip --dtype int8
+#   python numpy_policy.py check newModels/bestModels/best_model_circles.zip --episodes 5
+#   python eval.py --model_path newModels/bestModels/best_model_circles.npz
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    "identity": lambda x: x,
+}
+
+
+def policy_arrays(zip_path):
+    # -> (arrays, meta) of the actor network in an SB3 zip. Needs SB3/torch, at export time only.
+    from stable_baselines3.common.save_util import load_from_zip_file
+
+    data, params, _ = load_from_zip_file(zip_path, device="cpu")
+    state = params["policy"]
+    if any("features_extractor" in k for k in state):
+        raise ValueError(f"{zip_path}: only MlpPolicy (flatten features) can be exported")
+
+    policy_kwargs = data.get("policy_kwargs") or {}
+    activation = policy_kwargs.get("activation_fn")
+    activation = activation.__name__.lower() if activation is not None else "tanh"
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"{zip_path}: unsupported activation {activation}")
+
+    # policy_net is a Sequential of Linear/activation pairs: keys policy_net.0, .2, ...
+    layer_ids = sorted({int(k.split(".")[2]) for k in state if k.startswith("mlp_extractor.policy_net.")})
+    arrays = {}
+    for i, layer in enumerate(layer_ids):
+        arrays[f"w{i}"] = state[f"mlp_extractor.policy_net.{layer}.weight"].numpy().astype(np.float32)
+        arrays[f"b{i}"] = state[f"mlp_extractor.policy_net.{layer}.bias"].numpy().astype(np.float32)
+    arrays["action_w"] = state["action_net.weight"].numpy().astype(np.float32)
+    arrays["action_b"] = state["action_net.bias"].numpy().astype(np.float32)
+
+    obs_space = data["observation_space"]
+    meta = {
+        "n_layers": len(layer_ids),
+        "obs_shape": [int(d) for d in obs_space.shape],
+        "activation": activation,
+        "normalize": bool(policy_kwargs.get("normalize_images", True)) and obs_space.dtype == np.uint8,
+    }
+    return arrays, meta
+
+
+def export_policy(zip_path, out_path=None):
+    arrays, meta = policy_arrays(zip_path)
+    out_path = out_path or os.path.splitext(zip_path)[0] + ".npz"
+    np.savez(
+        out_path,
+        n_layers=meta["n_layers"],
+        obs_shape=np.array(meta["obs_shape"]),
+        activation=meta["activation"],
+        normalize=meta["normalize"],
+        **arrays,
+    )
+    return out_path
+
+
+# Compact single-file artifacts (.policy) for deployment:
+#   MAGIC | uint32 header length | JSON header | arrays, each 64-byte aligned
+# The header lists every array's dtype/shape/offset. Weight matrices are stored as
+# float32, float16 or int8 with one float32 scale per output row (symmetric); biases
+# stay float32. load_compact() memory-maps the file, so float32 weights are zero-copy
+# views shared by every process that maps the same file; float16/int8 weights are
+# dequantized once per process from the mapping.
+MAGIC = b"SNKPOL01"
+ALIGN = 64
+WEIGHT_DTYPES = ["float32", "float16", "int8"]
+
+
+def _quantize(w, dtype):
+    if dtype == "float32":
+        return {"": w.astype(np.float32)}
+    if dtype == "float16":
+        return {"": w.astype(np.float16)}
+    scale = np.abs(w).max(axis=1, keepdims=True) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(w / scale), -127, 127).astype(np.int8)
+    return {"": q, "_scale": scale.astype(np.float32)}
+
+
+def save_compact(path, arrays, meta, dtype="float16"):
+    if dtype not in WEIGHT_DTYPES:
+        raise ValueError(f"dtype must be one of {WEIGHT_DTYPES}")
+    stored = {}
+    for name, value in arrays.items():
+        if value.ndim == 2:
+            for suffix, part in _quantize(value, dtype).items():
+                stored[name + suffix] = part
+        else:
+            stored[name] = value.astype(np.float32)
+
+    entries, offset = {}, 0
+    for name, value in stored.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        entries[name] = {"dtype": value.dtype.str, "shape": list(value.shape), "offset": offset}
+        offset += value.nbytes
+    header = json.dumps({**meta, "weight_dtype": dtype, "arrays": entries}).encode()
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // ALIGN) * ALIGN
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, value in stored.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(value).tobytes())
+    return path
+
+
+def load_compact(path, **kwargs):
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buf[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a compact policy file")
+    (header_len,) = struct.unpack("<I", bytes(buf[len(MAGIC):len(MAGIC) + 4]))
+    header = json.loads(bytes(buf[len(MAGIC) + 4:len(MAGIC) + 4 + header_len]))
+    data_start = -(-(len(MAGIC) + 4 + header_len) // ALIGN) * ALIGN
+
+    def array(name):
+        entry = header["arrays"][name]
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        start = data_start + entry["offset"]
+        return buf[start:start + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+
+    def weight(name):
+        w = array(name)
+        if w.dtype == np.float32:
+            return w
+        if w.dtype == np.int8:
+            return w.astype(np.float32) * array(name + "_scale")
+        return w.astype(np.float32)
+
+    layers = [(weight(f"w{i}"), array(f"b{i}")) for i in range(header["n_layers"])]
+    policy = NumpyPolicy(layers, weight("action_w"), array("action_b"), header["obs_shape"],
+                         header["activation"], header["normalize"], **kwargs)
+    policy.weight_dtype = header["weight_dtype"]
+    return policy
+
+
+def export_compact(source, out_path=None, dtype="float16"):
+    # source: SB3 zip or a .npz from export_policy()
+    if source.endswith(".npz"):
+        f = np.load(source)
+        arrays = {k: f[k] for k in f.files if k.startswith(("w", "b", "action_"))}
+        meta = {"n_layers": int(f["n_layers"]), "obs_shape": [int(d) for d in f["obs_shape"]],
+                "activation": str(f["activation"]), "normalize": bool(f["normalize"])}
+    else:
+        arrays, meta = policy_arrays(source)
+    out_path = out_path or f"{os.path.splitext(source)[0]}.{dtype}.policy"
+    return save_compact(out_path, arrays, meta, dtype)
+
+
+class NumpyPolicy:
+    def __init__(self, layers, action_w, action_b, obs_shape, activation="tanh", normalize=True, seed=None,
+                 masked=False):
+        self.layers = layers  # list of (W, b), W shaped (out, in) like torch
+        # masked: an exported MaskablePPO policy, played with the env's action masks (see
+        # adaptive_eval.uses_action_masks); predict() applies masks whenever it gets them
+        self.masked = masked
+        self.action_w = action_w
+        self.action_b = action_b
+        self.obs_shape = tuple(int(d) for d in obs_shape)
+        self.activation = ACTIVATIONS[activation]
+        self.normalize = normalize
+        self.rng = np.random.default_rng(seed)
+        # SB3 trains image policies on channel-first obs; raw SnakeEnv obs are channel-last
+        c, h, w = self.obs_shape if len(self.obs_shape) == 3 else (None, None, None)
+        self._channel_last = (h, w, c) if c is not None else None
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        f = np.load(path)
+        layers = [(f[f"w{i}"], f[f"b{i}"]) for i in range(int(f["n_layers"]))]
+        return cls(layers, f["action_w"], f["action_b"], f["obs_shape"],
+                   str(f["activation"]), bool(f["normalize"]), **kwargs)
+
+    def _as_batch(self, obs):
+        obs = np.asarray(obs)
+        n = len(self.obs_shape)
+        single = obs.ndim == n
+        if single:
+            obs = obs[None]
+        if obs.shape[1:] != self.obs_shape:
+            if obs.shape[1:] != self._channel_last:
+                raise ValueError(f"observation shape {obs.shape[1:]} does not match policy {self.obs_shape}")
+            obs = obs.transpose(0, 3, 1, 2)
+        return obs.reshape(len(obs), -1), single
+
+    def logits(self, obs):
+        x, _ = self._as_batch(obs)
+        x = x.astype(np.float32)
+        if self.normalize:
+            x /= np.float32(255.0)
+        for w, b in self.layers:
+            x = self.activation(x @ w.T + b)
+        return x @ self.action_w.T + self.action_b
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True, action_masks=None):
+        # same return convention as SB3: (actions, None); a scalar array for a single obs.
+        # action_masks: False entries can not be picked, like MaskablePPO.predict
+        logits = self.logits(obs)
+        if action_masks is not None:
+            logits = np.where(np.asarray(action_masks, dtype=bool).reshape(logits.shape), logits, -np.inf)
+        if deterministic:
+            actions = logits.argmax(axis=1)
+        else:
+            p = np.exp(logits - logits.max(axis=1, keepdims=True))
+            p /= p.sum(axis=1, keepdims=True)
+            u = self.rng.random((len(p), 1))
+            actions = (p.cumsum(axis=1) < u).sum(axis=1)
+        single = np.asarray(obs).ndim == len(self.obs_shape)
+        return (actions[0] if single else actions), None
+
+
+def load_policy(path, device="auto", masked=False):
+    # .npz / .policy -> NumpyPolicy (no torch); unix:/tcp: -> client of a running
+    # policy_server.py; anything else is treated as an SB3 PPO zip (sb3_contrib's
+    # MaskablePPO with masked)
+    if path.endswith((".npz", ".policy")):
+        policy = NumpyPolicy.load(path) if path.endswith(".npz") else load_compact(path)
+        policy.masked = masked
+        return policy
+    if path.startswith(("unix:", "tcp:")):
+        from policy_server import PolicyClient
+        return PolicyClient(path, masked=masked)
+    if masked:
+        from sb3_contrib import MaskablePPO
+        return MaskablePPO.load(path, device=device)
+    from stable_baselines3 import PPO
+    return PPO.load(path, device=device)
+
+
+def policy_exists(path):
+    if path.startswith(("unix:", "tcp:")):
+        return True
+    return os.path.exists(path) if path.endswith((".npz", ".policy")) else os.path.exists(path + ".zip") or os.path.exists(path)
+
+
+def compare_actions(reference, candidate, episodes=5, seed=7, reward_mode="length", max_steps=None):
+    # Play seeded episodes with `reference` and count how often `candidate` picks the
+    # same deterministic action on the same observations.
+    from snake_env import SnakeEnv
+
+    env = SnakeEnv(reward_mode=reward_mode, seed=seed, curriculum=False)
+    agree = total = 0
+    for ep in range(episodes):
+        obs, _ = env.reset(seed=seed + ep + 1)
+        done, steps = False, 0
+        while not done and (max_steps is None or steps < max_steps):
+            a_ref, _ = reference.predict(obs, deterministic=True)
+            a_new, _ = candidate.predict(obs, deterministic=True)
+            agree += int(a_ref) == int(a_new)
+            total += 1
+            obs, _, terminated, truncated, _ = env.step(int(a_ref))
+            done = terminated or truncated
+            steps += 1
+    env.close()
+    return {"steps": total, "agreement": agree / max(total, 1)}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest="which", required=True)
+    export_p = sub.add_parser("export", help="write <model>.npz (or a compact .policy file) next to each model zip")
+    export_p.add_argument("models", nargs="+")
+    export_p.add_argument("--out_dir", type=str, default=None)
+    export_p.add_argument("--dtype", type=str, default=None, choices=WEIGHT_DTYPES,
+                          help="write a memory-mappable <model>.<dtype>.policy instead of a .npz")
+    check_p = sub.add_parser("check", help="action agreement of the exports against the SB3 zip")
+    check_p.add_argument("model")
+    check_p.add_argument("--episodes", type=int, default=5)
+    check_p.add_argument("--seed", type=int, default=7)
+    check_p.add_argument("--dtypes", type=str, default="float32,float16,int8",
+                         help="compact weight formats to check besides the .npz export")
+    args = p.parse_args(argv)
+
+    if args.which == "export":
+        for path in args.models:
+            out = None
+            if args.out_dir:
+                os.makedirs(args.out_dir, exist_ok=True)
+                stem = os.path.splitext(os.path.basename(path))[0]
+                ext = f".{args.dtype}.policy" if args.dtype else ".npz"
+                out = os.path.join(args.out_dir, stem + ext)
+            out = export_compact(path, out, args.dtype) if args.dtype else export_policy(path, out)
+            print(f"{path} -> {out} ({os.path.getsize(out) / 1024:.0f} KiB)")
+        return
+
+    from stable_baselines3 import PPO
+    reference = PPO.load(args.model, device="cpu")
+    base = os.path.splitext(args.model)[0]
+    npz = base + ".npz"
+    if not os.path.exists(npz):
+        export_policy(args.model, npz)
+    candidates = [("npz float32", npz, NumpyPolicy.load)]
+    for dtype in filter(None, args.dtypes.split(",")):
+        path = export_compact(npz, f"{base}.{dtype}.policy", dtype)
+        candidates.append((f"policy {dtype}", path, load_compact))
+    print(f"{'format':<16} {'size KiB':>9} {'load ms':>8} {'agreement':>10}")
+    print(f"{'sb3 zip':<16} {os.path.getsize(args.model) / 1024:>9.0f}")
+    for label, path, loader in candidates:
+        start = time.perf_counter()
+        policy = loader(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        result = compare_actions(reference, policy, args.episodes, args.seed)
+        print(f"{label:<16} {os.path.getsize(path) / 1024:>9.0f} {load_ms:>8.2f} "
+              f"{result['agreement'] * 100:>9.2f}%  ({result['steps']} steps)")
+
+
+if __name__ == "__main__":
+    main()
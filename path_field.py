@@ -0,0 +1,132 @@
+# Shortest-path distances to the food around the snake's body (SnakeEnv path_distance).
+#
+# DistanceField holds BFS distances from one target cell to every free cell of the board
+# and keeps them exact as single cells are blocked (the head moves in) or freed (the tail
+# moves out), touching only the cells whose distance changes:
+#   - free(cell): distances can only shrink; a BFS from the freed cell lowers them.
+#   - block(cell): cells whose every shortest path ran through it are found level by
+#     level, reset, and re-settled from their unaffected neighbours.
+# A full BFS (rebuild) is only needed when the target moves, i.e. when food is eaten.
+#
+#   field = DistanceField(30, 20)
+#   field.rebuild(food, occupied_cells)
+#   field.block(new_head); field.free(old_tail)
+#   field.distance_from(head)   # moves from the head to the food, INF if walled off
+import heapq
+from collections import deque
+
+INF = 1 << 30
+
+
+class DistanceField:
+    def __init__(self, grid_w, grid_h):
+        self.w, self.h = grid_w, grid_h
+        self.neighbours = []
+        for y in range(grid_h):
+            for x in range(grid_w):
+                self.neighbours.append(tuple(
+                    nx + ny * grid_w for nx, ny in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y))
+                    if 0 <= nx < grid_w and 0 <= ny < grid_h
+                ))
+        self.dist = [INF] * (grid_w * grid_h)
+        self.blocked = bytearray(grid_w * grid_h)
+        self.target = None
+
+    def _index(self, cell):
+        x, y = cell
+        if 0 <= x < self.w and 0 <= y < self.h:
+            return x + y * self.w
+        return None
+
+    def rebuild(self, target, blocked_cells=()):
+        self.blocked = bytearray(self.w * self.h)
+        for cell in blocked_cells:
+            i = self._index(cell)
+            if i is not None:
+                self.blocked[i] = 1
+        self.target = self._index(target)
+        self.blocked[self.target] = 0  # food under the body still counts as reachable
+        dist, blocked, neighbours = [INF] * (self.w * self.h), self.blocked, self.neighbours
+        dist[self.target] = 0
+        queue = deque([self.target])
+        while queue:
+            a = queue.popleft()
+            d = dist[a] + 1
+            for n in neighbours[a]:
+                if d < dist[n] and not blocked[n]:
+                    dist[n] = d
+                    queue.append(n)
+        self.dist = dist
+
+    def free(self, cell):
+        i = self._index(cell)
+        if i is None or not self.blocked[i]:
+            return
+        self.blocked[i] = 0
+        dist, neighbours = self.dist, self.neighbours
+        dist[i] = min((dist[n] for n in neighbours[i]), default=INF - 1) + 1
+        if dist[i] >= INF:
+            dist[i] = INF
+            return
+        queue = deque([i])
+        while queue:
+            a = queue.popleft()
+            d = dist[a] + 1
+            for n in neighbours[a]:
+                if d < dist[n] and not self.blocked[n]:
+                    dist[n] = d
+                    queue.append(n)
+
+    def block(self, cell):
+        i = self._index(cell)
+        if i is None or i == self.target or self.blocked[i]:
+            return
+        dist, blocked, neighbours = self.dist, self.blocked, self.neighbours
+        blocked[i] = 1
+        d, dist[i] = dist[i], INF
+        if d >= INF:
+            return
+        # cells left without a neighbour one step closer to the target, in distance order
+        affected = set()
+        queue = deque(n for n in neighbours[i] if dist[n] == d + 1)
+        decided = set()
+        while queue:
+            a = queue.popleft()
+            if a in decided:
+                continue
+            decided.add(a)
+            da = dist[a]
+            if any(dist[p] == da - 1 and p not in affected for p in neighbours[a]):
+                continue
+            affected.add(a)
+            queue.extend(c for c in neighbours[a] if dist[c] == da + 1 and not blocked[c])
+        if not affected:
+            return
+        # re-settle them from the unaffected cells around them (Dijkstra over the region)
+        for a in affected:
+            dist[a] = INF
+        heap = []
+        for a in affected:
+            best = min((dist[n] for n in neighbours[a] if n not in affected), default=INF) + 1
+            if best < INF:
+                dist[a] = best
+                heap.append((best, a))
+        heapq.heapify(heap)
+        while heap:
+            da, a = heapq.heappop(heap)
+            if da > dist[a]:
+                continue
+            for c in neighbours[a]:
+                if c in affected and da + 1 < dist[c]:
+                    dist[c] = da + 1
+                    heapq.heappush(heap, (da + 1, c))
+
+    def distance_from(self, cell):
+        # moves from `cell` (e.g. the head, itself blocked) to the target; INF if there is no path
+        i = self._index(cell)
+        if i is None:
+            return INF
+        if i == self.target:
+            return 0
+        best = min((self.dist[n] for n in self.neighbours[i]), default=INF)
+        return best + 1 if best < INF else INF
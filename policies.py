@@ -0,0 +1,124 @@
+# Custom SB3 feature extractors for the grid observation.
+#
+# SmallCNN is a compact strided CNN for a fixed board size; it replaces MlpPolicy's
+# flatten + dense layers on the 20x30x3 grid. `--policy cnn` in the training scripts.
+#
+# GlobalPoolCNN is fully convolutional and ends in a global max/mean pool, so its weights
+# do not depend on the board size: a model trained on 10x10 can keep training (or play)
+# on 30x20 after its state dict is copied over (see board_curriculum.py).
+#
+#   from policies import GlobalPoolCNN
+#   PPO("MlpPolicy", env, policy_kwargs={"features_extractor_class": GlobalPoolCNN})
+#   PPO("MlpPolicy", env, policy_kwargs=policy_kwargs("cnn"))
+#
+# Both take channels_last=True for the frame stacks SB3 does not transpose (see
+# buffers.stays_channels_last) and move the channels first themselves.
+#
+# torch is imported at module level, so import this only where SB3 is already loaded.
+import torch
+from torch import nn
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+
+def _chw(shape, channels_last):
+    return (shape[2], shape[0], shape[1]) if channels_last else tuple(shape)
+
+
+class SmallCNN(BaseFeaturesExtractor):
+    # Input: (N, C, H, W) floats in [0, 1]. SB3 casts and scales the uint8 batch once in
+    # preprocess_obs, and PPO/A2C share the extractor between actor and critic, so the
+    # convolutions run once per forward pass. 20x30 -> 10x15 -> 5x8 with two stride-2
+    # 3x3 convolutions (kernel wider than the stride, so no single cell is skipped), then
+    # one linear layer: about a third of the parameters of MlpPolicy at a similar FLOP count.
+    def __init__(self, observation_space, features_dim=64, channels=(16, 32), channels_last=False):
+        super().__init__(observation_space, features_dim)
+        self.channels_last = channels_last
+        c, h, w = _chw(observation_space.shape, channels_last)
+        c1, c2 = channels
+        self.cnn = nn.Sequential(
+            nn.Conv2d(c, c1, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(c1, c2, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Flatten(),
+        )
+        with torch.no_grad():
+            n_flat = self.cnn(torch.zeros(1, c, h, w)).shape[1]
+        self.linear = nn.Sequential(nn.Linear(n_flat, features_dim), nn.ReLU())
+
+    def forward(self, obs):
+        if self.channels_last:
+            obs = obs.permute(0, 3, 1, 2)
+        return self.linear(self.cnn(obs))
+
+
+class GlobalPoolCNN(BaseFeaturesExtractor):
+    # Input: (N, C, H, W) floats in [0, 1] (SB3 transposes and scales uint8 images).
+    # Two coordinate channels in [-1, 1] are appended so pooled features can carry
+    # where the head and the food are (CoordConv); dilated convolutions widen the
+    # receptive field without striding away small boards.
+    def __init__(self, observation_space, features_dim=128, channels=32, channels_last=False):
+        super().__init__(observation_space, features_dim)
+        self.channels_last = channels_last
+        in_channels = _chw(observation_space.shape, channels_last)[0] + 2
+        self.convs = nn.Sequential(
+            nn.Conv2d(in_channels, channels, 3, padding=1), nn.ReLU(),
+            nn.Conv2d(channels, channels, 3, padding=2, dilation=2), nn.ReLU(),
+            nn.Conv2d(channels, channels * 2, 3, padding=4, dilation=4), nn.ReLU(),
+        )
+        self.head = nn.Sequential(nn.Linear(channels * 4, features_dim), nn.ReLU())
+        self._coords = {}
+
+    def _coord_channels(self, obs):
+        n, _, h, w = obs.shape
+        key = (h, w, obs.device, obs.dtype)
+        if key not in self._coords:
+            ys = torch.linspace(-1, 1, h, device=obs.device, dtype=obs.dtype)
+            xs = torch.linspace(-1, 1, w, device=obs.device, dtype=obs.dtype)
+            grid_y, grid_x = torch.meshgrid(ys, xs, indexing="ij")
+            self._coords[key] = torch.stack([grid_x, grid_y])[None]
+        return self._coords[key].expand(n, -1, -1, -1)
+
+    def forward(self, obs):
+        if self.channels_last:
+            obs = obs.permute(0, 3, 1, 2)
+        x = self.convs(torch.cat([obs, self._coord_channels(obs)], dim=1))
+        pooled = torch.cat([x.amax(dim=(2, 3)), x.mean(dim=(2, 3))], dim=1)
+        return self.head(pooled)
+
+
+EXTRACTORS = {"cnn": SmallCNN, "pool": GlobalPoolCNN}
+
+
+def policy_kwargs(name, channels_last=False):
+    # --policy choice of the training scripts -> SB3 policy_kwargs ("mlp": SB3's default)
+    if name == "mlp":
+        return {}
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown policy {name!r}, expected mlp or one of {sorted(EXTRACTORS)}")
+    kwargs = {"features_extractor_class": EXTRACTORS[name]}
+    if channels_last:
+        kwargs["features_extractor_kwargs"] = {"channels_last": True}
+    if name == "cnn":
+        # like SB3's CnnPolicy: actor and critic heads sit directly on the CNN features
+        kwargs["net_arch"] = []
+    return kwargs
+
+
+def forward_flops(module, obs_shape):
+    # multiply-adds x2 of Linear/Conv2d layers for one observation, counted with hooks
+    flops = []
+
+    def hook(layer, inputs, output):
+        if isinstance(layer, nn.Linear):
+            flops.append(2 * layer.in_features * layer.out_features)
+        else:
+            k = layer.in_channels // layer.groups * layer.kernel_size[0] * layer.kernel_size[1]
+            flops.append(2 * k * output[0].numel())
+
+    handles = [m.register_forward_hook(hook) for m in module.modules() if isinstance(m, (nn.Linear, nn.Conv2d))]
+    try:
+        with torch.no_grad():
+            module(torch.zeros(1, *obs_shape))
+    finally:
+        for h in handles:
+            h.remove()
+    return sum(flops)
@@ -0,0 +1,485 @@
+# Local policy inference server with dynamic batching.
+#
+# One process loads the policy (SB3 zip or NumPy .npz, see numpy_policy.py); any number
+# of clients send observations over a Unix socket or localhost TCP. Requests are queued
+# and a single batching thread runs one forward pass per batch: a batch closes when it
+# holds --max_batch observations or --max_wait_ms after its first request arrived,
+# whichever comes first, so added latency is bounded by the deadline.
+#
+# Hot swap: `reload` (or --watch, which polls the checkpoint's mtime) loads the new
+# checkpoint off the batching thread and swaps it in between two batches; queued
+# requests are simply answered by the new policy, nothing is dropped.
+#
+#   python policy_server.py start --model_path models/ppo_snake_length --address unix:/tmp/snake.sock
+#   python eval.py --model_path unix:/tmp/snake.sock --workers 8
+#   python policy_server.py stats --address unix:/tmp/snake.sock
+#   python policy_server.py reload --address unix:/tmp/snake.sock --model_path models/ppo_snake_length_v2
+#   python policy_server.py bench --address unix:/tmp/snake.sock --clients 16
+#   python policy_server.py start --model_path models/ppo_snake_length --masked   # MaskablePPO
+#   python eval.py --model_path unix:/tmp/snake.sock --action_mask collision
+#
+# Wire format, both directions: header struct "!cBII" = (kind, flags, version, payload
+# length) followed by the payload.
+#   P predict  payload: ndim byte, ndim uint16 dims, raw uint8 obs (one obs or a batch),
+#                       then with the MASKED flag one uint8 action mask row per obs
+#              reply:   one uint8 action per obs, version = policy version that answered
+#   S stats    reply:   JSON metrics
+#   R reload   payload: utf-8 model path; reply: JSON {"version": ...} once swapped in
+#   E error    reply only: utf-8 message
+import argparse
+import inspect
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from metrics import MetricsCollector
+from numpy_policy import load_policy
+
+HEADER = struct.Struct("!cBII")
+DETERMINISTIC = 1
+MASKED = 2
+
+
+def parse_address(address):
+    # "unix:/path/to.sock" or "host:port" (a "tcp:" prefix is accepted too)
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith("tcp:"):
+        address = address[4:]
+    host, port = address.rsplit(":", 1)
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if k == 0:
+            raise ConnectionError("connection closed")
+        got += k
+    return bytes(buf)
+
+
+def send_frame(sock, kind, payload=b"", flags=0, version=0):
+    sock.sendall(HEADER.pack(kind, flags, version, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    kind, flags, version, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return kind, flags, version, _recv_exact(sock, length) if length else b""
+
+
+def encode_obs(obs):
+    obs = np.ascontiguousarray(obs, dtype=np.uint8)
+    return struct.pack(f"!B{obs.ndim}H", obs.ndim, *obs.shape) + obs.tobytes()
+
+
+def decode_obs(payload, masked=False):
+    # -> obs, or (obs, action masks) with masked
+    ndim = payload[0]
+    shape = struct.unpack_from(f"!{ndim}H", payload, 1)
+    offset = 1 + 2 * ndim
+    obs = np.frombuffer(payload, dtype=np.uint8, offset=offset, count=int(np.prod(shape))).reshape(shape)
+    if not masked:
+        return obs
+    masks = np.frombuffer(payload, dtype=np.uint8, offset=offset + obs.nbytes).astype(bool)
+    return obs, masks
+
+
+def policy_obs_shape(policy):
+    shape = getattr(policy, "obs_shape", None)
+    return tuple(shape) if shape is not None else tuple(policy.observation_space.shape)
+
+
+class Request:
+    __slots__ = ("obs", "masks", "deterministic", "enqueued", "done", "actions", "version", "error")
+
+    def __init__(self, obs, deterministic, masks=None):
+        self.obs = obs
+        self.masks = masks.reshape(len(obs), -1) if masks is not None else None
+        self.deterministic = deterministic
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.actions = None
+        self.version = 0
+        self.error = None
+
+
+class Batcher:
+    def __init__(self, policy, max_batch=64, max_wait_ms=2.0):
+        self.policy = policy
+        self.obs_shape = policy_obs_shape(policy)
+        self.version = 1
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()  # guards the metrics
+        self.batches = MetricsCollector({"batch_size": 1}, quantiles=(0.5, 0.9, 0.99))
+        self.requests = MetricsCollector(quantiles=(0.5, 0.9, 0.99))
+        self.max_queue = 0
+        self.swaps = 0
+        self.errors = 0
+        self.started = time.time()
+        self._pending_policy = None
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _to_batch(self, obs):
+        # -> (n, *obs_shape) in the policy's layout; channel-last env obs are transposed
+        single = obs.ndim == len(self.obs_shape)
+        batch = obs[None] if single else obs
+        if batch.shape[1:] != self.obs_shape:
+            c, h, w = self.obs_shape
+            if batch.shape[1:] != (h, w, c):
+                raise ValueError(f"observation shape {obs.shape} does not match policy {self.obs_shape}")
+            batch = batch.transpose(0, 3, 1, 2)
+        return batch
+
+    def submit(self, obs, deterministic=True, masks=None):
+        request = Request(self._to_batch(obs), deterministic, masks)
+        self.queue.put(request)
+        depth = self.queue.qsize()
+        if depth > self.max_queue:
+            self.max_queue = depth
+        return request
+
+    def swap(self, policy):
+        if policy_obs_shape(policy) != self.obs_shape:
+            raise ValueError(f"new policy expects {policy_obs_shape(policy)}, serving {self.obs_shape}")
+        done = threading.Event()
+        self._pending_policy = (policy, done)
+        self.queue.put(None)  # wake the batching thread if it is idle
+        done.wait()
+        return self.version
+
+    def _collect(self, first):
+        items, n = [first], len(first.obs)
+        deadline = first.enqueued + self.max_wait
+        while n < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            items.append(item)
+            n += len(item.obs)
+        return items, n
+
+    def _apply_swap(self):
+        if self._pending_policy is not None:
+            policy, done = self._pending_policy
+            self._pending_policy = None
+            self.policy = policy
+            self.version += 1
+            self.swaps += 1
+            done.set()
+
+    def _loop(self):
+        while True:
+            first = self.queue.get()
+            self._apply_swap()
+            if first is None:
+                continue
+            items, n = self._collect(first)
+            start = time.perf_counter()
+            self._run(items)
+            end = time.perf_counter()
+            self._apply_swap()  # the wake-up may have been consumed while collecting
+            with self.lock:
+                self.batches.add({
+                    "batch_size": n,
+                    "queue_ms": (start - first.enqueued) * 1000,
+                    "infer_ms": (end - start) * 1000,
+                })
+                for item in items:
+                    self.requests.add({"latency_ms": (end - item.enqueued) * 1000})
+
+    def _run(self, items):
+        # at most two forward passes per batch: deterministic and sampled requests
+        for deterministic in (True, False):
+            group = [item for item in items if item.deterministic == deterministic]
+            if not group:
+                continue
+            try:
+                obs = np.concatenate([item.obs for item in group])
+                kwargs = {}
+                if any(item.masks is not None for item in group):
+                    if "action_masks" not in inspect.signature(self.policy.predict).parameters:
+                        raise ValueError("the served policy takes no action masks (start the server with --masked)")
+                    width = next(item.masks.shape[1] for item in group if item.masks is not None)
+                    kwargs["action_masks"] = np.concatenate([
+                        item.masks if item.masks is not None else np.ones((len(item.obs), width), dtype=bool)
+                        for item in group])
+                actions, _ = self.policy.predict(obs, deterministic=deterministic, **kwargs)
+                actions = np.asarray(actions, dtype=np.uint8).reshape(-1)
+                offset = 0
+                for item in group:
+                    item.actions = actions[offset:offset + len(item.obs)]
+                    offset += len(item.obs)
+            except Exception as e:
+                self.errors += 1
+                for item in group:
+                    item.error = str(e)
+            for item in group:
+                item.version = self.version
+                item.done.set()
+
+    def stats(self):
+        with self.lock:
+            batches = self.batches.summary()["metrics"]
+            requests = self.requests.summary()["metrics"]
+        return {
+            "version": self.version,
+            "uptime_s": time.time() - self.started,
+            "requests": self.requests.n_episodes,
+            "batches": self.batches.n_episodes,
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue,
+            "swaps": self.swaps,
+            "errors": self.errors,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            **{f"batch.{k}": v for k, v in batches.items()},
+            **{f"request.{k}": v for k, v in requests.items()},
+        }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher, server = self.server.batcher, self.server
+        sock = self.request
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                kind, flags, _, payload = recv_frame(sock)
+            except ConnectionError:
+                return
+            try:
+                if kind == b"P":
+                    if flags & MASKED:
+                        obs, masks = decode_obs(payload, masked=True)
+                    else:
+                        obs, masks = decode_obs(payload), None
+                    request = batcher.submit(obs, bool(flags & DETERMINISTIC), masks)
+                    request.done.wait()
+                    if request.error is not None:
+                        send_frame(sock, b"E", request.error.encode())
+                    else:
+                        send_frame(sock, b"P", request.actions.tobytes(), version=request.version)
+                elif kind == b"S":
+                    send_frame(sock, b"S", json.dumps(batcher.stats()).encode())
+                elif kind == b"R":
+                    version = server.reload(payload.decode())
+                    send_frame(sock, b"R", json.dumps({"version": version}).encode(), version=version)
+                else:
+                    send_frame(sock, b"E", f"unknown request {kind!r}".encode())
+            except Exception as e:
+                send_frame(sock, b"E", str(e).encode())
+
+
+class _ServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def reload(self, model_path):
+        # loading happens on the calling (handler/watch) thread; only the swap is serialized
+        with self.reload_lock:
+            version = self.batcher.swap(load_policy(model_path, device=self.device, masked=self.masked))
+            self.model_path = model_path
+        print(f"Serving {model_path} (version {version})")
+        return version
+
+
+class TCPPolicyServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixPolicyServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def make_server(model_path, address, max_batch=64, max_wait_ms=2.0, device="cpu", masked=False):
+    # masked: serve an SB3 zip as sb3_contrib's MaskablePPO, for clients sending action masks
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.unlink(addr)
+        server = UnixPolicyServer(addr, _Handler)
+    else:
+        server = TCPPolicyServer(addr, _Handler)
+    server.device = device
+    server.masked = masked
+    server.model_path = model_path
+    server.reload_lock = threading.Lock()
+    server.batcher = Batcher(load_policy(model_path, device=device, masked=masked), max_batch, max_wait_ms)
+    return server
+
+
+def _model_file(model_path):
+    return model_path if model_path.endswith(".npz") or os.path.exists(model_path) else model_path + ".zip"
+
+
+def _watch(server, interval):
+    # reload whenever the served checkpoint file is rewritten (e.g. by EvalCallback's best_model)
+    path = _model_file(server.model_path)
+    mtime = os.path.getmtime(path)
+    while True:
+        time.sleep(interval)
+        try:
+            current = os.path.getmtime(path)
+            if current != mtime:
+                time.sleep(0.5)  # let the writer finish
+                mtime = os.path.getmtime(path)
+                server.reload(server.model_path)
+        except Exception as e:
+            print(f"Watch reload failed: {e}")
+
+
+class PolicyClient:
+    # Drop-in for model.predict(); one connection per client, not thread safe. masked: the
+    # served policy is a MaskablePPO one, play it with the env's action masks
+    def __init__(self, address, timeout=None, masked=False):
+        family, addr = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(addr)
+        if family != socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.version = None
+        self.masked = masked
+
+    def _call(self, kind, payload=b"", flags=0):
+        send_frame(self.sock, kind, payload, flags)
+        reply, _, version, data = recv_frame(self.sock)
+        if reply == b"E":
+            raise RuntimeError(f"policy server: {data.decode()}")
+        self.version = version
+        return data
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True, action_masks=None):
+        obs = np.asarray(obs)
+        payload, flags = encode_obs(obs), DETERMINISTIC if deterministic else 0
+        if action_masks is not None:
+            payload += np.asarray(action_masks, dtype=np.uint8).tobytes()
+            flags |= MASKED
+        data = self._call(b"P", payload, flags)
+        actions = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+        return (actions[0] if len(actions) == 1 and obs.ndim == 3 else actions), None
+
+    def stats(self):
+        return json.loads(self._call(b"S"))
+
+    def reload(self, model_path):
+        return json.loads(self._call(b"R", model_path.encode()))["version"]
+
+    def close(self):
+        self.sock.close()
+
+
+def _bench_client(address, requests, obs_shape, seed, out):
+    rng = np.random.default_rng(seed)
+    obs = rng.integers(0, 256, (requests,) + tuple(obs_shape), dtype=np.uint8)
+    client = PolicyClient(address)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        client.predict(obs[i])
+        latencies.append(time.perf_counter() - start)
+    client.close()
+    out.extend(latencies)
+
+
+def bench(address, clients=16, requests=500, obs_shape=(20, 30, 3)):
+    # concurrent batch-size-1 clients against a running server
+    latencies = []
+    threads = [threading.Thread(target=_bench_client, args=(address, requests, obs_shape, i, latencies))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    lat = np.array(latencies) * 1000
+    return {
+        "clients": clients,
+        "requests": len(lat),
+        "throughput_per_s": len(lat) / elapsed,
+        "latency_ms_p50": float(np.percentile(lat, 50)),
+        "latency_ms_p99": float(np.percentile(lat, 99)),
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest="which", required=True)
+    serve_p = sub.add_parser("start")
+    serve_p.add_argument("--model_path", type=str, default="models/ppo_snake_length")
+    serve_p.add_argument("--address", type=str, default="127.0.0.1:5757", help="host:port or unix:/path.sock")
+    serve_p.add_argument("--max_batch", type=int, default=64)
+    serve_p.add_argument("--max_wait_ms", type=float, default=2.0, help="batch deadline after its first request")
+    serve_p.add_argument("--device", type=str, default="cpu")
+    serve_p.add_argument("--masked", action="store_true",
+                         help="load the model as MaskablePPO (train_ppo.py --action_mask); clients send masks")
+    serve_p.add_argument("--watch", type=float, default=0.0, help="poll the checkpoint every N s and hot swap on change")
+    serve_p.add_argument("--stats_every", type=float, default=0.0, help="print metrics every N s")
+    for name in ("stats", "reload", "bench"):
+        q = sub.add_parser(name)
+        q.add_argument("--address", type=str, default="127.0.0.1:5757")
+        if name == "reload":
+            q.add_argument("--model_path", type=str, required=True)
+        if name == "bench":
+            q.add_argument("--clients", type=int, default=16)
+            q.add_argument("--requests", type=int, default=500, help="per client")
+    args = p.parse_args(argv)
+
+    if args.which == "start":
+        server = make_server(args.model_path, args.address, args.max_batch, args.max_wait_ms, args.device,
+                             args.masked)
+        if args.watch > 0:
+            threading.Thread(target=_watch, args=(server, args.watch), daemon=True).start()
+        if args.stats_every > 0:
+            def report():
+                while True:
+                    time.sleep(args.stats_every)
+                    s = server.batcher.stats()
+                    if s["batches"]:
+                        print(f"requests {s['requests']}  batch mean {s['batch.batch_size']['mean']:.1f}  "
+                              f"latency p50/p99 {s['request.latency_ms']['p50']:.2f}/{s['request.latency_ms']['p99']:.2f} ms  "
+                              f"max queue {s['max_queue_depth']}")
+            threading.Thread(target=report, daemon=True).start()
+        print(f"Serving {args.model_path} on {args.address} (max_batch {args.max_batch}, deadline {args.max_wait_ms} ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    if args.which == "bench":
+        print(json.dumps(bench(args.address, args.clients, args.requests), indent=2))
+        return
+    client = PolicyClient(args.address)
+    if args.which == "stats":
+        print(json.dumps(client.stats(), indent=2))
+    else:
+        print(f"Now serving version {client.reload(args.model_path)}")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
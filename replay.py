@@ -0,0 +1,120 @@
+# Deterministic replay of SnakeEnv episodes from (env config, reset seed, actions).
+#
+# SnakeEnv draws all randomness from its own RNG, reseeded by reset(seed=...), so an
+# episode is fully determined by the constructor kwargs, the episode counter (the
+# curriculum depends on it), the reset seed and the action sequence: one byte per step.
+# ReplayEngine re-simulates it and keeps periodic state snapshots so seeking to step k
+# only replays the steps since the nearest snapshot (SnakeEnv.get_state()/set_state()).
+#
+#   records = load_episodes("logs/replays.npz")
+#   engine = ReplayEngine(records[3])
+#   obs = engine.seek(250)
+#
+# Only numpy and snake_env are needed; no model or torch.
+import json
+
+import numpy as np
+
+from snake_env import SnakeEnv
+
+class EpisodeRecord:
+    def __init__(self, env_kwargs, seed, actions, episode_index=0):
+        self.env_kwargs = dict(env_kwargs)
+        self.seed = int(seed)
+        self.actions = np.asarray(actions, dtype=np.uint8)
+        # env.episode_counter right before the reset that started the episode
+        self.episode_index = int(episode_index)
+
+    def __len__(self):
+        return len(self.actions)
+
+
+def make_replay_env(record, render_mode=None):
+    kwargs = {**record.env_kwargs, "render_mode": render_mode}
+    env = SnakeEnv(**kwargs)
+    env.episode_counter = record.episode_index
+    return env
+
+
+class ReplayEngine:
+    def __init__(self, record, snapshot_every=256, render_mode=None):
+        self.record = record
+        self.snapshot_every = snapshot_every
+        self.env = make_replay_env(record, render_mode)
+        self.obs, _ = self.env.reset(seed=record.seed)
+        self.t = 0  # number of actions applied
+        self.last_step = None
+        self.snapshots = {0: self.env.get_state()}
+
+    def step(self):
+        action = int(self.record.actions[self.t])
+        self.last_step = self.env.step(action)
+        self.obs = self.last_step[0]
+        self.t += 1
+        if self.t % self.snapshot_every == 0 and self.t not in self.snapshots:
+            self.snapshots[self.t] = self.env.get_state()
+        return self.last_step
+
+    def seek(self, k):
+        # state after k actions; returns the observation
+        if not 0 <= k <= len(self.record):
+            raise IndexError(f"step {k} outside episode of length {len(self.record)}")
+        base = max(s for s in self.snapshots if s <= k)
+        if k < self.t or base > self.t:
+            self.obs = self.env.set_state(self.snapshots[base])
+            self.t = base
+        while self.t < k:
+            self.step()
+        return self.obs
+
+    def play(self):
+        # yields (obs, reward, terminated, truncated, info) for every remaining step
+        while self.t < len(self.record):
+            yield self.step()
+
+    def close(self):
+        self.env.close()
+
+
+def record_episode(policy, env_kwargs, seed, episode_index=0, max_steps=None):
+    # policy(obs) -> action. Returns the EpisodeRecord and the summed reward.
+    env = SnakeEnv(**env_kwargs)
+    env.episode_counter = episode_index
+    obs, _ = env.reset(seed=seed)
+    actions, total_reward, done = [], 0.0, False
+    while not done and (max_steps is None or len(actions) < max_steps):
+        action = int(policy(obs))
+        obs, reward, terminated, truncated, _ = env.step(action)
+        actions.append(action)
+        total_reward += reward
+        done = terminated or truncated
+    env.close()
+    return EpisodeRecord(env_kwargs, seed, actions, episode_index), total_reward
+
+
+def save_episodes(path, records):
+    # All episodes in one .npz: concatenated uint8 actions + per-episode offsets/seeds.
+    lengths = np.array([len(r) for r in records], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    np.savez_compressed(
+        path,
+        actions=np.concatenate([r.actions for r in records]) if records else np.zeros(0, np.uint8),
+        offsets=offsets,
+        seeds=np.array([r.seed for r in records], dtype=np.int64),
+        episode_index=np.array([r.episode_index for r in records], dtype=np.int64),
+        env_kwargs=np.array([json.dumps(r.env_kwargs) for r in records]),
+    )
+
+
+def load_episodes(path):
+    data = np.load(path)
+    offsets = data["offsets"]
+    records = []
+    for i in range(len(data["seeds"])):
+        records.append(EpisodeRecord(
+            json.loads(str(data["env_kwargs"][i])),
+            data["seeds"][i],
+            data["actions"][offsets[i]:offsets[i + 1]],
+            data["episode_index"][i],
+        ))
+    return records
@@ -0,0 +1,151 @@
+# Picks torch threads / env count / vec env backend for the fastest training on this box.
+#
+# The policy is a tiny MLP, so torch's default of one intra-op thread per core mostly
+# fights the env stepping for the same cores. This runs a short calibration of
+# SnakeEnv rollouts + PPO (or A2C) updates for every combination, keeps the one with the
+# best steps/sec and writes it to configs/resources.json:
+#
+#   python resource_planner.py --algo ppo
+#   python train_ppo.py --resources configs/resources.json
+#
+# The training scripts run the calibration themselves if the file has no plan for
+# their algorithm yet.
+import argparse
+import json
+import os
+import platform
+import time
+
+DEFAULT_PLAN_PATH = "./configs/resources.json"
+BACKENDS = ["dummy", "subproc"]
+
+
+def _powers_of_two(limit):
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    return values
+
+
+def candidate_settings(cpu_count=None, max_envs=16):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    for threads in _powers_of_two(cpu_count):
+        for n_envs in _powers_of_two(min(max_envs, 2 * cpu_count)):
+            for backend in BACKENDS:
+                # a single env in a subprocess only adds IPC
+                if backend == "subproc" and n_envs == 1:
+                    continue
+                yield {"torch_threads": threads, "n_envs": n_envs, "vec_env": backend}
+
+
+def make_vec(n_envs, vec_env="dummy", reward_mode="length", seed=7, reward_weights=None, grid_size=None,
+             frame_stack=1, **env_kwargs):
+    # env_kwargs: further SnakeEnv options (mask_collisions, loop_repeats, start_pool, ...)
+    from stable_baselines3.common.env_util import make_vec_env
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from snake_env import SnakeEnv, DEFAULT_GRID
+    from frame_history import FrameHistory
+
+    return make_vec_env(
+        SnakeEnv,
+        n_envs=n_envs,
+        seed=seed,
+        env_kwargs={"reward_mode": reward_mode, "seed": seed, "reward_weights": reward_weights,
+                    "grid_size": grid_size or DEFAULT_GRID, **env_kwargs},
+        vec_env_cls=SubprocVecEnv if vec_env == "subproc" else DummyVecEnv,
+        wrapper_class=FrameHistory if frame_stack > 1 else None,
+        wrapper_kwargs={"k": frame_stack} if frame_stack > 1 else None,
+    )
+
+
+def measure(setting, algo="ppo", rollout_size=2048, iterations=2):
+    # steps/sec of `iterations` rollout+update cycles after one warm-up cycle
+    import torch
+
+    torch.set_num_threads(setting["torch_threads"])
+    env = make_vec(setting["n_envs"], setting["vec_env"])
+    if algo == "ppo":
+        from train_ppo import make_model
+        # keep the PPO rollout size fixed so every setting does the same work per update
+        model = make_model(env, logdir=None, verbose=0,
+                           n_steps=max(rollout_size // setting["n_envs"], 1))
+    else:
+        from train_a2c import make_model
+        model = make_model(env, logdir=None, verbose=0)
+    steps_per_iter = model.n_steps * setting["n_envs"]
+    total = max(rollout_size * iterations // steps_per_iter, 1) * steps_per_iter
+    try:
+        model.learn(total_timesteps=steps_per_iter)
+        start = time.perf_counter()
+        model.learn(total_timesteps=total, reset_num_timesteps=False)
+        elapsed = time.perf_counter() - start
+    finally:
+        env.close()
+    return total / elapsed
+
+
+def calibrate(algo="ppo", max_envs=16, rollout_size=2048, iterations=2, verbose=1):
+    trials = []
+    for setting in candidate_settings(max_envs=max_envs):
+        sps = measure(setting, algo, rollout_size, iterations)
+        trials.append({**setting, "steps_per_sec": round(sps, 1)})
+        if verbose:
+            print(f"threads={setting['torch_threads']:<3} envs={setting['n_envs']:<3} "
+                  f"{setting['vec_env']:<8} {sps:9.1f} steps/s")
+    best = max(trials, key=lambda t: t["steps_per_sec"])
+    return {
+        **best,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "trials": trials,
+    }
+
+
+def load_plans(path=DEFAULT_PLAN_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_plan(plan, algo, path=DEFAULT_PLAN_PATH):
+    plans = load_plans(path)
+    plans[algo] = plan
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(plans, f, indent=2)
+
+
+def apply_plan(path=DEFAULT_PLAN_PATH, algo="ppo"):
+    # Sets torch's thread count and returns the plan; calibrates first if there is none.
+    import torch
+
+    plan = load_plans(path).get(algo)
+    if plan is None:
+        print(f"No {algo} resource plan in {path}, calibrating...")
+        plan = calibrate(algo)
+        save_plan(plan, algo, path)
+    torch.set_num_threads(plan["torch_threads"])
+    print(f"Resource plan: {plan['torch_threads']} torch threads, {plan['n_envs']} "
+          f"{plan['vec_env']} envs ({plan['steps_per_sec']} steps/s at calibration)")
+    return plan
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--algo", type=str, default="ppo", choices=["ppo", "a2c"])
+    p.add_argument("--max_envs", type=int, default=16)
+    p.add_argument("--rollout_size", type=int, default=2048)
+    p.add_argument("--iterations", type=int, default=2)
+    p.add_argument("--out", type=str, default=DEFAULT_PLAN_PATH)
+    args = p.parse_args(argv)
+
+    plan = calibrate(args.algo, args.max_envs, args.rollout_size, args.iterations)
+    save_plan(plan, args.algo, args.out)
+    print(f"Best: {plan['torch_threads']} threads, {plan['n_envs']} {plan['vec_env']} envs, "
+          f"{plan['steps_per_sec']} steps/s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
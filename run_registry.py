@@ -0,0 +1,221 @@
+# Append-only registry of training runs (SQLite, one row per run).
+#
+# Every training process inserts a single row when it finishes: algorithm, reward mode,
+# seed, hyperparameters, wall clock, throughput and eval results. Rows are never
+# rewritten, so parallel runs cannot erase each other (unlike rewriting one JSON file).
+# The database runs in WAL mode with a busy timeout, so concurrent writers queue on the
+# write lock instead of failing and readers never block them.
+#
+#   from run_registry import query_runs, runs_table
+#   rows = query_runs(algo="a2c", reward_mode="survival", since="2025-10-01")
+#   cols = runs_table(reward_mode="length")      # dict of NumPy columns for plotting
+#
+#   python run_registry.py list --algo ppo --limit 20
+#   python run_registry.py import results/reward_stats.json --algo a2c
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_DB = "results/runs.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    algo TEXT NOT NULL,
+    reward_mode TEXT,
+    seed INTEGER,
+    timesteps INTEGER,
+    wall_clock_s REAL,
+    steps_per_s REAL,
+    eval_mean_reward REAL,
+    eval_std_reward REAL,
+    eval_episodes INTEGER,
+    model_path TEXT,
+    hyperparams TEXT,
+    eval TEXT,
+    host TEXT,
+    argv TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_reward_mode ON runs(reward_mode, created_at);
+CREATE INDEX IF NOT EXISTS runs_algo ON runs(algo, created_at);
+CREATE INDEX IF NOT EXISTS runs_seed ON runs(seed);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created_at);
+CREATE TRIGGER IF NOT EXISTS runs_append_only BEFORE UPDATE ON runs
+BEGIN
+    SELECT RAISE(ABORT, 'runs is append-only');
+END;
+"""
+
+COLUMNS = ["id", "created_at", "algo", "reward_mode", "seed", "timesteps", "wall_clock_s", "steps_per_s",
+           "eval_mean_reward", "eval_std_reward", "eval_episodes", "model_path"]
+
+
+def connect(db_path=DEFAULT_DB, timeout=60.0):
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _jsonable(value):
+    # hyperparameters may hold schedules, classes or numpy scalars
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return repr(value)
+
+
+def record_run(algo, reward_mode=None, seed=None, timesteps=None, wall_clock_s=None, hyperparams=None,
+               eval_rewards=None, eval_summary=None, model_path=None, created_at=None, db_path=DEFAULT_DB,
+               eval_mean_reward=None, eval_episodes=None):
+    # Inserts one run and returns its id. eval_rewards: per-episode rewards of the final eval
+    # (or just eval_mean_reward/eval_episodes when only the mean is known).
+    mean, std, n = eval_mean_reward, None, eval_episodes
+    if eval_rewards is not None and len(eval_rewards):
+        rewards = np.asarray(eval_rewards, dtype=np.float64)
+        mean, std, n = float(rewards.mean()), float(rewards.std()), len(rewards)
+    steps_per_s = timesteps / wall_clock_s if timesteps and wall_clock_s else None
+    row = (
+        created_at if created_at is not None else time.time(), algo, reward_mode, seed, timesteps,
+        wall_clock_s, steps_per_s, mean, std, n, model_path,
+        json.dumps(_jsonable(hyperparams or {})), json.dumps(_jsonable(eval_summary)) if eval_summary else None,
+        platform.node(), json.dumps(sys.argv),
+    )
+    conn = connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (created_at, algo, reward_mode, seed, timesteps, wall_clock_s, steps_per_s, "
+                "eval_mean_reward, eval_std_reward, eval_episodes, model_path, hyperparams, eval, host, argv) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def _timestamp(value):
+    # epoch seconds or "YYYY-MM-DD[ HH:MM:SS]"
+    if value is None or isinstance(value, (int, float)):
+        return value
+    fmt = "%Y-%m-%d %H:%M:%S" if " " in value else "%Y-%m-%d"
+    return time.mktime(time.strptime(value, fmt))
+
+
+def query_runs(algo=None, reward_mode=None, seed=None, since=None, until=None, limit=None,
+               db_path=DEFAULT_DB):
+    # -> list of dicts, newest first; hyperparams/eval are decoded
+    clauses, params = [], []
+    for column, value in (("algo", algo), ("reward_mode", reward_mode), ("seed", seed)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(_timestamp(since))
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(_timestamp(until))
+    sql = "SELECT * FROM runs"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    conn = connect(db_path)
+    try:
+        rows = [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+    for row in rows:
+        row["hyperparams"] = json.loads(row["hyperparams"]) if row["hyperparams"] else {}
+        row["eval"] = json.loads(row["eval"]) if row["eval"] else None
+        row["argv"] = json.loads(row["argv"]) if row["argv"] else None
+    return rows
+
+
+def runs_table(**filters):
+    # query_runs() as a dict of NumPy columns (object arrays for the text columns)
+    rows = query_runs(**filters)
+    table = {}
+    for column in COLUMNS:
+        values = [row[column] for row in rows]
+        if column in ("algo", "reward_mode", "model_path"):
+            table[column] = np.array(values, dtype=object)
+        else:
+            table[column] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return table
+
+
+def import_reward_stats(path, algo="a2c", db_path=DEFAULT_DB):
+    # one-off migration of the old results/reward_stats.json (one entry per reward mode)
+    with open(path, "r") as f:
+        stats = json.load(f)
+    ids = []
+    for reward_mode, entry in stats.items():
+        minutes = entry.get("train_time_minutes")
+        ids.append(record_run(
+            algo, reward_mode=reward_mode, timesteps=entry.get("timesteps"),
+            wall_clock_s=minutes * 60 if minutes is not None else None,
+            eval_mean_reward=entry.get("average_reward"), eval_episodes=entry.get("episodes"),
+            eval_summary={"imported_from": path},
+            created_at=_timestamp(entry["timestamps"]) if "timestamps" in entry else None,
+            db_path=db_path,
+        ))
+    return ids
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", type=str, default=DEFAULT_DB)
+    sub = p.add_subparsers(dest="which", required=True)
+    list_p = sub.add_parser("list")
+    list_p.add_argument("--algo", type=str, default=None)
+    list_p.add_argument("--reward_mode", type=str, default=None)
+    list_p.add_argument("--seed", type=int, default=None)
+    list_p.add_argument("--since", type=str, default=None, help="YYYY-MM-DD[ HH:MM:SS]")
+    list_p.add_argument("--limit", type=int, default=50)
+    import_p = sub.add_parser("import", help="migrate an old reward_stats.json")
+    import_p.add_argument("path")
+    import_p.add_argument("--algo", type=str, default="a2c")
+    args = p.parse_args(argv)
+
+    if args.which == "import":
+        ids = import_reward_stats(args.path, args.algo, args.db)
+        print(f"Imported {len(ids)} runs into {args.db}")
+        return
+    rows = query_runs(args.algo, args.reward_mode, args.seed, args.since, limit=args.limit, db_path=args.db)
+    print(f"{'id':>5}  {'created':<19}  {'algo':<5} {'reward_mode':<11} {'seed':>5} {'timesteps':>10} "
+          f"{'minutes':>8} {'steps/s':>8} {'eval reward':>14}")
+    for r in rows:
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["created_at"]))
+        minutes = f"{r['wall_clock_s'] / 60:.1f}" if r["wall_clock_s"] else "-"
+        speed = f"{r['steps_per_s']:.0f}" if r["steps_per_s"] else "-"
+        if r["eval_std_reward"] is not None:
+            reward = f"{r['eval_mean_reward']:.1f} ± {r['eval_std_reward']:.1f}"
+        else:
+            reward = f"{r['eval_mean_reward']:.1f}" if r["eval_mean_reward"] is not None else "-"
+        print(f"{r['id']:>5}  {created:<19}  {r['algo']:<5} {r['reward_mode'] or '-':<11} "
+              f"{r['seed'] if r['seed'] is not None else '-':>5} {r['timesteps'] or '-':>10} "
+              f"{minutes:>8} {speed:>8} {reward:>14}")
+
+
+if __name__ == "__main__":
+    main()
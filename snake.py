@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# Single entry point for the project:
+#
+#   python snake.py train --timesteps 200000 --reward_mode length     (--algo a2c for A2C)
+#   python snake.py eval --model_path models/ppo_snake_length --episodes 10
+#   python snake.py visualize --replay logs/replays.npz --episode 3
+#   python snake.py bench startup
+#   python snake.py play
+#
+# Every command's module is imported only once it is chosen, and the scripts themselves
+# import SB3/torch only after parsing their arguments and pygame only for human
+# rendering, so --help, argument errors and env-only commands start fast.
+import argparse
+import importlib
+import os
+import runpy
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "train": "train an agent (train_ppo.py, or train_a2c.py with --algo a2c)",
+    "eval": "evaluate a saved model or replay file (eval.py)",
+    "visualize": "watch a model play or re-render a recorded episode (visualize.py)",
+    "bench": "env throughput and CLI startup benchmarks (bench.py)",
+    "play": "play Snake yourself (SnakeGame.py)",
+    "search": "ASHA hyperparameter search (hpsearch.py)",
+    "plan": "calibrate torch threads / env count for this machine (resource_planner.py)",
+    "highlights": "export clips of the best/worst/median episodes (highlights.py)",
+    "policy": "export a PPO zip to a torch-free NumPy policy and check it (numpy_policy.py)",
+    "serve": "batched policy inference server with hot swap (policy_server.py)",
+    "models": "index, filter and evaluate saved models (model_registry.py)",
+    "runs": "list training runs from the run registry (run_registry.py)",
+    "logs": "convert/inspect columnar per-episode logs (episode_log.py)",
+    "curriculum": "PPO on growing boards with a size-independent CNN (board_curriculum.py)",
+    "starts": "build a pool of mid-game start states for --start_pool (start_states.py)",
+}
+MODULES = {
+    "eval": "eval",
+    "visualize": "visualize",
+    "bench": "bench",
+    "search": "hpsearch",
+    "plan": "resource_planner",
+    "highlights": "highlights",
+    "policy": "numpy_policy",
+    "serve": "policy_server",
+    "models": "model_registry",
+    "runs": "run_registry",
+    "logs": "episode_log",
+    "curriculum": "board_curriculum",
+    "starts": "start_states",
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog="snake",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<12}{text}" for name, text in COMMANDS.items())
+               + "\n\nrun 'snake <command> --help' for the options of a command",
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the command")
+    args = parser.parse_args(argv)
+    sys.argv[0] = f"snake {args.command}"  # usage lines of the command's own parser
+
+    if args.command == "play":
+        runpy.run_path(os.path.join(HERE, "SnakeGame.py"), run_name="__main__")
+        return
+    if args.command == "train":
+        algo_parser = argparse.ArgumentParser(add_help=False)
+        algo_parser.add_argument("--algo", type=str, default="ppo", choices=["ppo", "a2c"])
+        known, rest = algo_parser.parse_known_args(args.args)
+        module = "train_a2c" if known.algo == "a2c" else "train_ppo"
+        importlib.import_module(module).main(rest)
+        return
+    importlib.import_module(MODULES[args.command]).main(args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,137 @@
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-import pygame
 import random
+import functools
+from collections import deque
+
+from path_field import DistanceField, INF
+
+# Weights for the "length" reward mode. Override any of them through
+# SnakeEnv(reward_weights={...}) when tuning (see hpsearch.py).
+DEFAULT_REWARD_WEIGHTS = {
+    "survival": 0.2,
+    "death_penalty": 50,
+    "food_eaten": 50,
+    "move_closer": 1,
+    "move_away": 0.5,
+    "turn_to_food": 2,
+    "straight_penalty": 0.2,
+    # per move closer to the food along the shortest path around the body (see path_field.py);
+    # 0 leaves the path distance untracked unless SnakeEnv(path_distance=True)
+    "path_distance": 0,
+}
+
+# Board size in cells (width, height)
+DEFAULT_GRID = (30, 20)
+
+
+def parse_grid(text):
+    # "30x20" -> (30, 20), for --grid flags
+    w, _, h = str(text).lower().partition("x")
+    return int(w), int(h or w)
+
+
+def render_rgb(obs, cell_size=10):
+    # Nearest-neighbour upscale of observation grids to RGB frames: (H, W, 3) ->
+    # (H*cell, W*cell, 3), or a whole batch (N, H, W, 3) -> (N, H*cell, W*cell, 3)
+    # in one broadcast copy.
+    *lead, h, w, c = obs.shape
+    big = np.broadcast_to(obs[..., :, None, :, None, :], (*lead, h, cell_size, w, cell_size, c))
+    return big.reshape(*lead, h * cell_size, w * cell_size, c)
+
+
+# Positions are (x, y) grid cells. Moves per direction 0=UP, 1=DOWN, 2=LEFT, 3=RIGHT.
+MOVES = {0: (0, -1), 1: (0, 1), 2: (-1, 0), 3: (1, 0)}
+OPPOSITE = {0: 1, 1: 0, 2: 3, 3: 2}
+DIRECTIONS = {move: d for d, move in MOVES.items()}
+WALL, BODY, HEAD, FOOD, EMPTY = (255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255), (0, 0, 0)
+
+# Zobrist keys for SnakeEnv.state_hash: one random 64-bit int per (kind, cell). Kinds 0-3
+# are body segments whose neighbour towards the head lies in that direction, so the hash
+# pins down the ordered body and not just the set of cells; then the head and the food.
+Z_HEAD, Z_FOOD = 4, 5
+
+# Curriculum food offsets from the head per starting direction: (first 100 episodes,
+# episodes up to 1000), each a pair picked between at random
+CURRICULUM_FOOD = {
+    0: (((-3, 0), (3, 0)), ((-3, -4), (3, -4))),
+    1: (((-3, 0), (3, 0)), ((-3, -4), (3, -4))),
+    2: (((0, -3), (0, 3)), ((-4, -3), (-4, 3))),
+    3: (((0, -3), (0, 3)), ((-4, -3), (-4, 3))),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(grid_w, grid_h, seed=0x5EED):
+    # kind -> {(x, y): key}; cells off the board are missing (look them up with .get(cell, 0))
+    rng = random.Random(seed)
+    return [{(x, y): rng.getrandbits(64) for y in range(grid_h) for x in range(grid_w)} for _ in range(6)]
+
+
+def render_frames(envs):
+    # rgb frames of many SnakeEnvs in one call, whatever their render_mode
+    return render_rgb(np.stack([env._get_obs() for env in envs]))
+
 
 class SnakeEnv(gym.Env):
-    metadata = {"render_modes": ["human"], "render_fps": 25}
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 25}
 
-    def __init__(self, render_mode=None, reward_mode="length", seed=7, max_steps=4000, curriculum =True):
+    def __init__(self, render_mode=None, reward_mode="length", seed=7, max_steps=4000, curriculum =True, reward_weights=None,
+                 grid_size=DEFAULT_GRID, cell_size=10, mask_collisions=False, loop_repeats=None, stall_steps=None,
+                 start_pool=None, start_prob=0.5, path_distance=False):
         super().__init__()
-        self.frame_size_x = 300
-        self.frame_size_y = 200
+        # Board size in cells (width, height); cell_size only matters for rendering.
+        # Everything else works in cell units.
+        self.grid_w, self.grid_h = int(grid_size[0]), int(grid_size[1])
+        if self.grid_w < 5 or self.grid_h < 5:
+            raise ValueError(f"grid_size must be at least 5x5, got {self.grid_w}x{self.grid_h}")
+        self.cell_size = cell_size
+        self.frame_size_x = self.grid_w * cell_size
+        self.frame_size_y = self.grid_h * cell_size
         self.reward_mode = reward_mode
         self.action_space = spaces.Discrete(4)
         self.observation_space = spaces.Box(
             low=0, high=255,
-            shape=(self.frame_size_y//10, self.frame_size_x//10, 3),
+            shape=(self.grid_h, self.grid_w, 3),
             dtype=np.uint8
         )
         self.render_mode = render_mode
         self.max_steps = max_steps
+        # action_masks() also masks moves into a wall or the body (see there)
+        self.mask_collisions = mask_collisions
+        # Loop/stall detector: truncate the episode once one state (state_hash) has been
+        # visited loop_repeats times with no food eaten in between, or after stall_steps
+        # steps without food. A deterministic policy that circles repeats its states every
+        # lap, but a random walk of a short snake revisits states as well: 2 truncates most
+        # random episodes on the default board, 4 almost none.
+        if loop_repeats is not None and loop_repeats < 2:
+            raise ValueError(f"loop_repeats must be at least 2, got {loop_repeats}")
+        self.loop_repeats = loop_repeats
+        self.stall_steps = stall_steps
+        self._zobrist = zobrist_keys(self.grid_w, self.grid_h)
+        # start_pool: start states (path of a start_states.py pool or a list of states) that
+        # reset() starts from with probability start_prob instead of the default position
+        if isinstance(start_pool, str):
+            from start_states import load_pool
+            start_pool = load_pool(start_pool, (self.grid_w, self.grid_h))
+        self.start_pool = list(start_pool or [])
+        self.start_prob = start_prob
         self.episode_counter = 0
         self.curriculum = curriculum
+        # own RNG so an episode is reproducible from its reset seed + actions (see replay.py)
+        self.rng = random.Random(seed)
+        self.reward_weights = dict(DEFAULT_REWARD_WEIGHTS)
+        if reward_weights:
+            unknown = set(reward_weights) - set(DEFAULT_REWARD_WEIGHTS)
+            if unknown:
+                raise ValueError(f"Unknown reward weights: {sorted(unknown)}")
+            self.reward_weights.update(reward_weights)
+        # BFS distance field rooted at the food: info["path_distance"] and the path_distance
+        # reward weight. Patched per move, rebuilt only when the food moves.
+        self._path = None
+        if path_distance or self.reward_weights["path_distance"]:
+            self._path = DistanceField(self.grid_w, self.grid_h)
 
         self.last_reward_breakdown = {
             "survival": 0.0,
@@ -33,8 +143,9 @@ class SnakeEnv(gym.Env):
         }
 
 
-        # Pygame setup only if rendering
+        # Pygame setup only if rendering to a window; rgb_array never touches pygame
         if render_mode == "human":
+            import pygame
             pygame.init()
             pygame.display.set_caption('Snake Eater')
             self.game_window = pygame.display.set_mode((self.frame_size_x, self.frame_size_y))
@@ -48,13 +159,16 @@ class SnakeEnv(gym.Env):
         self.reset()
 
     def reset(self, *, seed=None, options=None):
-        self.snake_pos = [self.frame_size_x // 2, self.frame_size_y // 2] #150, 100
-        self.snake_body = [
-            [self.snake_pos[0], self.snake_pos[1]],
-            [self.snake_pos[0] - 10, self.snake_pos[1]],
-            [self.snake_pos[0] - 20, self.snake_pos[1]],
-        ]
-        self.food_pos = [200, 100]
+        if seed is not None:
+            self.rng.seed(seed)
+        self.snake_pos = [self.grid_w // 2, self.grid_h // 2] # 15, 10 on the default board
+        # deque of (x, y) cells, head first
+        self.snake_body = deque([
+            (self.snake_pos[0], self.snake_pos[1]),
+            (self.snake_pos[0] - 1, self.snake_pos[1]),
+            (self.snake_pos[0] - 2, self.snake_pos[1]),
+        ])
+        self.food_pos = [self.grid_w * 2 // 3, self.grid_h // 2]
             
         self.score = 0
         self.turnCount = 0
@@ -68,76 +182,23 @@ class SnakeEnv(gym.Env):
         #self.steps_since_food = 0
         #self.food_intervals = []
 
-        # first 300 episodes is deterministic food to teach snake to eat
-        # teach it to turn, don't just have it go straight
+        # first 100 episodes: food a few cells to the side of the head, to teach turning;
+        # up to 1000: half the time food further back on the side, otherwise the default cell
         self.episode_counter += 1
-        if self.curriculum and self.episode_counter < 100:
-            direction = self.direction
-            if direction == 3:  # RIGHT
-                # Randomly choose up or down
-                if random.random() < 0.5:
-                    # UP
-                    self.food_pos = [self.snake_pos[0], self.snake_pos[1] - 30]
-                else:
-                    # DOWN
-                    self.food_pos = [self.snake_pos[0], self.snake_pos[1] + 30]
-            elif direction == 2:  # LEFT
-                # Similarly, force turns up or down for LEFT
-                if random.random() < 0.5:
-                    # UP
-                    self.food_pos = [self.snake_pos[0], self.snake_pos[1] - 30]
-                else:
-                    # DOWN
-                    self.food_pos = [self.snake_pos[0], self.snake_pos[1] + 30]
-            elif direction == 0:  # UP
-                # Randomly choose left or right
-                if random.random() < 0.5:
-                    self.food_pos = [self.snake_pos[0] - 30, self.snake_pos[1]]
-                else:
-                    self.food_pos = [self.snake_pos[0] + 30, self.snake_pos[1]]
-            elif direction == 1:  # DOWN
-                # Randomly choose left or right
-                if random.random() < 0.5:
-                    self.food_pos = [self.snake_pos[0] - 30, self.snake_pos[1]]
-                else:
-                    self.food_pos = [self.snake_pos[0] + 30, self.snake_pos[1]]
-        elif self.curriculum and self.episode_counter < 1000:
-        # mix: 50% deterministic, 50% random. deterministic food placed farther ahead
-            if random.random() < 0.5:
-                direction = self.direction
-                if direction == 3:  # RIGHT
-                    # Randomly choose up or down
-                    if random.random() < 0.5:
-                        # UP
-                        self.food_pos = [self.snake_pos[0] - 40, self.snake_pos[1] - 30]
-                    else:
-                        # DOWN
-                        self.food_pos = [self.snake_pos[0] - 40 , self.snake_pos[1] + 30]
-                elif direction == 2:  # LEFT
-                    # Similarly, force turns up or down for LEFT
-                    if random.random() < 0.5:
-                        # UP
-                        self.food_pos = [self.snake_pos[0] -40, self.snake_pos[1] - 30]
-                    else:
-                        # DOWN
-                        self.food_pos = [self.snake_pos[0] - 40, self.snake_pos[1] + 30]
-                elif direction == 0:  # UP
-                    # Randomly choose left or right
-                    if random.random() < 0.5:
-                        self.food_pos = [self.snake_pos[0] - 30, self.snake_pos[1] - 40]
-                    else:
-                        self.food_pos = [self.snake_pos[0] + 30, self.snake_pos[1] - 40]
-                elif direction == 1:  # DOWN
-                    # Randomly choose left or right
-                    if random.random() < 0.5:
-                        self.food_pos = [self.snake_pos[0] - 30, self.snake_pos[1] - 40]
-                    else:
-                        self.food_pos = [self.snake_pos[0] + 30, self.snake_pos[1] - 40]
+        if self.curriculum and self.episode_counter < 1000:
+            near, far = CURRICULUM_FOOD[self.direction]
+            pair = near if self.episode_counter < 100 else far if self.rng.random() < 0.5 else None
+            if pair is not None:
+                dx, dy = pair[0] if self.rng.random() < 0.5 else pair[1]
+                self.food_pos = [self.snake_pos[0] + dx, self.snake_pos[1] + dy]
         else:
             # Full random
-            self.food_pos = [random.randrange(1, self.frame_size_x // 10) * 10,
-                            random.randrange(1, self.frame_size_y // 10) * 10]
-            
+            self.food_pos = [self.rng.randrange(1, self.grid_w),
+                            self.rng.randrange(1, self.grid_h)]
+        # curriculum offsets are for the default board; keep food on small boards
+        self.food_pos = [min(max(self.food_pos[0], 0), self.grid_w - 1),
+                         min(max(self.food_pos[1], 0), self.grid_h - 1)]
+
         self.last_reward_breakdown = {
             "survival": 0.0,
             "death_penalty": 0.0,
@@ -147,7 +208,59 @@ class SnakeEnv(gym.Env):
             "total": 0.0,
         }
 
-        return self._get_obs(), {}
+        if self.start_pool and self.rng.random() < self.start_prob:
+            obs = self.set_state(self.start_pool[self.rng.randrange(len(self.start_pool))])
+            return obs, {"action_mask": self.action_masks()}
+
+        self._rebuild()
+        self._since_food = 0
+        self._visits = {self.state_hash: (1, 0)}  # hash -> (visits, last step) since the last food
+        return self._get_obs(), {"action_mask": self.action_masks()}
+
+    def get_state(self):
+        # Everything the next steps depend on, as immutable values or fresh copies, so a
+        # snapshot costs about one copy of the body. set_state() takes it back.
+        return {
+            "body": tuple(self.snake_body),
+            "direction": self.direction,
+            "food": (self.food_pos[0], self.food_pos[1]),
+            "score": self.score,
+            "turn_count": self.turnCount,
+            "steps": self.steps,
+            "wall_turn_evade": self.wall_turn_evade,
+            "prev_food_dist": self.prev_food_dist,
+            "straight_steps": self.straight_steps,
+            "done": self.done,
+            "episode_counter": self.episode_counter,
+            "since_food": self._since_food,
+            "visits": dict(self._visits),
+            "reward_breakdown": dict(self.last_reward_breakdown),
+            "rng": self.rng.getstate(),
+        }
+
+    def set_state(self, state):
+        # A get_state() snapshot, or only body/direction/food: a fresh episode from that
+        # position (the start states of start_states.py). Returns the observation.
+        self.snake_body = deque((int(x), int(y)) for x, y in state["body"])
+        self.snake_pos = list(self.snake_body[0])
+        self.direction = int(state["direction"])
+        self.food_pos = [int(state["food"][0]), int(state["food"][1])]
+        self.score = state.get("score", 0)
+        self.turnCount = state.get("turn_count", 0)
+        self.steps = state.get("steps", 0)
+        self.wall_turn_evade = state.get("wall_turn_evade", 0)
+        self.prev_food_dist = state.get("prev_food_dist", self._get_food_distance())
+        self.straight_steps = state.get("straight_steps", 0)
+        self.done = state.get("done", False)
+        self.last_reward_breakdown = dict(state.get("reward_breakdown", dict.fromkeys(self.last_reward_breakdown, 0.0)))
+        if "episode_counter" in state:
+            self.episode_counter = state["episode_counter"]
+        if "rng" in state:
+            self.rng.setstate(state["rng"])
+        self._rebuild()
+        self._since_food = state.get("since_food", 0)
+        self._visits = dict(state["visits"]) if "visits" in state else {self.state_hash: (1, 0)}
+        return self._get_obs()
 
     def step(self, action):
 
@@ -161,12 +274,21 @@ class SnakeEnv(gym.Env):
 
         #print(f"Action chosen: {action}")   # <- Add this line
 
-        if self.direction == 0: self.snake_pos[1] -= 10
-        if self.direction == 1: self.snake_pos[1] += 10
-        if self.direction == 2: self.snake_pos[0] -= 10
-        if self.direction == 3: self.snake_pos[0] += 10
-
-        self.snake_body.insert(0, list(self.snake_pos))
+        dx, dy = MOVES[self.direction]
+        self.snake_pos[0] += dx
+        self.snake_pos[1] += dy
+        head = (self.snake_pos[0], self.snake_pos[1])
+        prev_head = self.snake_body[0]
+        prev_food = (self.food_pos[0], self.food_pos[1])
+
+        # self collision against the body before the move (tail included), via occupancy
+        hit_self = self._occupied.get(head, 0) > 0
+        self.snake_body.appendleft(head)
+        self._occupied[head] = self._occupied.get(head, 0) + 1
+        # the old head becomes a segment pointing at the new one
+        z = self._zobrist
+        self.state_hash ^= (z[Z_HEAD].get(prev_head, 0) ^ z[self.direction].get(prev_head, 0)
+                            ^ z[Z_HEAD].get(head, 0))
         
         stepReward = 0
         terminated = False
@@ -178,9 +300,9 @@ class SnakeEnv(gym.Env):
 
         ate_food = self.snake_pos == self.food_pos
 
-        terminated = (self.snake_pos[0] < 0 or self.snake_pos[0] > self.frame_size_x-10 or
-            self.snake_pos[1] < 0 or self.snake_pos[1] > self.frame_size_y-10 or
-            self.snake_pos in self.snake_body[1:])
+        terminated = (self.snake_pos[0] < 0 or self.snake_pos[0] > self.grid_w - 1 or
+            self.snake_pos[1] < 0 or self.snake_pos[1] > self.grid_h - 1 or
+            hit_self)
 
         if self.direction != prev_direction:
             self.turnCount += 1
@@ -203,11 +325,45 @@ class SnakeEnv(gym.Env):
             #self.food_intervals.append(self.steps_since_food)
             #self.steps_since_food = 0
 
-            self.food_pos = [random.randrange(1, self.frame_size_x//10) * 10,
-                             random.randrange(1, self.frame_size_y//10) * 10]
+            self.food_pos = [self.rng.randrange(1, self.grid_w),
+                             self.rng.randrange(1, self.grid_h)]
+            self.state_hash ^= z[Z_FOOD][prev_food] ^ z[Z_FOOD][(self.food_pos[0], self.food_pos[1])]
             # No pop, snake grows
+            tail = None
         else:
-            self.snake_body.pop()
+            tail = self.snake_body.pop()
+            n = self._occupied[tail] - 1
+            if n:
+                self._occupied[tail] = n
+            else:
+                del self._occupied[tail]
+            end = self.snake_body[-1]
+            self.state_hash ^= z[DIRECTIONS[(end[0] - tail[0], end[1] - tail[1])]][tail]
+
+        # repaint only the cells this step touched
+        for cell in (prev_head, head, prev_food, (self.food_pos[0], self.food_pos[1])):
+            self._paint(cell)
+        if tail is not None:
+            self._paint(tail)
+
+        if self._path is not None:
+            # reward per move closer to the food along the shortest path around the body
+            path_reward = 0.0
+            if not terminated:
+                if ate_food:
+                    self._path.rebuild(self.food_pos, self._occupied)
+                else:
+                    self._path.block(head)
+                    if tail not in self._occupied:  # the head may have moved into it
+                        self._path.free(tail)
+                dist = self._path.distance_from(head)
+                if not ate_food and dist < INF and self._path_dist < INF:
+                    path_reward = self.reward_weights["path_distance"] * (self._path_dist - dist)
+                self._path_dist = dist
+            if self.reward_mode == "length":
+                self.last_reward_breakdown["path_distance"] = path_reward
+                self.last_reward_breakdown["total"] += path_reward
+                stepReward += path_reward
 
         #print(f"Turn:{self.turnCount} WallEvasion:{self._wall_evasion_reward(prev_direction)} HeadWall:{self._heading_toward_wall_punish()} Death:{self._death_penalty(terminated)} Axis:{self._axis_direction_reward()} Dist:{self._food_distance_based_reward()} Apple:{self._food_eaten_reward(ate_food)}")
 
@@ -215,96 +371,146 @@ class SnakeEnv(gym.Env):
         time_out = self.steps >= self.max_steps 
         terminated = terminated or time_out
 
+        truncated = loop = stall = False
+        if self.loop_repeats or self.stall_steps:
+            if ate_food:
+                self._visits.clear()
+                self._since_food = 0
+            else:
+                self._since_food += 1
+            visits, last_step = self._visits.get(self.state_hash, (0, self.steps))
+            self._visits[self.state_hash] = (visits + 1, self.steps)
+            if not terminated:
+                loop = bool(self.loop_repeats) and visits + 1 >= self.loop_repeats
+                stall = not loop and bool(self.stall_steps) and self._since_food >= self.stall_steps
+                truncated = loop or stall
+
         infos = {
             "score": self.score, 
             "turn_count": self.turnCount, 
             "time_out": time_out,
             "wall_turn_evade": self.wall_turn_evade,
+            "snake_length": len(self.snake_body),
             #"avg_food_time": avg_food_time
-            "reward_breakdown": self.last_reward_breakdown.copy()
+            "reward_breakdown": self.last_reward_breakdown.copy(),
+            "action_mask": self.action_masks(),
+            "loop": int(loop),
+            "stall": int(stall),
         }
-        return self._get_obs(), stepReward, terminated, False, infos
+        if loop:
+            infos["loop_length"] = self.steps - last_step
+        if self._path is not None:
+            infos["path_distance"] = self.path_distance()
+        return self._get_obs(), stepReward, terminated, truncated, infos
 
     def render(self):
-        # Only for render_mode == "human"
+        if self.render_mode == "rgb_array":
+            return render_rgb(self._get_obs(), self.cell_size)
         if self.render_mode != "human":
             return
+        import pygame
+        c = self.cell_size
         self.game_window.fill(self.colors["black"])
         for pos in self.snake_body:
-            pygame.draw.rect(self.game_window, self.colors["green"], pygame.Rect(pos[0], pos[1], 10, 10))
-        pygame.draw.rect(self.game_window, self.colors["white"], pygame.Rect(self.food_pos[0], self.food_pos[1], 10, 10))
+            pygame.draw.rect(self.game_window, self.colors["green"], pygame.Rect(pos[0] * c, pos[1] * c, c, c))
+        pygame.draw.rect(self.game_window, self.colors["white"], pygame.Rect(self.food_pos[0] * c, self.food_pos[1] * c, c, c))
         pygame.display.update()
         self.fps_controller.tick(25)
 
     def close(self):
         if self.render_mode == "human":
+            import pygame
             pygame.display.quit()
             pygame.quit()
 
-    def _get_obs(self):
-        obs = np.zeros(self.observation_space.shape, dtype=np.uint8)
-        
-        # Add direction to food
-        direction_vec = np.zeros(4)  # [up, down, left, right]
-        direction_to_food = self._get_direction_to_food()
-        direction_vec[direction_to_food] = 1
-        # Add danger sensors
-        #danger_left = int(self._will_collide(2))  # LEFT
-        #danger_right = int(self._will_collide(3)) # RIGHT
-        #danger_straight = int(self._will_collide(self.direction))
-
-        #extra_features = np.array([danger_left, danger_right, danger_straight] + list(direction_vec), dtype=np.uint8)
-
-
-        rows, cols, _ = obs.shape
-        scale = 10  # Each grid cell is 10x10 
-
-        # Draw walls (first and last row & column)
-        obs[0, :, :] = [255, 0, 0]
-        obs[-1, :, :] = [255, 0, 0]
-        obs[:, 0, :] = [255, 0, 0]
-        obs[:, -1, :] = [255, 0, 0]
-
-        # Draw snake body (except head)
-        for pos in self.snake_body[1:]:
-            x, y = pos[0] // scale, pos[1] // scale
-            if 0 <= y < rows and 0 <= x < cols:
-                obs[y, x] = [0, 255, 0]
-
-        # Draw snake head (first element of snake_body)
-        x, y = self.snake_body[0][0] // scale, self.snake_body[0][1] // scale
-        if 0 <= y < rows and 0 <= x < cols:
-            obs[y, x] = [0, 0, 255]
-
-        # Draw food
-        fx, fy = self.food_pos[0] // scale, self.food_pos[1] // scale
-        if 0 <= fy < rows and 0 <= fx < cols:
-            obs[fy, fx] = [255, 255, 255]
-
-        return obs
+    def _rebuild(self):
+        # Occupancy counts, observation grid and state hash from scratch: O(board + length),
+        # only on reset and in set_state(). step() keeps them up to date by repainting the
+        # few cells it changes.
+        self._occupied = {}
+        for cell in self.snake_body:
+            self._occupied[cell] = self._occupied.get(cell, 0) + 1
+        grid = np.zeros(self.observation_space.shape, dtype=np.uint8)
+        grid[0, :, :] = WALL
+        grid[-1, :, :] = WALL
+        grid[:, 0, :] = WALL
+        grid[:, -1, :] = WALL
+        self._grid = grid
+        for cell in self._occupied:
+            self._paint(cell)
+        self._paint((self.food_pos[0], self.food_pos[1]))
+        self.state_hash = self._full_hash()
+        if self._path is not None:
+            self._path.rebuild(self.food_pos, self._occupied)
+            self._path_dist = self._path.distance_from(self.snake_body[0])
+
+    def path_distance(self):
+        # moves from the head to the food around the body and walls (-1: no path), or None
+        # when the env does not track it
+        if self._path is None:
+            return None
+        return self._path_dist if self._path_dist < INF else -1
+
+    def _full_hash(self):
+        # what step() keeps up to date with a few XORs per move; a head off the board
+        # (the episode is over) adds nothing
+        z, body = self._zobrist, self.snake_body
+        h = z[Z_HEAD].get(body[0], 0) ^ z[Z_FOOD][(self.food_pos[0], self.food_pos[1])]
+        for i in range(1, len(body)):
+            (x, y), (nx, ny) = body[i], body[i - 1]
+            h ^= z[DIRECTIONS[(nx - x, ny - y)]][(x, y)]
+        return h
+
+    def _paint(self, cell):
+        # Colour of one cell, same precedence as drawing walls, body, head, food in order
+        x, y = cell
+        if not (0 <= x < self.grid_w and 0 <= y < self.grid_h):
+            return
+        if x == self.food_pos[0] and y == self.food_pos[1]:
+            color = FOOD
+        elif cell == self.snake_body[0]:
+            color = HEAD
+        elif cell in self._occupied:
+            color = BODY
+        elif x == 0 or y == 0 or x == self.grid_w - 1 or y == self.grid_h - 1:
+            color = WALL
+        else:
+            color = EMPTY
+        self._grid[y, x] = color
 
+    def _get_obs(self):
+        # Grid layout: walls on the outer rows/columns (red), body green, head blue,
+        # food white. Kept incrementally, so this is a copy, not a redraw.
+        return self._grid.copy()
+
+
+    def action_masks(self):
+        # Valid actions for the next step (the method sb3_contrib's MaskablePPO looks for).
+        # The reversal is always masked: step() ignores it, so it is the same move as going
+        # straight. With mask_collisions, moves into a wall or the body are masked as well,
+        # unless every move is fatal.
+        mask = np.ones(4, dtype=bool)
+        mask[OPPOSITE[self.direction]] = False
+        if self.mask_collisions:
+            safe = mask & [not self._will_collide(a) for a in range(4)]
+            if safe.any():
+                mask = safe
+        return mask
 
 # danger function
 
     def _will_collide(self, direction):
-        # Map direction to movement
-        directions = {
-            0: (0, -10),  # UP
-            1: (0, 10),   # DOWN
-            2: (-10, 0),  # LEFT
-            3: (10, 0),   # RIGHT
-        }
-        dx, dy = directions[direction]
-        next_pos = [self.snake_pos[0] + dx, self.snake_pos[1] + dy]
+        dx, dy = MOVES[direction]
+        next_pos = (self.snake_pos[0] + dx, self.snake_pos[1] + dy)
 
         # Wall collision
-        if next_pos[0] < 0 or next_pos[0] > self.frame_size_x - 10:
+        if next_pos[0] < 0 or next_pos[0] > self.grid_w - 1:
             return True
-        if next_pos[1] < 0 or next_pos[1] > self.frame_size_y - 10:
+        if next_pos[1] < 0 or next_pos[1] > self.grid_h - 1:
             return True
 
         # Self collision
-        if next_pos in self.snake_body:
+        if next_pos in self._occupied:
             return True
 
         return False
@@ -325,12 +531,12 @@ class SnakeEnv(gym.Env):
         else:
             return 1 if dy > 0 else 0  # DOWN or UP
 
-    def _near_wall(self, margin=20):
+    def _near_wall(self, margin=2):
         x, y = self.snake_pos
         near_left = x < margin
-        near_right = x > self.frame_size_x - margin - 10
+        near_right = x > self.grid_w - margin - 1
         near_top = y < margin
-        near_bottom = y > self.frame_size_y - margin - 10
+        near_bottom = y > self.grid_h - margin - 1
         return near_left or near_right or near_top or near_bottom
     
     def _wall_evade_check(self, prev_direction):
@@ -338,11 +544,11 @@ class SnakeEnv(gym.Env):
         x, y = self.snake_pos
         if prev_direction == 0 and y <= 0 and self.direction != prev_direction:  # Upper wall
             return True    
-        elif prev_direction == 1 and y >= self.frame_size_y - 10 and self.direction != prev_direction:  # Lower wall
+        elif prev_direction == 1 and y >= self.grid_h - 1 and self.direction != prev_direction:  # Lower wall
             return True
         elif prev_direction == 2 and x <= 0 and self.direction != prev_direction:  # Left wall
             return True
-        elif prev_direction == 3 and x >= self.frame_size_x - 10 and self.direction != prev_direction:  # Right wall
+        elif prev_direction == 3 and x >= self.grid_w - 1 and self.direction != prev_direction:  # Right wall
             return True
         
         return False
@@ -424,12 +630,12 @@ class SnakeEnv(gym.Env):
         dx = abs(sx - fx)
         dy = abs(sy - fy)
 
-        half_x = self.frame_size_x // 2
-        half_y = self.frame_size_y // 2
+        half_x = self.grid_w / 2
+        half_y = self.grid_h / 2
 
         # Otherwise: reward increases as snake gets closer to apple in both directions
-        reward_x = (half_x - dx) / 100
-        reward_y = (half_y - dy) / 100
+        reward_x = (half_x - dx) / 10
+        reward_y = (half_y - dy) / 10
         raw_distance_reward = reward_x + reward_y
     
         # First, apply lower bound (e.g. -1.5), then upper bound (e.g. 2.0)
@@ -439,36 +645,28 @@ class SnakeEnv(gym.Env):
 
     
     #rewrite this so it uses near_wall instead
-    def _heading_toward_wall_punish(self, modifier, margin=30):
+    def _heading_toward_wall_punish(self, modifier, margin=3):
         x, y = self.snake_pos
         reward = 0
         # Top wall
         if y < margin and self.direction == 0:
             reward -= modifier
         # Bottom wall
-        if y > self.frame_size_y - margin - 10 and self.direction == 1:
+        if y > self.grid_h - margin - 1 and self.direction == 1:
             reward -= modifier
         # Left wall
         if x < margin and self.direction == 2:
             reward -= modifier
         # Right wall
-        if x > self.frame_size_x - margin - 10 and self.direction == 3:
+        if x > self.grid_w - margin - 1 and self.direction == 3:
             reward -= modifier
         return reward
 
     def _self_collision_avoidance_reward(self, action):
 
         x, y = self.snake_pos
-        # Map action to direction
-        directions = {
-            0: (0, -10),  # UP
-            1: (0, 10),   # DOWN
-            2: (-10, 0),  # LEFT
-            3: (10, 0),   # RIGHT
-        }
-        dx, dy = directions[action]
-        next_pos = [x + dx, y + dy]
-        if next_pos in self.snake_body:
+        dx, dy = MOVES[action]
+        if (x + dx, y + dy) in self._occupied:
             # Penalize for imminent collision with self
             return -5
         else:
@@ -477,10 +675,10 @@ class SnakeEnv(gym.Env):
         
     def _distance_from_wall_reward(self):
         x, y = self.snake_pos
-        dist_x = min(x, self.frame_size_x - x)
-        dist_y = min(y, self.frame_size_y - y)
+        dist_x = min(x, self.grid_w - x)
+        dist_y = min(y, self.grid_h - y)
         min_dist = min(dist_x, dist_y)
-        return min_dist / 100  # Reward staying near the center
+        return min_dist / 10  # Reward staying near the center
     
     def _move_closer_reward(self, modifier):
         current_dist = self._get_food_distance()
@@ -510,23 +708,27 @@ class SnakeEnv(gym.Env):
         return totalReward
 
     def _length(self, terminated, ate_food, prev_direction):
-        survive = self._survival_reward(terminated, 0.2)
-        death_pen = self._death_penalty(terminated, 50)
-        food_eaten = self._food_eaten_reward(ate_food, 50)
-        move_closer = self._move_closer_reward(1)
-        move_away = self._move_away_punish(0.5)
+        w = self.reward_weights
+        survive = self._survival_reward(terminated, w["survival"])
+        death_pen = self._death_penalty(terminated, w["death_penalty"])
+        food_eaten = self._food_eaten_reward(ate_food, w["food_eaten"])
+        move_closer = self._move_closer_reward(w["move_closer"])
+        move_away = self._move_away_punish(w["move_away"])
         #give reward for facing towards apple
 
         totalReward = survive + death_pen + food_eaten + move_closer + move_away
 
+        turn_to_food = straight_penalty = 0.0
         if self.direction != prev_direction and self.direction == self._get_direction_to_food():
-            totalReward += 2  # Reward for correct turn toward food
+            turn_to_food = w["turn_to_food"]
+            totalReward += w["turn_to_food"]  # Reward for correct turn toward food
         if self.direction == prev_direction:
             self.straight_steps += 1
         else:
             self.straight_steps = 0
         if self.straight_steps > 10:
-            totalReward -= 0.2  # Mild penalty for long straight sequences
+            straight_penalty = -w["straight_penalty"]
+            totalReward -= w["straight_penalty"]  # Mild penalty for long straight sequences
 
         self.last_reward_breakdown = {
             "survival": survive,
@@ -534,6 +736,8 @@ class SnakeEnv(gym.Env):
             "food_eaten": food_eaten,
             "move_closer": move_closer,
             "move_away": move_away,
+            "turn_to_food": turn_to_food,
+            "straight_penalty": straight_penalty,
             "total": totalReward,
         }
         return totalReward
\ No newline at end of file
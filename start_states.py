@@ -0,0 +1,144 @@
+# Start-state pools for SnakeEnv(start_pool=...): mid-game positions that reset() starts
+# from (with probability start_prob) instead of the 3-cell snake in the middle.
+#
+#   python start_states.py --out pools/start_30x20.json --n 500 --min_length 8 --max_length 60
+#   python start_states.py --out pools/replays.json --from_replays results/replays.npz --every 100
+#   python train_ppo.py --start_pool pools/start_30x20.json --start_prob 0.3
+#
+# A start state is the body (head first), the direction and the food; score and counters
+# start at zero. Generated states are long snakes laid along a random self-avoiding walk
+# with the food somewhere awkward: a corner, along a wall, or in a pocket of the body.
+# --from_replays takes positions from recorded episodes (eval.py --save_replays) instead.
+import argparse
+import json
+import os
+import random
+
+from snake_env import DEFAULT_GRID, DIRECTIONS, MOVES, parse_grid
+
+FOOD_SPOTS = ("corner", "wall", "pocket")
+
+
+def _neighbours(cell, grid_w, grid_h):
+    for dx, dy in MOVES.values():
+        x, y = cell[0] + dx, cell[1] + dy
+        if 0 <= x < grid_w and 0 <= y < grid_h:
+            yield x, y
+
+
+def random_body(length, grid_w, grid_h, rng, tries=100):
+    # head-first body of `length` cells along a self-avoiding walk whose head can still move
+    for _ in range(tries):
+        walk = [(rng.randrange(grid_w), rng.randrange(grid_h))]
+        taken = {walk[0]}
+        while len(walk) < length:
+            free = [c for c in _neighbours(walk[-1], grid_w, grid_h) if c not in taken]
+            if not free:
+                break
+            # mostly keep going straight: long runs and turns like a real snake
+            ahead = None
+            if len(walk) > 1:
+                ahead = (2 * walk[-1][0] - walk[-2][0], 2 * walk[-1][1] - walk[-2][1])
+            cell = ahead if ahead in free and rng.random() < 0.6 else rng.choice(free)
+            walk.append(cell)
+            taken.add(cell)
+        if len(walk) == length and any(c not in taken for c in _neighbours(walk[-1], grid_w, grid_h)):
+            return walk[::-1]
+    raise ValueError(f"no self-avoiding snake of length {length} found on a {grid_w}x{grid_h} board")
+
+
+def food_spot(body, grid_w, grid_h, rng, spot=None):
+    # food cell of kind `spot` (random kind if None), inside the env's food range
+    # x in [1, w), y in [1, h); any free cell when no cell of that kind is free
+    occupied = set(body)
+    cells = [(x, y) for x in range(1, grid_w) for y in range(1, grid_h) if (x, y) not in occupied]
+    spot = spot or rng.choice(FOOD_SPOTS)
+    if spot == "corner":
+        candidates = [c for c in cells if c[0] in (1, grid_w - 1) and c[1] in (1, grid_h - 1)]
+    elif spot == "wall":
+        candidates = [c for c in cells if c[0] in (1, grid_w - 1) or c[1] in (1, grid_h - 1)]
+    else:  # pocket: two or more sides taken by the body
+        candidates = [c for c in cells if sum(n in occupied for n in _neighbours(c, grid_w, grid_h)) >= 2]
+    return rng.choice(candidates or cells)
+
+
+def generate_pool(n, grid_size=DEFAULT_GRID, min_length=8, max_length=None, seed=7):
+    grid_w, grid_h = grid_size
+    max_length = max_length or grid_w * grid_h // 8
+    rng = random.Random(seed)
+    states = []
+    for _ in range(n):
+        body = random_body(rng.randint(min_length, max_length), grid_w, grid_h, rng)
+        head, neck = body[0], body[1]
+        states.append({
+            "body": body,
+            "direction": DIRECTIONS[(head[0] - neck[0], head[1] - neck[1])],
+            "food": food_spot(body, grid_w, grid_h, rng),
+        })
+    return states
+
+
+def pool_from_replays(records, every=100, min_length=6):
+    # positions every `every` steps of recorded episodes, snakes of min_length and up
+    from replay import ReplayEngine
+
+    states = []
+    for record in records:
+        engine = ReplayEngine(record, snapshot_every=len(record) + 1)
+        for t in range(every, len(record), every):
+            engine.seek(t)
+            state = engine.env.get_state()
+            if len(state["body"]) >= min_length:
+                states.append({key: state[key] for key in ("body", "direction", "food")})
+        engine.close()
+    return states
+
+
+def save_pool(path, states, grid_size):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"grid_size": list(grid_size), "states": [
+            {"body": [list(c) for c in s["body"]], "direction": int(s["direction"]), "food": list(s["food"])}
+            for s in states
+        ]}, f)
+
+
+def load_pool(path, grid_size=None):
+    with open(path) as f:
+        pool = json.load(f)
+    if grid_size is not None and tuple(pool["grid_size"]) != tuple(grid_size):
+        raise ValueError(f"start pool {path} is for a {pool['grid_size'][0]}x{pool['grid_size'][1]} board, "
+                         f"not {grid_size[0]}x{grid_size[1]}")
+    return pool["states"]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--out", type=str, required=True, help="pool file (.json) for --start_pool")
+    p.add_argument("--grid", type=parse_grid, default=DEFAULT_GRID)
+    p.add_argument("--n", type=int, default=500, help="generated states")
+    p.add_argument("--min_length", type=int, default=8)
+    p.add_argument("--max_length", type=int, default=None, help="default: an eighth of the board")
+    p.add_argument("--from_replays", type=str, default=None,
+                   help="take states from recorded episodes (eval.py --save_replays) instead of generating them")
+    p.add_argument("--every", type=int, default=100, help="with --from_replays: one state every N steps")
+    p.add_argument("--seed", type=int, default=7)
+    args = p.parse_args(argv)
+
+    if args.from_replays:
+        from replay import load_episodes
+        records = load_episodes(args.from_replays)
+        states = pool_from_replays(records, args.every, args.min_length)
+        grid = tuple(records[0].env_kwargs.get("grid_size", DEFAULT_GRID)) if records else args.grid
+    else:
+        states = generate_pool(args.n, args.grid, args.min_length, args.max_length, args.seed)
+        grid = args.grid
+    save_pool(args.out, states, grid)
+    lengths = sorted(len(s["body"]) for s in states)
+    print(f"Saved {len(states)} start states ({grid[0]}x{grid[1]}) to {args.out}"
+          + (f", snake length {lengths[0]}-{lengths[-1]}" if lengths else ""))
+
+
+if __name__ == "__main__":
+    main()
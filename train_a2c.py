@@ -1,57 +1,133 @@
 import argparse
 import os
-import json
 import numpy as np
 import time
 
 import gymnasium as gym
-from stable_baselines3 import A2C
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.logger import configure
-from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback, CallbackList
 
-from snake_env import SnakeEnv
+from snake_env import SnakeEnv, DEFAULT_GRID, parse_grid
+from frame_history import FrameHistory
+from adaptive_eval import evaluate_adaptive, gym_episode_runner
+from resource_planner import apply_plan, make_vec
+from model_registry import write_env_config
+from run_registry import record_run
+
+# SB3/torch are imported inside the functions that use them so --help and argument
+# errors come back immediately (see snake.py)
+
+#-- Default A2C hyperparameters ---
+A2C_KWARGS = dict(
+    learning_rate = 7e-4,
+    n_steps = 5,
+    gamma = 0.99,
+    gae_lambda = 1.0,
+    ent_coef = 0.01,
+    vf_coef = 0.5,
+    max_grad_norm = 0.5,
+)
 
 #-- Helper function to create the environment ---
-def make_env(render_mode = None, reward_mode = "length", seed = 7):
-    env = SnakeEnv(render_mode = render_mode, reward_mode = reward_mode, seed = seed)
+def make_env(render_mode = None, reward_mode = "length", seed = 7, reward_weights = None, grid_size = DEFAULT_GRID,
+             frame_stack = 1, **env_kwargs):
+    # env_kwargs: further SnakeEnv options (loop_repeats, start_pool, ...)
+    from stable_baselines3.common.monitor import Monitor
+    env = SnakeEnv(render_mode = render_mode, reward_mode = reward_mode, seed = seed, reward_weights = reward_weights,
+                   grid_size = grid_size, **env_kwargs)
+    if frame_stack > 1:
+        env = FrameHistory(env, frame_stack)
     env = Monitor(env)
     return env
 
+#-- Helper function to create the model ---
+def make_model(env, seed = 7, logdir = "./tensorboard_logs/", verbose = 1, policy = "mlp", obs_buffer = "uint8",
+               **overrides):
+    from stable_baselines3 import A2C
+    from buffers import OBS_BUFFERS, stays_channels_last
+    kwargs = {**A2C_KWARGS, **overrides}
+    # whether SB3 hands frames over as (H, W, C) rather than transposed (see buffers.py)
+    channels_last = stays_channels_last(env.observation_space)
+    if obs_buffer != "native":
+        # rollout buffer frame storage (see buffers.py)
+        kwargs.setdefault("rollout_buffer_class", OBS_BUFFERS[obs_buffer])
+        if obs_buffer == "packed":
+            kwargs.setdefault("rollout_buffer_kwargs", {"channels_last": channels_last})
+    if policy != "mlp":
+        # feature extractor from policies.py instead of SB3's flatten
+        from policies import policy_kwargs
+        kwargs["policy_kwargs"] = {**policy_kwargs(policy, channels_last), **kwargs.get("policy_kwargs", {})}
+    return A2C(
+        policy = "MlpPolicy",
+        env = env,
+        verbose = verbose,
+        seed = seed,
+        tensorboard_log = logdir,
+        **kwargs,
+    )
+
 #-- Main function to train the entry point ---
-def main():
+def main(argv = None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--timesteps", type = int, default = 200_000)
     parser.add_argument("--reward_mode", type = str, default="length", choices= ["length", "survival"])
     parser.add_argument("--seed", type = int, default = 7)
+    parser.add_argument("--policy", type = str, default = "mlp", choices = ["mlp", "cnn", "pool"],
+                        help = "feature extractor: SB3's flatten MLP, policies.SmallCNN or policies.GlobalPoolCNN")
+    parser.add_argument("--obs_buffer", type = str, default = "uint8", choices = ["native", "uint8", "packed"],
+                        help = "rollout buffer frame storage: SB3's own, uint8, or one byte per cell (slower; for many envs)")
+    parser.add_argument("--frame_stack", type = int, default = 1,
+                        help = "observe the last N frames (frame_history.FrameHistory); 1 = no history")
+    parser.add_argument("--loop_repeats", type = int, default = None,
+                        help = "truncate an episode once a state repeats this often without food (e.g. 4)")
+    parser.add_argument("--stall_steps", type = int, default = None,
+                        help = "truncate an episode after this many steps without food")
+    parser.add_argument("--start_pool", type = str, default = None,
+                        help = "start training episodes from these states (start_states.py); eval keeps the default start")
+    parser.add_argument("--start_prob", type = float, default = 0.5, help = "share of training episodes from --start_pool")
+    parser.add_argument("--path_reward", type = float, default = 0,
+                        help = "length mode: reward per move closer to the food along the shortest path (path_field.py)")
+    parser.add_argument("--grid", type = parse_grid, default = DEFAULT_GRID, help = "board size in cells, e.g. 30x20")
     parser.add_argument("--logdir", type = str, default = "./logs")
     parser.add_argument("--modeldir", type =str, default = "./models")
-    parser.add_argument("--results", type = str, default = "./results/reward_stats.json")
-
-    args = parser.parse_args()
+    parser.add_argument("--runs_db", type = str, default = "./results/runs.sqlite",
+                        help = "run registry the results are appended to (see run_registry.py)")
+    parser.add_argument("--episode_log_dir", type = str, default = "./logs/episodes",
+                        help = "per-episode columnar logs, one folder per run (see episode_log.py)")
+    parser.add_argument("--resources", type = str, default = None,
+                        help = "resource plan (see resource_planner.py); calibrated on first use")
+    parser.add_argument("--async_eval", action = "store_true",
+                        help = "evaluate in a separate process instead of blocking training")
+    parser.add_argument("--eval_ci", type = float, default = None,
+                        help = "adaptive eval: stop once the 95%% CI half width on mean reward is below this")
+    parser.add_argument("--eval_max_episodes", type = int, default = 50)
+
+    args = parser.parse_args(argv)
+    start = {"start_pool": args.start_pool, "start_prob": args.start_prob} if args.start_pool else {}
+    weights = {"reward_weights": {"path_distance": args.path_reward}} if args.path_reward else {}
+
+    from stable_baselines3.common.logger import configure
+    from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback, CallbackList
+    from callbacks import AsyncEvalCallback, AdaptiveEvalCallback, EpisodeLogCallback
     
     os.makedirs(args.logdir, exist_ok = True)
     os.makedirs(args.modeldir, exist_ok = True)
-    os.makedirs(os.path.dirname(args.results), exist_ok = True)
 
-    env = make_env(reward_mode = args.reward_mode, seed = args.seed)
-    eval_env = make_env(reward_mode = args.reward_mode, seed = args.seed + 100)
+    n_envs = 1
+    if args.resources:
+        plan = apply_plan(args.resources, "a2c")
+        n_envs = plan["n_envs"]
+        env = make_vec(n_envs, plan["vec_env"], reward_mode = args.reward_mode, seed = args.seed, grid_size = args.grid,
+                       frame_stack = args.frame_stack, loop_repeats = args.loop_repeats, stall_steps = args.stall_steps,
+                       **start, **weights)
+    else:
+        env = make_env(reward_mode = args.reward_mode, seed = args.seed, grid_size = args.grid,
+                       frame_stack = args.frame_stack, loop_repeats = args.loop_repeats, stall_steps = args.stall_steps,
+                       **start, **weights)
+    eval_env = make_env(reward_mode = args.reward_mode, seed = args.seed + 100, grid_size = args.grid,
+                        frame_stack = args.frame_stack, loop_repeats = args.loop_repeats, stall_steps = args.stall_steps,
+                        **weights)
     
     # --- A2c Model ---
-    model = A2C(
-        policy = "MlpPolicy",
-        env = env,
-        verbose = 1,
-        seed = args.seed,
-        tensorboard_log = "./tensorboard_logs/",
-        learning_rate = 7e-4,
-        n_steps = 5,
-        gamma = 0.99,
-        gae_lambda = 1.0,
-        ent_coef = 0.01,
-        vf_coef = 0.5,
-        max_grad_norm = 0.5,
-    )
+    model = make_model(env, seed = args.seed, policy = args.policy, obs_buffer = args.obs_buffer)
 
     #-- Logger setup ---
     new_logger = configure(args.logdir, ["stdout", "tensorboard"])
@@ -59,25 +135,57 @@ def main():
 
     #-- Callbacks ---
     checkpoint_callback = CheckpointCallback(
-        save_freq = 10000,
+        save_freq = max(10000 // n_envs, 1),
         save_path = "./checkpoints/",
         name_prefix = "snake_a2c",
         save_replay_buffer = True,
         save_vecnormalize = False
     )
 
-    eval_callback = EvalCallback(
-        eval_env,
-        best_model_save_path = args.modeldir,
-        log_path = args.logdir,
-        eval_freq = 5000,
-        deterministic = True,
-        render = False,
-        n_eval_episodes = 5,
-        verbose = 1
-    )
-
-    callback_list = CallbackList([checkpoint_callback, eval_callback])
+    adaptive = None
+    if args.eval_ci is not None:
+        adaptive = dict(target_half_width = args.eval_ci, max_episodes = args.eval_max_episodes)
+
+    if args.async_eval:
+        eval_callback = AsyncEvalCallback(
+            env_kwargs = {"reward_mode": args.reward_mode, "seed": args.seed + 100, "grid_size": args.grid,
+                          "frame_stack": args.frame_stack, "loop_repeats": args.loop_repeats,
+                          "stall_steps": args.stall_steps, **weights},
+            best_model_save_path = args.modeldir,
+            log_path = args.logdir,
+            eval_freq = max(5000 // n_envs, 1),
+            deterministic = True,
+            n_eval_episodes = 5,
+            adaptive = adaptive,
+            verbose = 1
+        )
+    elif adaptive is not None:
+        eval_callback = AdaptiveEvalCallback(
+            eval_env,
+            best_model_save_path = args.modeldir,
+            log_path = args.logdir,
+            eval_freq = max(5000 // n_envs, 1),
+            deterministic = True,
+            verbose = 1,
+            **adaptive
+        )
+    else:
+        eval_callback = EvalCallback(
+            eval_env,
+            best_model_save_path = args.modeldir,
+            log_path = args.logdir,
+            eval_freq = max(5000 // n_envs, 1),
+            deterministic = True,
+            render = False,
+            n_eval_episodes = 5,
+            verbose = 1
+        )
+
+    run_name = f"a2c_{args.reward_mode}_seed{args.seed}_{time.strftime('%Y%m%d-%H%M%S')}"
+    episode_log = os.path.join(args.episode_log_dir, run_name)
+    episode_callback = EpisodeLogCallback(episode_log, meta = {"algo": "a2c", "reward_mode": args.reward_mode,
+                                                               "seed": args.seed, "name": run_name})
+    callback_list = CallbackList([checkpoint_callback, eval_callback, episode_callback])
 
     #-- Training with progress bar---
     print("\n Starting A2C training...")
@@ -91,48 +199,39 @@ def main():
     path = os.path.join(args.modeldir, save_name)   # This is the full path without the path
     model.save(path)                                # Stable Baselines3 will add .zip
     print(f" Saved A2C model to {path}.zip")
+    env_config = {"reward_mode": args.reward_mode, "seed": args.seed, "curriculum": True,
+                  "grid_size": list(args.grid), "frame_stack": args.frame_stack,
+                  "loop_repeats": args.loop_repeats, "stall_steps": args.stall_steps, "path_reward": args.path_reward}
+    write_env_config(path, env_config)
+    if os.path.exists(os.path.join(args.modeldir, "best_model.zip")):
+        write_env_config(os.path.join(args.modeldir, "best_model"), env_config)
 
     #-- Evaluating average reward after training ---
     print("\n Evaluating model performance...")
-    episode_rewards = []
-    obs, _ = eval_env.reset()
-    for ep in range(10): 
-        done, total_reward = False, 0
-        while not done:
-            action, _ = model.predict(obs, deterministic = True)
-            obs, reward, done, truncated, info = eval_env.step(action)
-            total_reward += reward
-            if done or truncated:
-                episode_rewards.append(total_reward)
-                obs, _ = eval_env.reset()
-                break
+    run_episode = gym_episode_runner(model, eval_env, deterministic = True)
+    eval_summary = {}
+    if adaptive is not None:
+        summary = evaluate_adaptive(run_episode, **adaptive)
+        episode_rewards = [r["reward"] for r in summary["rows"]]
+        eval_summary = {"half_width": summary["half_width"], "stop_reason": summary["stop_reason"]}
+        print(f" CI half width {summary['half_width']:.2f} ({summary['stop_reason']})")
+    else:
+        episode_rewards = [run_episode()["reward"] for _ in range(10)]
 
     avg_reward = np.mean(episode_rewards)
-    print(f" Average reward over 10 episodes: {avg_reward:.2f}")
-            
-    #-- Save reward statistics ---
-    results = {}
-    if os.path.exists(args.results):
-        with open(args.results, "r") as f:
-            try:
-                results = json.load(f)
-            except json.JSONDecodeError:
-                results = {}
-
-    # store results under the current reward mode key
-    results[args.reward_mode] = {
-        "average_reward": float(avg_reward),
-        "episodes": len(episode_rewards),
-        "timestamps": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "timesteps": args.timesteps,
-        "train_time_minutes": round(elapsed / 60, 2)
-    }
-
-    with open(args.results, "w") as f:
-        json.dump(results, f, indent = 4)
-
-    print(f" Saved reward results to {args.results}")
-    print(json.dumps(results, indent = 4))
+    print(f" Average reward over {len(episode_rewards)} episodes: {avg_reward:.2f}")
+
+    #-- Append the run to the run registry ---
+    run_id = record_run(
+        "a2c", reward_mode = args.reward_mode, seed = args.seed, timesteps = args.timesteps,
+        wall_clock_s = elapsed, hyperparams = {**A2C_KWARGS, "n_envs": n_envs, "policy": args.policy,
+                       "obs_buffer": args.obs_buffer, "frame_stack": args.frame_stack,
+                       "loop_repeats": args.loop_repeats, "stall_steps": args.stall_steps,
+                       "path_reward": args.path_reward, **start},
+        eval_rewards = episode_rewards, eval_summary = {**eval_summary, "rewards": episode_rewards, "episode_log": episode_log},
+        model_path = path + ".zip", db_path = args.runs_db,
+    )
+    print(f" Recorded run {run_id} in {args.runs_db}")
 
     #-- Close environments ---
     env.close()
@@ -1,90 +1,238 @@
 import argparse
 import os
+import time
 
 import gymnasium as gym
-from stable_baselines3 import PPO
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.logger import configure
-from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback, CallbackList
-from callbacks import TensorboardCallback, RewardBreakdownJSONCallback
 
-from snake_env import SnakeEnv   # <-- Changed this
-
-def make_env(render_mode=None, reward_mode = "length", seed=7):
-    env = SnakeEnv(render_mode=render_mode,reward_mode = reward_mode, seed=seed)  # <-- Updated here, remove reward_mode if SnakeEnv doesn't need it
+from snake_env import SnakeEnv, DEFAULT_GRID, parse_grid   # <-- Changed this
+from frame_history import FrameHistory
+from resource_planner import apply_plan, make_vec
+from model_registry import write_env_config
+from run_registry import record_run
+
+# SB3/torch are imported inside the functions that use them so --help and argument
+# errors come back immediately (see snake.py)
+
+# Default PPO hyperparameters, shared with hpsearch.py
+PPO_KWARGS = dict(
+    n_steps=2048,
+    batch_size=64,
+    gamma=0.995,
+    gae_lambda=0.95,
+    n_epochs=10,
+    learning_rate=0.0003,
+    clip_range=0.2,
+    ent_coef = 0.05,
+    vf_coef = 0.5,
+)
+
+def make_env(render_mode=None, reward_mode = "length", seed=7, reward_weights=None, grid_size=DEFAULT_GRID,
+             frame_stack=1, **env_kwargs):
+    # env_kwargs: further SnakeEnv options (mask_collisions, loop_repeats, start_pool, ...)
+    from stable_baselines3.common.monitor import Monitor
+    env = SnakeEnv(render_mode=render_mode,reward_mode = reward_mode, seed=seed, reward_weights=reward_weights,
+                   grid_size=grid_size, **env_kwargs)  # <-- Updated here, remove reward_mode if SnakeEnv doesn't need it
+    if frame_stack > 1:
+        env = FrameHistory(env, frame_stack)
     env = Monitor(env)
     return env
 
-def main():
+def make_model(env, seed=7, logdir=None, verbose=1, policy="mlp", obs_buffer="uint8", masked=False, **overrides):
+    # overrides replace entries of PPO_KWARGS (e.g. ent_coef from a search trial);
+    # policy picks the feature extractor: mlp, cnn or pool (see policies.py);
+    # obs_buffer how the rollout buffer stores frames: native, uint8 or packed (see buffers.py);
+    # masked trains sb3_contrib's MaskablePPO on the env's action_masks()
+    if masked:
+        try:
+            from sb3_contrib import MaskablePPO as PPO
+        except ImportError as e:
+            raise ImportError("Action masking needs sb3-contrib: pip install sb3-contrib") from e
+    else:
+        from stable_baselines3 import PPO
+    from buffers import OBS_BUFFERS, maskable, stays_channels_last
+    kwargs = {**PPO_KWARGS, **overrides}
+    # whether SB3 hands frames over as (H, W, C) rather than transposed (see buffers.py)
+    channels_last = stays_channels_last(env.observation_space)
+    if obs_buffer != "native":
+        buffer_class = OBS_BUFFERS[obs_buffer]
+        kwargs.setdefault("rollout_buffer_class", maskable(buffer_class) if masked else buffer_class)
+        if obs_buffer == "packed":
+            kwargs.setdefault("rollout_buffer_kwargs", {"channels_last": channels_last})
+    if policy != "mlp":
+        from policies import policy_kwargs
+        kwargs["policy_kwargs"] = {**policy_kwargs(policy, channels_last), **kwargs.get("policy_kwargs", {})}
+    return PPO(
+        policy="MlpPolicy",
+        env=env,
+        verbose=verbose,
+        tensorboard_log=logdir,
+        seed=seed,
+        **kwargs,
+    )
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--timesteps", type=int, default=200_000)
     parser.add_argument("--reward_mode", type=str, default="length", choices=["length", "survival"])
     parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--policy", type=str, default="mlp", choices=["mlp", "cnn", "pool"],
+                        help="feature extractor: SB3's flatten MLP, policies.SmallCNN or policies.GlobalPoolCNN")
+    parser.add_argument("--obs_buffer", type=str, default="uint8", choices=["native", "uint8", "packed"],
+                        help="rollout buffer frame storage: SB3's own, uint8, or one byte per cell (slower; for many envs)")
+    parser.add_argument("--frame_stack", type=int, default=1,
+                        help="observe the last N frames (frame_history.FrameHistory); 1 = no history")
+    parser.add_argument("--action_mask", type=str, default="none", choices=["none", "reverse", "collision"],
+                        help="train MaskablePPO (sb3-contrib) with reversals, or reversals and fatal moves, masked")
+    parser.add_argument("--loop_repeats", type=int, default=None,
+                        help="truncate an episode once a state repeats this often without food (e.g. 4)")
+    parser.add_argument("--stall_steps", type=int, default=None,
+                        help="truncate an episode after this many steps without food")
+    parser.add_argument("--start_pool", type=str, default=None,
+                        help="start training episodes from these states (start_states.py); eval keeps the default start")
+    parser.add_argument("--start_prob", type=float, default=0.5, help="share of training episodes from --start_pool")
+    parser.add_argument("--path_reward", type=float, default=0,
+                        help="length mode: reward per move closer to the food along the shortest path (path_field.py)")
+    parser.add_argument("--grid", type=parse_grid, default=DEFAULT_GRID, help="board size in cells, e.g. 30x20")
     # ... other args
     parser.add_argument("--logdir", type=str, default="./logs")
     parser.add_argument("--modeldir", type=str, default="./models")
-    args = parser.parse_args()
+    parser.add_argument("--runs_db", type=str, default="./results/runs.sqlite",
+                        help="run registry the results are appended to (see run_registry.py)")
+    parser.add_argument("--episode_log_dir", type=str, default="./logs/episodes",
+                        help="per-episode columnar logs, one folder per run (see episode_log.py)")
+    parser.add_argument("--resources", type=str, default=None,
+                        help="resource plan (see resource_planner.py); calibrated on first use")
+    parser.add_argument("--async_eval", action="store_true",
+                        help="evaluate in a separate process instead of blocking training")
+    parser.add_argument("--eval_ci", type=float, default=None,
+                        help="adaptive eval: stop once the 95%% CI half width on mean reward is below this")
+    parser.add_argument("--eval_max_episodes", type=int, default=50)
+    args = parser.parse_args(argv)
+    masked = args.action_mask != "none"
+    mask_collisions = args.action_mask == "collision"
+    detector = {"loop_repeats": args.loop_repeats, "stall_steps": args.stall_steps}
+    start = {"start_pool": args.start_pool, "start_prob": args.start_prob} if args.start_pool else {}
+    weights = {"reward_weights": {"path_distance": args.path_reward}} if args.path_reward else {}
+
+    from stable_baselines3.common.logger import configure
+    from stable_baselines3.common.callbacks import CheckpointCallback, EvalCallback, CallbackList
+    from callbacks import TensorboardCallback, EpisodeLogCallback, AsyncEvalCallback, AdaptiveEvalCallback
 
     os.makedirs(args.logdir, exist_ok=True)
     os.makedirs(args.modeldir, exist_ok=True)
 
-    env = make_env(reward_mode=args.reward_mode, seed=args.seed)
-    eval_env = make_env(reward_mode=args.reward_mode, seed=args.seed + 100)
+    n_envs = 1
+    ppo_overrides = {}
+    if args.resources:
+        plan = apply_plan(args.resources, "ppo")
+        n_envs = plan["n_envs"]
+        env = make_vec(n_envs, plan["vec_env"], reward_mode=args.reward_mode, seed=args.seed, grid_size=args.grid,
+                       frame_stack=args.frame_stack, mask_collisions=mask_collisions, **detector, **start, **weights)
+        # same rollout size per update as the single-env default
+        ppo_overrides["n_steps"] = max(PPO_KWARGS["n_steps"] // n_envs, 1)
+    else:
+        env = make_env(reward_mode=args.reward_mode, seed=args.seed, grid_size=args.grid, frame_stack=args.frame_stack,
+                       mask_collisions=mask_collisions, **detector, **start, **weights)
+    eval_env = make_env(reward_mode=args.reward_mode, seed=args.seed + 100, grid_size=args.grid,
+                        frame_stack=args.frame_stack, mask_collisions=mask_collisions, **detector, **weights)
 
     
-    model = PPO(
-        policy="MlpPolicy",
-        env=env,
-        verbose=1,
-        tensorboard_log=args.logdir,
-        seed=args.seed,
-        n_steps=2048,
-        batch_size=64,
-        gamma=0.995,
-        gae_lambda=0.95,
-        n_epochs=10,
-        learning_rate=0.0003,
-        clip_range=0.2,
-        ent_coef = 0.05,
-        vf_coef = 0.5,
-    )
+    model = make_model(env, seed=args.seed, logdir=args.logdir, policy=args.policy,
+                       obs_buffer=args.obs_buffer, masked=masked, **ppo_overrides)
 
     new_logger = configure(args.logdir, ["stdout", "tensorboard"])
     model.set_logger(new_logger)
 
     checkpoint_callback = CheckpointCallback(
-        save_freq=10000,              # how often (in environment steps) to save
+        save_freq=max(10000 // n_envs, 1),  # how often (in environment steps) to save
         save_path="./checkpoints/",  # folder to store the saved models
         name_prefix="snake_ppo",     # name given to checkpoint files
         save_replay_buffer=True,      # optional, saves replay buffer if available
         save_vecnormalize=True        # optional, saves normalization statistics
     )
 
-    eval_callback = EvalCallback(
-        eval_env,
-        best_model_save_path=args.modeldir,       # Folder to save best model
-        log_path=args.logdir,                     # Where to log info
-        eval_freq=5000,                         # How often to evaluate (e.g. every 10k steps)
-        deterministic=True,                       # Use deterministic actions
-        render=False,                             # Do not render during eval
-        n_eval_episodes=5,                        # Evaluate on 5 episodes for each checkpoint
-        verbose=1
-    )
-
-    json_callback = RewardBreakdownJSONCallback(json_path="./logs/reward_breakdown_log.json")
+    adaptive = None
+    if args.eval_ci is not None:
+        adaptive = dict(target_half_width=args.eval_ci, max_episodes=args.eval_max_episodes)
+
+    if args.async_eval:
+        eval_callback = AsyncEvalCallback(
+            env_kwargs={"reward_mode": args.reward_mode, "seed": args.seed + 100, "grid_size": args.grid,
+                        "frame_stack": args.frame_stack, "mask_collisions": mask_collisions, **detector, **weights},
+            best_model_save_path=args.modeldir,
+            log_path=args.logdir,
+            eval_freq=max(5000 // n_envs, 1),
+            deterministic=True,
+            n_eval_episodes=5,
+            adaptive=adaptive,
+            verbose=1
+        )
+    elif adaptive is not None:
+        eval_callback = AdaptiveEvalCallback(
+            eval_env,
+            best_model_save_path=args.modeldir,
+            log_path=args.logdir,
+            eval_freq=max(5000 // n_envs, 1),
+            deterministic=True,
+            verbose=1,
+            **adaptive
+        )
+    else:
+        if masked:
+            # EvalCallback would let the model pick masked actions
+            from sb3_contrib.common.maskable.callbacks import MaskableEvalCallback as EvalCallback
+        eval_callback = EvalCallback(
+            eval_env,
+            best_model_save_path=args.modeldir,       # Folder to save best model
+            log_path=args.logdir,                     # Where to log info
+            eval_freq=max(5000 // n_envs, 1),       # How often to evaluate (e.g. every 10k steps)
+            deterministic=True,                       # Use deterministic actions
+            render=False,                             # Do not render during eval
+            n_eval_episodes=5,                        # Evaluate on 5 episodes for each checkpoint
+            verbose=1
+        )
+
+    # per-episode reward breakdowns as a columnar log, one directory per run (see analysis.py)
+    run_name = f"ppo_{args.reward_mode}_seed{args.seed}_{time.strftime('%Y%m%d-%H%M%S')}"
+    episode_log = os.path.join(args.episode_log_dir, run_name)
+    episode_callback = EpisodeLogCallback(episode_log, meta={"algo": "ppo", "reward_mode": args.reward_mode,
+                                                             "seed": args.seed, "name": run_name})
     tensorboard_callback = TensorboardCallback()
 
-    all_callbacks = CallbackList([checkpoint_callback, eval_callback, tensorboard_callback, json_callback])
+    all_callbacks = CallbackList([checkpoint_callback, eval_callback, tensorboard_callback, episode_callback])
 
     print(f"TensorBoard logs will be saved to: {args.logdir}")
 
 
+    start_time = time.time()
     model.learn(total_timesteps=args.timesteps, progress_bar=True, callback=all_callbacks)
+    elapsed = time.time() - start_time
 
     save_name = f"ppo_snake_{args.reward_mode}"   # This is the base name
     path = os.path.join(args.modeldir, save_name) # This is the full path **without .zip**
     model.save(path)                              # Stable Baselines3 will add .zip
     print(f"Saved model to {path}.zip")
+    # env config sidecars for model_registry.py (the zip does not record it)
+    env_config = {"reward_mode": args.reward_mode, "seed": args.seed, "curriculum": True,
+                  "grid_size": list(args.grid), "frame_stack": args.frame_stack, "action_mask": args.action_mask,
+                  **detector, "path_reward": args.path_reward}
+    write_env_config(path, env_config)
+    if os.path.exists(os.path.join(args.modeldir, "best_model.zip")):
+        write_env_config(os.path.join(args.modeldir, "best_model"), env_config)
+
+    # the last periodic evaluation stands in for a final one
+    results = getattr(eval_callback, "evaluations_results", None)
+    run_id = record_run(
+        "ppo", reward_mode=args.reward_mode, seed=args.seed, timesteps=args.timesteps,
+        wall_clock_s=elapsed, hyperparams={**PPO_KWARGS, **ppo_overrides, "n_envs": n_envs, "policy": args.policy,
+                     "obs_buffer": args.obs_buffer, "frame_stack": args.frame_stack,
+                     "action_mask": args.action_mask, "path_reward": args.path_reward, **detector, **start},
+        eval_rewards=list(results[-1]) if results else None,
+        eval_summary={"best_mean_reward": eval_callback.best_mean_reward,
+                      "last_mean_reward": eval_callback.last_mean_reward, "episode_log": episode_log},
+        model_path=path + ".zip", db_path=args.runs_db,
+    )
+    print(f"Recorded run {run_id} in {args.runs_db}")
 
 
     env.close()
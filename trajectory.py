@@ -0,0 +1,239 @@
+# Compact trajectory recording for SnakeEnv rollouts.
+#
+# Instead of 1,800-byte observation frames, every step stores the new head cell, the
+# action, an ate-food flag and the reward components (~18 bytes with rewards, ~6
+# without). The food cell is only stored when it changes and the starting body once
+# per episode; any frame can be rebuilt from those.
+#
+# Layout of a store directory:
+#   meta.json                schema + env/grid info
+#   index.npy                one structured row per episode (see INDEX_DTYPE)
+#   chunk_00000/head.npy     (steps, 2) int16     head cell (x, y) after each step
+#               action.npy   (steps,)   uint8
+#               ate.npy      (steps,)   uint8
+#               rewards.npy  (steps, K) float16   reward_breakdown components
+#               food.npy     (events, 2) int16    food cell at reset + after every meal
+#               body.npy     (cells, 2) int16     starting body per episode, head first
+#
+#   env = TrajectoryRecorder(SnakeEnv(), "trajectories/run1")
+#   ...
+#   store = TrajectoryStore("trajectories/run1")
+#   frame = store.episode(12).frame(300)
+import json
+import os
+
+import gymnasium as gym
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("chunk", np.int32),
+    ("step_offset", np.int64),   # first step row inside the chunk
+    ("length", np.int32),
+    ("food_offset", np.int64),   # first food row inside the chunk
+    ("body_offset", np.int64),   # first starting-body row inside the chunk
+    ("body_length", np.int32),
+    ("score", np.int32),
+])
+REWARD_KEYS = ["survival", "death_penalty", "food_eaten", "move_closer", "move_away", "turn_to_food",
+               "straight_penalty", "path_distance", "total"]
+
+
+def _cell(pos):
+    # SnakeEnv positions are already (x, y) grid cells
+    return pos[0], pos[1]
+
+
+def draw_frame(shape, body, food):
+    # Same drawing rules as SnakeEnv._get_obs; body is (n, 2) cells, head first.
+    obs = np.zeros(shape, dtype=np.uint8)
+    rows, cols, _ = shape
+    obs[0, :, :] = [255, 0, 0]
+    obs[-1, :, :] = [255, 0, 0]
+    obs[:, 0, :] = [255, 0, 0]
+    obs[:, -1, :] = [255, 0, 0]
+    for x, y in body[1:]:
+        if 0 <= y < rows and 0 <= x < cols:
+            obs[y, x] = [0, 255, 0]
+    x, y = body[0]
+    if 0 <= y < rows and 0 <= x < cols:
+        obs[y, x] = [0, 0, 255]
+    fx, fy = food
+    if 0 <= fy < rows and 0 <= fx < cols:
+        obs[fy, fx] = [255, 255, 255]
+    return obs
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    def __init__(self, env, path, chunk_steps=1 << 16, record_rewards=True):
+        super().__init__(env)
+        self.path = path
+        self.chunk_steps = chunk_steps
+        self.record_rewards = record_rewards
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "obs_shape": list(env.observation_space.shape),
+                "reward_keys": REWARD_KEYS if record_rewards else [],
+                "env": type(env.unwrapped).__name__,
+                "reward_mode": getattr(env.unwrapped, "reward_mode", None),
+            }, f, indent=2)
+        self._index = []
+        self._chunk = 0
+        self._new_chunk()
+        self._episode = None
+
+    def _new_chunk(self):
+        self._cols = {"head": [], "action": [], "ate": [], "rewards": [], "food": [], "body": []}
+
+    def reset(self, **kwargs):
+        if self._episode is not None:
+            self._end_episode()
+        obs, info = self.env.reset(**kwargs)
+        snake = self.env.unwrapped
+        cols = self._cols
+        self._episode = {
+            "step_offset": len(cols["action"]),
+            "food_offset": len(cols["food"]),
+            "body_offset": len(cols["body"]),
+            "body_length": len(snake.snake_body),
+        }
+        cols["body"].extend(_cell(p) for p in snake.snake_body)
+        cols["food"].append(_cell(snake.food_pos))
+        self._score = snake.score
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        snake = self.env.unwrapped
+        cols = self._cols
+        ate = snake.score != self._score
+        cols["head"].append(_cell(snake.snake_pos))
+        cols["action"].append(int(action))
+        cols["ate"].append(ate)
+        if ate:
+            cols["food"].append(_cell(snake.food_pos))
+        if self.record_rewards:
+            breakdown = info.get("reward_breakdown", {})
+            cols["rewards"].append([breakdown.get(k, 0.0) for k in REWARD_KEYS])
+        self._score = snake.score
+        if terminated or truncated:
+            self._end_episode()
+        return obs, reward, terminated, truncated, info
+
+    def _end_episode(self):
+        ep = self._episode
+        self._episode = None
+        length = len(self._cols["action"]) - ep["step_offset"]
+        if length == 0:
+            # reset without any step: drop the episode's food/body rows again
+            del self._cols["food"][ep["food_offset"]:]
+            del self._cols["body"][ep["body_offset"]:]
+            return
+        score = sum(self._cols["ate"][ep["step_offset"]:])
+        self._index.append((self._chunk, ep["step_offset"], length, ep["food_offset"],
+                            ep["body_offset"], ep["body_length"], score))
+        if len(self._cols["action"]) >= self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        cols = self._cols
+        if not cols["action"]:
+            return
+        chunk_dir = os.path.join(self.path, f"chunk_{self._chunk:05d}")
+        os.makedirs(chunk_dir, exist_ok=True)
+        np.save(os.path.join(chunk_dir, "head.npy"), np.asarray(cols["head"], dtype=np.int16).reshape(-1, 2))
+        np.save(os.path.join(chunk_dir, "action.npy"), np.asarray(cols["action"], dtype=np.uint8))
+        np.save(os.path.join(chunk_dir, "ate.npy"), np.asarray(cols["ate"], dtype=np.uint8))
+        np.save(os.path.join(chunk_dir, "food.npy"), np.asarray(cols["food"], dtype=np.int16).reshape(-1, 2))
+        np.save(os.path.join(chunk_dir, "body.npy"), np.asarray(cols["body"], dtype=np.int16).reshape(-1, 2))
+        if self.record_rewards:
+            rewards = np.asarray(cols["rewards"], dtype=np.float16).reshape(-1, len(REWARD_KEYS))
+            np.save(os.path.join(chunk_dir, "rewards.npy"), rewards)
+        np.save(os.path.join(self.path, "index.npy"), np.array(self._index, dtype=INDEX_DTYPE))
+        self._chunk += 1
+        self._new_chunk()
+
+    def close(self):
+        # an episode cut off by close() is discarded, only finished episodes are indexed
+        ep = self._episode
+        if ep is not None:
+            for key in ("head", "action", "ate", "rewards"):
+                del self._cols[key][ep["step_offset"]:]
+            del self._cols["food"][ep["food_offset"]:]
+            del self._cols["body"][ep["body_offset"]:]
+            self._episode = None
+        self.flush()
+        super().close()
+
+
+class Episode:
+    # Lazy view of one recorded episode; columns are memory-mapped slices.
+    def __init__(self, store, row):
+        chunk = store._chunk_columns(int(row["chunk"]))
+        s, n = int(row["step_offset"]), int(row["length"])
+        self.length = n
+        self.score = int(row["score"])
+        self.heads = chunk["head"][s:s + n]
+        self.actions = chunk["action"][s:s + n]
+        self.ate = chunk["ate"][s:s + n]
+        self.rewards = chunk["rewards"][s:s + n] if "rewards" in chunk else None
+        f = int(row["food_offset"])
+        self.foods = chunk["food"][f:f + 1 + self.score]
+        b = int(row["body_offset"])
+        self.start_body = chunk["body"][b:b + int(row["body_length"])]
+        self.obs_shape = store.obs_shape
+        self._meals = None
+
+    def __len__(self):
+        return self.length
+
+    def body(self, k):
+        # body cells (head first) after step k; k = -1 is the state right after reset
+        if self._meals is None:
+            self._meals = np.cumsum(self.ate, dtype=np.int64)
+        eaten = int(self._meals[k]) if k >= 0 else 0
+        length = len(self.start_body) + eaten
+        heads = self.heads[k::-1] if k >= 0 else self.heads[:0]
+        cells = np.concatenate([heads, self.start_body])[:length]
+        return cells
+
+    def food(self, k):
+        if self._meals is None:
+            self._meals = np.cumsum(self.ate, dtype=np.int64)
+        return self.foods[int(self._meals[k]) if k >= 0 else 0]
+
+    def frame(self, k):
+        return draw_frame(self.obs_shape, self.body(k), self.food(k))
+
+    def __getitem__(self, k):
+        return self.frame(k)
+
+
+class TrajectoryStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.obs_shape = tuple(self.meta["obs_shape"])
+        self.reward_keys = self.meta["reward_keys"]
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        self._chunks = {}
+
+    def _chunk_columns(self, chunk):
+        if chunk not in self._chunks:
+            chunk_dir = os.path.join(self.path, f"chunk_{chunk:05d}")
+            self._chunks[chunk] = {
+                name[:-4]: np.load(os.path.join(chunk_dir, name), mmap_mode="r")
+                for name in os.listdir(chunk_dir) if name.endswith(".npy")
+            }
+        return self._chunks[chunk]
+
+    def __len__(self):
+        return len(self.index)
+
+    def episode(self, i):
+        return Episode(self, self.index[i])
+
+    @property
+    def total_steps(self):
+        return int(self.index["length"].sum())
@@ -1,15 +1,34 @@
 import argparse
-from stable_baselines3 import PPO
 from snake_env import SnakeEnv
 
 
-def main():
+def replay(path, episode):
+    # re-render a recorded episode (eval.py --save_replays); no model or torch needed
+    from replay import ReplayEngine, load_episodes
+
+    records = load_episodes(path)
+    engine = ReplayEngine(records[episode], render_mode="human")
+    engine.env.render()
+    for _ in engine.play():
+        engine.env.render()
+    engine.close()
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model_path", type=str, default="models/ppo_snake_length")
+    parser.add_argument("--model_path", type=str, default="models/ppo_snake_length",
+                        help="SB3 model or a NumPy export ending in .npz")
     parser.add_argument("--fps", type=int, default=60)
-    args = parser.parse_args()
+    parser.add_argument("--replay", type=str, default=None, help="replay file from eval.py --save_replays")
+    parser.add_argument("--episode", type=int, default=0, help="episode index inside the replay file")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        replay(args.replay, args.episode)
+        return
 
-    model = PPO.load(args.model_path)
+    from numpy_policy import load_policy
+    model = load_policy(args.model_path)
 
     env = SnakeEnv(render_mode="human", seed = 6, curriculum=False)
     obs, info = env.reset()
@@ -25,4 +44,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()